@@ -0,0 +1,447 @@
+"""
+Materialised aggregate tables for the analysis pages.
+
+The per-100k infection rate, the per-(inf_type, year) average and the
+per-region 90%-coverage counts used to be recomputed from the raw tables on
+every request (b_level3 even computed the average twice). `flask db materialise`
+stores them in derived tables that the routes read directly:
+
+- agg_infection_rate:  per (inf_type, country, year) cases, population, cases_per_100k
+- agg_infection_avg:   per (inf_type, year) average cases_per_100k
+- agg_coverage_cube:   per (antigen, year, region, phase) countries reporting,
+  countries meeting the 90% target, and plain and population-weighted coverage
+- agg_infection_cube:  per (inf_type, year, region, phase) countries, cases,
+  population and population-weighted cases per 100k
+
+The two cubes also hold the rollups over region and/or economy phase, with
+ALL ('*') in place of the rolled-up dimension, so a GROUP BY region or
+GROUP BY phase view is a lookup. Countries without a Region or Economy row
+are counted under UNASSIGNED instead of being dropped by an inner join.
+
+Triggers on Vaccination, InfectionData, CountryPopulation, Country, Region
+and Economy record which (antigen, year) / (inf_type, year) partitions have
+changed, so a refresh only rebuilds those partitions instead of the whole table.
+"""
+
+import sqlite3
+
+COVERAGE_TARGET = 90
+
+# Cube dimension values for "every region / phase" and "no region / phase"
+ALL = '*'
+UNASSIGNED = 'Unassigned'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agg_infection_rate (
+    inf_type       TEXT (3) NOT NULL,
+    country        TEXT (3) NOT NULL,
+    year           INTEGER  NOT NULL,
+    cases          REAL,
+    population     REAL,
+    cases_per_100k REAL,
+    PRIMARY KEY (inf_type, year, country)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agg_infection_rate_rank
+    ON agg_infection_rate (inf_type, year, cases_per_100k DESC);
+
+CREATE TABLE IF NOT EXISTS agg_infection_avg (
+    inf_type      TEXT (3) NOT NULL,
+    year          INTEGER  NOT NULL,
+    avg_rate      REAL,
+    country_count INTEGER  NOT NULL,
+    PRIMARY KEY (inf_type, year)
+);
+
+CREATE TABLE IF NOT EXISTS agg_coverage_cube (
+    antigen               TEXT (6)  NOT NULL,
+    year                  INTEGER   NOT NULL,
+    region                TEXT (50) NOT NULL,
+    phase                 TEXT (20) NOT NULL,
+    country_count         INTEGER   NOT NULL,
+    target_met            INTEGER   NOT NULL,
+    coverage_sum          REAL,
+    population            REAL,
+    weighted_coverage_sum REAL,
+    PRIMARY KEY (antigen, year, region, phase)
+);
+
+CREATE TABLE IF NOT EXISTS agg_infection_cube (
+    inf_type      TEXT (3)  NOT NULL,
+    year          INTEGER   NOT NULL,
+    region        TEXT (50) NOT NULL,
+    phase         TEXT (20) NOT NULL,
+    country_count INTEGER   NOT NULL,
+    total_cases   REAL,
+    rated_cases   REAL,
+    population    REAL,
+    PRIMARY KEY (inf_type, year, region, phase)
+);
+
+-- Partitions waiting to be rebuilt
+CREATE TABLE IF NOT EXISTS agg_dirty_infection (
+    inf_type TEXT (3) NOT NULL,
+    year     INTEGER  NOT NULL,
+    PRIMARY KEY (inf_type, year)
+);
+
+CREATE TABLE IF NOT EXISTS agg_dirty_coverage (
+    antigen TEXT (6) NOT NULL,
+    year    INTEGER  NOT NULL,
+    PRIMARY KEY (antigen, year)
+);
+"""
+
+# Triggers that mark partitions dirty whenever the source rows change
+TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS agg_infectiondata_insert AFTER INSERT ON InfectionData
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection VALUES (NEW.inf_type, NEW.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_infectiondata_update AFTER UPDATE ON InfectionData
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection VALUES (OLD.inf_type, OLD.year);
+    INSERT OR IGNORE INTO agg_dirty_infection VALUES (NEW.inf_type, NEW.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_infectiondata_delete AFTER DELETE ON InfectionData
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection VALUES (OLD.inf_type, OLD.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_population_insert AFTER INSERT ON CountryPopulation
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT inf_type, year FROM InfectionData
+        WHERE country = NEW.country AND year = NEW.year;
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT antigen, year FROM Vaccination
+        WHERE country = NEW.country AND year = NEW.year;
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_population_update AFTER UPDATE ON CountryPopulation
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT inf_type, year FROM InfectionData
+        WHERE (country = OLD.country AND year = OLD.year)
+           OR (country = NEW.country AND year = NEW.year);
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT antigen, year FROM Vaccination
+        WHERE (country = OLD.country AND year = OLD.year)
+           OR (country = NEW.country AND year = NEW.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_population_delete AFTER DELETE ON CountryPopulation
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT inf_type, year FROM InfectionData
+        WHERE country = OLD.country AND year = OLD.year;
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT antigen, year FROM Vaccination
+        WHERE country = OLD.country AND year = OLD.year;
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_vaccination_insert AFTER INSERT ON Vaccination
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage VALUES (NEW.antigen, NEW.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_vaccination_update AFTER UPDATE ON Vaccination
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage VALUES (OLD.antigen, OLD.year);
+    INSERT OR IGNORE INTO agg_dirty_coverage VALUES (NEW.antigen, NEW.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_vaccination_delete AFTER DELETE ON Vaccination
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage VALUES (OLD.antigen, OLD.year);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_country_insert AFTER INSERT ON Country
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT DISTINCT antigen, year FROM Vaccination WHERE country = NEW.CountryID;
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT DISTINCT inf_type, year FROM InfectionData WHERE country = NEW.CountryID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_country_update AFTER UPDATE OF CountryID, region, economy ON Country
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT DISTINCT antigen, year FROM Vaccination WHERE country IN (OLD.CountryID, NEW.CountryID);
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT DISTINCT inf_type, year FROM InfectionData WHERE country IN (OLD.CountryID, NEW.CountryID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agg_country_delete AFTER DELETE ON Country
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT DISTINCT antigen, year FROM Vaccination WHERE country = OLD.CountryID;
+    INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT DISTINCT inf_type, year FROM InfectionData WHERE country = OLD.CountryID;
+END;
+"""
+
+# Region and Economy rows name a cube dimension for many countries at once,
+# so any change to them marks every partition dirty
+for _table in ('Region', 'Economy'):
+    for _event in ('INSERT', 'UPDATE', 'DELETE'):
+        TRIGGERS += f"""
+CREATE TRIGGER IF NOT EXISTS agg_{_table.lower()}_{_event.lower()} AFTER {_event} ON {_table}
+BEGIN
+    INSERT OR IGNORE INTO agg_dirty_coverage SELECT DISTINCT antigen, year FROM Vaccination;
+    INSERT OR IGNORE INTO agg_dirty_infection SELECT DISTINCT inf_type, year FROM InfectionData;
+END;
+"""
+
+AGGREGATE_TABLES = ('agg_infection_rate', 'agg_infection_avg', 'agg_coverage_cube',
+                    'agg_infection_cube')
+
+
+# Cube rows: one row per (key, year, region, phase) plus the ALL rollups
+
+def _rollup(base, key, measures):
+    """
+    SELECT over the `base` CTE with `measures` aggregated for each grouping
+    set of (region, phase), ALL standing in for a rolled-up dimension
+    (SQLite has no GROUPING SETS).
+    """
+    selects = []
+    for region, phase in (('region', 'phase'), ('region', None), (None, 'phase'), (None, None)):
+        group_by = ', '.join(['key', 'year'] + [d for d in (region, phase) if d])
+        selects.append(f"""
+        SELECT key as {key}, year, {region or repr(ALL)} as region, {phase or repr(ALL)} as phase, {measures}
+        FROM base
+        GROUP BY {group_by}""")
+    return f"WITH base AS ({base})" + "\n        UNION ALL".join(selects)
+
+
+def coverage_cube_sql(where):
+    """
+    Coverage cube rows for the Vaccination rows matching `where` (one row
+    per country; blank coverage values are skipped). Population comes from
+    CountryPopulation for the same year; countries without one are left out
+    of the weighted figures only.
+    """
+    base = f"""
+        SELECT
+            v.antigen as key,
+            v.year,
+            COALESCE(r.region, '{UNASSIGNED}') as region,
+            COALESCE(e.phase, '{UNASSIGNED}') as phase,
+            v.coverage,
+            cp.population
+        FROM Vaccination v
+        INNER JOIN Country c ON v.country = c.CountryID
+        LEFT JOIN Region r ON c.region = r.RegionID
+        LEFT JOIN Economy e ON c.economy = e.economyID
+        LEFT JOIN CountryPopulation cp
+            ON v.country = cp.country AND v.year = cp.year AND cp.population > 0
+        WHERE typeof(v.coverage) IN ('integer', 'real') AND {where}
+    """
+    return _rollup(base, 'antigen', f"""
+            COUNT(*) as country_count,
+            SUM(coverage >= {COVERAGE_TARGET}) as target_met,
+            SUM(coverage) as coverage_sum,
+            SUM(population) as population,
+            SUM(coverage * population) as weighted_coverage_sum""")
+
+
+def infection_cube_sql(where):
+    """
+    Infection cube rows for the InfectionData rows matching `where`.
+    total_cases covers every country; rated_cases and population only the
+    countries with a population that year, so rated_cases * 100000 /
+    population is the population-weighted rate.
+    """
+    base = f"""
+        SELECT
+            id.inf_type as key,
+            id.year,
+            COALESCE(r.region, '{UNASSIGNED}') as region,
+            COALESCE(e.phase, '{UNASSIGNED}') as phase,
+            id.cases,
+            cp.population
+        FROM InfectionData id
+        INNER JOIN Country c ON id.country = c.CountryID
+        LEFT JOIN Region r ON c.region = r.RegionID
+        LEFT JOIN Economy e ON c.economy = e.economyID
+        LEFT JOIN CountryPopulation cp
+            ON id.country = cp.country AND id.year = cp.year AND cp.population > 0
+        WHERE {where}
+    """
+    return _rollup(base, 'inf_type', """
+            COUNT(*) as country_count,
+            SUM(cases) as total_cases,
+            SUM(CASE WHEN population IS NOT NULL THEN cases END) as rated_cases,
+            SUM(population) as population""")
+
+
+# Partition rebuild statements (params: partition key)
+
+_REBUILD_INFECTION_RATE = """
+    INSERT INTO agg_infection_rate (inf_type, country, year, cases, population, cases_per_100k)
+    SELECT
+        id.inf_type,
+        id.country,
+        id.year,
+        id.cases,
+        cp.population,
+        (id.cases * 100000.0 / cp.population)
+    FROM InfectionData id
+    INNER JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    WHERE id.inf_type = ? AND id.year = ?
+"""
+
+_REBUILD_INFECTION_AVG = """
+    INSERT INTO agg_infection_avg (inf_type, year, avg_rate, country_count)
+    SELECT inf_type, year, AVG(cases_per_100k), COUNT(*)
+    FROM agg_infection_rate
+    WHERE inf_type = ? AND year = ?
+    GROUP BY inf_type, year
+"""
+
+_REBUILD_COVERAGE_CUBE = f"""
+    INSERT INTO agg_coverage_cube (antigen, year, region, phase, country_count, target_met,
+                                   coverage_sum, population, weighted_coverage_sum)
+    {coverage_cube_sql('v.antigen = ? AND v.year = ?')}
+"""
+
+_REBUILD_INFECTION_CUBE = f"""
+    INSERT INTO agg_infection_cube (inf_type, year, region, phase, country_count, total_cases,
+                                    rated_cases, population)
+    {infection_cube_sql('id.inf_type = ? AND id.year = ?')}
+"""
+
+
+def _statements(script):
+    """Split a script of complete statements (trigger bodies included) for conn.execute()."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+    if statement.strip():
+        yield statement.strip()
+
+
+def dirty_partitions(conn):
+    """
+    Partitions the triggers have marked as changed since the last refresh,
+    as ingest-style ('coverage' | 'infection', key, year) tags. Their agg_
+    rows are stale until refresh() runs.
+    """
+    return ({('coverage', antigen, str(year))
+             for antigen, year in conn.execute("SELECT antigen, year FROM agg_dirty_coverage")}
+            | {('infection', inf_type, str(year))
+               for inf_type, year in conn.execute("SELECT inf_type, year FROM agg_dirty_infection")})
+
+
+def is_materialised(conn):
+    """True if every aggregate table exists in the database."""
+    placeholders = ', '.join('?' for _ in AGGREGATE_TABLES)
+    count = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+        AGGREGATE_TABLES).fetchone()[0]
+    return count == len(AGGREGATE_TABLES)
+
+
+def rebuild_infection_partition(conn, inf_type, year):
+    """Recompute the per-100k rates, average and cube rows for one (inf_type, year)."""
+    conn.execute("DELETE FROM agg_infection_rate WHERE inf_type = ? AND year = ?", (inf_type, year))
+    conn.execute("DELETE FROM agg_infection_avg WHERE inf_type = ? AND year = ?", (inf_type, year))
+    conn.execute("DELETE FROM agg_infection_cube WHERE inf_type = ? AND year = ?", (inf_type, year))
+    conn.execute(_REBUILD_INFECTION_RATE, (inf_type, year))
+    conn.execute(_REBUILD_INFECTION_AVG, (inf_type, year))
+    conn.execute(_REBUILD_INFECTION_CUBE, (inf_type, year))
+
+
+def rebuild_coverage_partition(conn, antigen, year):
+    """Recompute the coverage cube rows for one (antigen, year)."""
+    conn.execute("DELETE FROM agg_coverage_cube WHERE antigen = ? AND year = ?", (antigen, year))
+    conn.execute(_REBUILD_COVERAGE_CUBE, (antigen, year))
+
+
+def mark_all_dirty(conn):
+    """Queue every partition for a rebuild (used for the first/full build)."""
+    conn.execute("""
+        INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT DISTINCT inf_type, year FROM InfectionData
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT DISTINCT antigen, year FROM Vaccination
+    """)
+    # Partitions that no longer have any source rows still need clearing
+    conn.execute("""
+        INSERT OR IGNORE INTO agg_dirty_infection
+        SELECT DISTINCT inf_type, year FROM agg_infection_avg
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO agg_dirty_coverage
+        SELECT DISTINCT antigen, year FROM agg_coverage_cube
+    """)
+
+
+def _rebuild_dirty(conn):
+    """refresh() without the transaction handling."""
+    infection = conn.execute("SELECT inf_type, year FROM agg_dirty_infection").fetchall()
+    coverage = conn.execute("SELECT antigen, year FROM agg_dirty_coverage").fetchall()
+
+    for inf_type, year in infection:
+        rebuild_infection_partition(conn, inf_type, year)
+    for antigen, year in coverage:
+        rebuild_coverage_partition(conn, antigen, year)
+
+    conn.execute("DELETE FROM agg_dirty_infection")
+    conn.execute("DELETE FROM agg_dirty_coverage")
+    return [tuple(row) for row in infection], [tuple(row) for row in coverage]
+
+
+def refresh(conn):
+    """
+    Rebuild every dirty partition in one transaction.
+    Returns (infection partitions rebuilt, coverage partitions rebuilt) as lists
+    of (key, year) tuples so callers can invalidate only what changed.
+    """
+    with conn:
+        return _rebuild_dirty(conn)
+
+
+def materialise(db_path, full=False):
+    """
+    Create the aggregate tables and triggers if needed, then rebuild.
+    The first run (or full=True) rebuilds every partition; later runs only
+    rebuild partitions the triggers have marked dirty.
+    Everything (schema, triggers and the rebuild) happens in one transaction,
+    so a failure leaves the database as it was.
+    Returns the result of refresh().
+    """
+    # Autocommit mode: the transaction is opened and committed explicitly, since
+    # sqlite3 only opens one implicitly before DML and executescript() commits
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first_build = not is_materialised(conn)
+            # Recreate the triggers so changed definitions replace older ones
+            triggers = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'agg!_%' ESCAPE '!'"
+            ).fetchall()
+            for (name,) in triggers:
+                conn.execute(f"DROP TRIGGER {name}")
+            for statement in _statements(SCHEMA + TRIGGERS):
+                conn.execute(statement)
+            if first_build or full:
+                mark_all_dirty(conn)
+            result = _rebuild_dirty(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+    finally:
+        conn.close()
@@ -0,0 +1,141 @@
+"""
+Analysis backends used by the coverage and infection routes.
+
+Each backend answers the same set of questions and returns rows as named
+tuples with the same column names, so the routes and templates don't care
+which one is in use:
+
+- SqliteBackend: runs the SQL in queries.py (reading the materialised
+  aggregate tables when they have been built)
+- ColumnarBackend (columnar.py): answers from NumPy arrays held in memory
+
+The backend is picked with the ANALYTICS_BACKEND setting ('sqlite' or 'numpy').
+"""
+
+import aggregates
+import ingest
+import queries
+from result_cache import compact_rows
+
+
+def run_query(cursor, sql, params=()):
+    """
+    Runs a query and returns the rows as compact named tuples for caching.
+    """
+    cursor.execute(sql, params)
+    return compact_rows(cursor)
+
+
+def _limit(limit):
+    """LIMIT parameter: SQLite treats a negative LIMIT as no limit."""
+    return -1 if limit is None else limit
+
+
+class SqliteBackend:
+    """
+    Answers the analysis queries with SQL against immunisation.db.
+    Every method takes an open connection as its first argument.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, data_version, use_aggregates=True):
+        self._data_version = data_version
+        self.use_aggregates = use_aggregates
+        # Whether the materialised aggregate tables exist, and which of their
+        # partitions are stale, re-checked when the DB changes
+        self._aggregates_version = None
+        self._aggregates_ready = False
+        self._dirty = set()
+
+    def aggregates_ready(self, conn, partitions=None):
+        """
+        True if queries should read from the aggregate tables built by
+        `flask db materialise` instead of computing the aggregates on the fly.
+
+        A write since the last refresh leaves its partitions marked dirty by
+        the triggers, and their agg_ rows stale: answers touching any of
+        `partitions` (ingest.coverage_partitions() etc.) then come from the
+        raw tables. Without partitions, any dirty partition counts.
+        """
+        if not self.use_aggregates:
+            return False
+        version = self._data_version.current()
+        if self._aggregates_version != version:
+            ready = aggregates.is_materialised(conn)
+            self._dirty = aggregates.dirty_partitions(conn) if ready else set()
+            self._aggregates_ready = ready
+            self._aggregates_version = version
+        if not self._aggregates_ready:
+            return False
+        if partitions is None:
+            return not self._dirty
+        return not self._dirty.intersection(partitions)
+
+    # A-Level 2
+
+    def a2_countries(self, conn, year, antigen):
+        """Countries with >= 90% coverage for one year/antigen."""
+        return run_query(conn.cursor(), queries.A2_COUNTRIES, (year, antigen))
+
+    def a2_regions(self, conn, year, antigen):
+        """Count of countries meeting the 90% target per region."""
+        # A lookup in the coverage cube when it has been built
+        ready = self.aggregates_ready(conn, ingest.coverage_partitions([antigen], [year]))
+        sql = queries.A2_REGIONS_AGG if ready else queries.A2_REGIONS
+        return run_query(conn.cursor(), sql, (year, antigen))
+
+    # A-Level 3
+
+    def a3_improvement(self, conn, start_year, end_year, antigen, limit):
+        """Countries with the biggest coverage increase between two years (limit None = all)."""
+        return run_query(conn.cursor(), queries.A3_IMPROVEMENT,
+                         (start_year, end_year, start_year, end_year, antigen, _limit(limit)))
+
+    # Batch comparisons (comparison.py pivots these rows)
+
+    def a2_countries_batch(self, conn, years, antigens):
+        """Countries with >= 90% coverage for every selected year/antigen, in one query."""
+        sql = queries.A2_COUNTRIES_BATCH.format(years=queries.in_list(years),
+                                                antigens=queries.in_list(antigens))
+        return run_query(conn.cursor(), sql, tuple(years) + tuple(antigens))
+
+    def a3_coverage_series(self, conn, years, antigens):
+        """Coverage per country for every selected year/antigen, in one query."""
+        sql = queries.A3_COVERAGE_SERIES.format(years=queries.in_list(years),
+                                                antigens=queries.in_list(antigens))
+        return run_query(conn.cursor(), sql, tuple(years) + tuple(antigens))
+
+    # B-Level 2
+
+    def b2_detailed(self, conn, economy, inf_type, year):
+        """Cases per 100k for every country in one economy phase."""
+        # Read precomputed per-100k rates when they have been built
+        ready = self.aggregates_ready(conn, ingest.infection_partitions([inf_type], [year]))
+        sql = queries.B2_DETAILED_AGG if ready else queries.B2_DETAILED
+        return run_query(conn.cursor(), sql, (economy, inf_type, year))
+
+    def b2_summary(self, conn, inf_type, year):
+        """Total cases and country count per economy phase."""
+        # A lookup in the infection cube when it has been built
+        ready = self.aggregates_ready(conn, ingest.infection_partitions([inf_type], [year]))
+        sql = queries.B2_SUMMARY_AGG if ready else queries.B2_SUMMARY
+        return run_query(conn.cursor(), sql, (inf_type, year))
+
+    # B-Level 3
+
+    def b3_average(self, conn, inf_type, year):
+        """Average cases per 100k (None if there is no data)."""
+        ready = self.aggregates_ready(conn, ingest.infection_partitions([inf_type], [year]))
+        sql = queries.B3_AVERAGE_AGG if ready else queries.B3_AVERAGE
+        rows = run_query(conn.cursor(), sql, (inf_type, year))
+        return rows[0].avg_rate if rows else None
+
+    def b3_above_average(self, conn, inf_type, year, limit):
+        """Countries whose cases per 100k exceed the average, highest first (limit None = all)."""
+        # With the aggregates built the average is joined in rather
+        # than recomputed as a correlated subquery
+        if self.aggregates_ready(conn, ingest.infection_partitions([inf_type], [year])):
+            return run_query(conn.cursor(), queries.B3_ABOVE_AVERAGE_AGG, (inf_type, year, _limit(limit)))
+        return run_query(conn.cursor(), queries.B3_ABOVE_AVERAGE,
+                         (inf_type, year, inf_type, year, _limit(limit)))
@@ -0,0 +1,938 @@
+"""
+JSON / CSV API mirroring the analysis pages.
+
+Every endpoint lives under /api/v1 and supports:
+- format=json (default) or format=csv (or an Accept: text/csv header)
+- limit / offset for pagination (limit defaults to 100, max 10000; limit=0 means all rows)
+- fields=a,b,c to return only some columns
+
+Rows are streamed from the cursor in chunks with a generator rather than built
+with fetchall(), so large results (e.g. every year x antigen) don't have to be
+held in memory on either side.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+import aggregates
+import ingest
+import leaderboard
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+CHUNK_SIZE = 500
+
+
+class ApiError(Exception):
+    """Bad request parameters; turned into a 400 JSON response."""
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(e):
+    return jsonify({'error': str(e)}), 400
+
+
+@api.errorhandler(sqlite3.Error)
+def handle_db_error(e):
+    return jsonify({'error': f"Database query error: {e}"}), 500
+
+
+# Trend endpoints
+#
+# The series for one antigen / infection type is read once and everything
+# else comes from window functions over it (partitioned by country, ordered
+# by year) instead of a self-join per pair of years. Frames are RANGEs of
+# years, so a missing year shortens a window rather than shifting it.
+# The window size is bound as :window.
+
+def _trend_sql(series):
+    """
+    CTEs `series` (the given SELECT of country, country_name, key, year,
+    value) and `trend` (series plus rolling_avg, yoy_change and
+    window_gain / window_drop for each year).
+    """
+    return f"""
+        WITH series AS ({series}),
+        trend AS (
+            SELECT
+                series.*,
+                AVG(value) OVER (PARTITION BY country ORDER BY year
+                    RANGE BETWEEN :window - 1 PRECEDING AND CURRENT ROW) as rolling_avg,
+                value - FIRST_VALUE(value) OVER (PARTITION BY country ORDER BY year
+                    RANGE BETWEEN 1 PRECEDING AND 1 PRECEDING) as yoy_change,
+                value - MIN(value) OVER (PARTITION BY country ORDER BY year
+                    RANGE BETWEEN :window PRECEDING AND 1 PRECEDING) as window_gain,
+                MAX(value) OVER (PARTITION BY country ORDER BY year
+                    RANGE BETWEEN :window PRECEDING AND 1 PRECEDING) - value as window_drop
+            FROM series
+        )
+    """
+
+
+def _trend_summary_sql(series, best):
+    """
+    _trend_sql() plus a `summary` CTE with one row per country: first/last
+    year and value, compound annual change, the largest year-over-year rise
+    and fall, and the best `best` ('window_gain' or 'window_drop') with
+    the year each happened in.
+    """
+    return _trend_sql(series) + f""",
+        ranked AS (
+            SELECT
+                trend.*,
+                FIRST_VALUE(value) OVER whole as first_value,
+                LAST_VALUE(value) OVER whole as last_value,
+                ROW_NUMBER() OVER (PARTITION BY country ORDER BY yoy_change IS NULL, yoy_change DESC) as rise_rank,
+                COUNT(yoy_change) OVER whole as changes,
+                ROW_NUMBER() OVER (PARTITION BY country ORDER BY {best} IS NULL, {best} DESC) as best_rank
+            FROM trend
+            WINDOW whole AS (PARTITION BY country ORDER BY year
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        ),
+        summary AS (
+            SELECT
+                country,
+                country_name,
+                key,
+                MIN(year) as first_year,
+                MAX(year) as last_year,
+                COUNT(*) as years_reported,
+                MAX(first_value) as first_value,
+                MAX(last_value) as last_value,
+                MAX(CASE WHEN rise_rank = 1 THEN yoy_change END) as largest_rise,
+                MAX(CASE WHEN rise_rank = 1 AND yoy_change IS NOT NULL THEN year END) as largest_rise_year,
+                MIN(yoy_change) as largest_fall,
+                MAX(CASE WHEN rise_rank = changes THEN year END) as largest_fall_year,
+                MAX(CASE WHEN best_rank = 1 THEN {best} END) as best,
+                MAX(CASE WHEN best_rank = 1 AND {best} IS NOT NULL THEN year END) as best_year
+            FROM ranked
+            GROUP BY country
+        )
+    """
+
+
+# Compound annual change in percent between the first and last reported year
+_ANNUAL_CHANGE = """
+    CASE WHEN first_value > 0 AND last_value > 0 AND last_year > first_year
+         THEN ROUND((pow(last_value / first_value, 1.0 / (last_year - first_year)) - 1) * 100, 2)
+    END
+"""
+
+_COVERAGE_SERIES = """
+    SELECT v.country, c.name as country_name, v.antigen as key, v.year, v.coverage as value
+    FROM Vaccination v
+    INNER JOIN Country c ON v.country = c.CountryID
+    WHERE v.antigen = :antigen AND typeof(v.coverage) IN ('integer', 'real')
+      AND (:country IS NULL OR v.country = :country)
+"""
+
+_INFECTION_SERIES = """
+    SELECT
+        id.country,
+        c.name as country_name,
+        id.inf_type as key,
+        id.year,
+        (id.cases * 100000.0 / cp.population) as value,
+        id.cases,
+        cp.population
+    FROM InfectionData id
+    INNER JOIN Country c ON id.country = c.CountryID
+    INNER JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    WHERE id.inf_type = :infection_type AND cp.population > 0
+      AND (:country IS NULL OR id.country = :country)
+"""
+
+COVERAGE_TREND_SUMMARY_COLUMNS = """
+    SELECT
+        country as country_code,
+        country_name,
+        key as antigen,
+        first_year,
+        last_year,
+        years_reported,
+        first_value as first_coverage,
+        last_value as last_coverage,
+        ROUND(last_value - first_value, 2) as total_change,
+        {annual_change} as annual_change_pct,
+        ROUND(largest_rise, 2) as largest_rise,
+        largest_rise_year,
+        ROUND(largest_fall, 2) as largest_fall,
+        largest_fall_year,
+        ROUND(best, 2) as best_window_gain,
+        best_year as best_window_end_year
+    FROM summary
+""".format(annual_change=_ANNUAL_CHANGE)
+
+
+def _window_size(value):
+    """Window length in years (1-25)."""
+    value = int(value)
+    if not 1 <= value <= 25:
+        raise ValueError(value)
+    return value
+
+
+# Region / economy rollups
+#
+# Read from the agg_*_cube tables once `flask db materialise` has built them
+# (see 'materialised' below), otherwise computed from the same SQL the cubes
+# are built with. region / phase are '*' on the rollup rows.
+
+def _coverage_rollup_sql(source):
+    return f"""
+        SELECT
+            antigen,
+            year,
+            region,
+            phase as economic_phase,
+            country_count,
+            target_met,
+            ROUND(coverage_sum / country_count, 2) as avg_coverage,
+            ROUND(weighted_coverage_sum / population, 2) as weighted_coverage,
+            population
+        FROM {source}
+        WHERE 1 = 1
+    """
+
+
+def _infection_rollup_sql(source):
+    return f"""
+        SELECT
+            inf_type as infection_type,
+            year,
+            region,
+            phase as economic_phase,
+            country_count,
+            total_cases,
+            population,
+            ROUND(rated_cases * 100000.0 / population, 2) as cases_per_100k
+        FROM {source}
+        WHERE 1 = 1
+    """
+
+
+# Endpoint definitions
+#
+# Each endpoint has a base SQL statement (without ORDER BY/LIMIT), the filters
+# it accepts as (query param, SQL expression, converter, required), its ORDER BY,
+# and the columns it returns (used to validate `fields`). Keys under
+# 'materialised' replace these once the aggregate tables have been built.
+
+ENDPOINTS = {
+    # A-Level 2: coverage by year / antigen
+    'coverage': {
+        'sql': """
+            SELECT
+                v.antigen,
+                v.year,
+                c.CountryID as country_code,
+                c.name as country_name,
+                COALESCE(r.region, 'Unassigned') as region,
+                v.coverage
+            FROM Vaccination v
+            INNER JOIN Country c ON v.country = c.CountryID
+            LEFT JOIN Region r ON c.region = r.RegionID
+            WHERE typeof(v.coverage) IN ('integer', 'real')
+        """,
+        'filters': [
+            ('year', 'v.year = ?', int, False),
+            ('antigen', 'v.antigen = ?', str, False),
+            ('country', 'v.country = ?', str, False),
+            ('min_coverage', 'v.coverage >= ?', float, False),
+        ],
+        'order_by': 'v.year, v.antigen, v.coverage DESC, c.name',
+        'columns': ('antigen', 'year', 'country_code', 'country_name', 'region', 'coverage'),
+    },
+    # A-Level 2 Table 2: countries meeting the 90% target per region
+    'coverage/regions': {
+        'sql': """
+            SELECT
+                v.antigen,
+                v.year,
+                COALESCE(r.region, 'Unassigned') as region,
+                COUNT(DISTINCT c.CountryID) as country_count
+            FROM Vaccination v
+            INNER JOIN Country c ON v.country = c.CountryID
+            LEFT JOIN Region r ON c.region = r.RegionID
+            WHERE typeof(v.coverage) IN ('integer', 'real') AND v.coverage >= 90
+        """,
+        'filters': [
+            ('year', 'v.year = ?', int, False),
+            ('antigen', 'v.antigen = ?', str, False),
+        ],
+        'group_by': 'v.antigen, v.year, COALESCE(r.region, \'Unassigned\')',
+        'order_by': 'v.year, v.antigen, country_count DESC, region',
+        'columns': ('antigen', 'year', 'region', 'country_count'),
+        'materialised': {
+            'sql': """
+                SELECT antigen, year, region, target_met as country_count
+                FROM agg_coverage_cube
+                WHERE phase = '*' AND region != '*' AND target_met > 0
+            """,
+            'filters': [
+                ('year', 'year = ?', int, False),
+                ('antigen', 'antigen = ?', str, False),
+            ],
+            'group_by': None,
+            'order_by': 'year, antigen, country_count DESC, region',
+        },
+    },
+    # Coverage cube: countries, target met, plain and population-weighted coverage
+    'rollup/coverage': {
+        'sql': _coverage_rollup_sql(f"({aggregates.coverage_cube_sql('1 = 1')})"),
+        'filters': [
+            ('antigen', 'antigen = ?', str, False),
+            ('year', 'year = ?', int, False),
+            ('region', 'region = ?', str, False),
+            ('economy', 'phase = ?', str, False),
+        ],
+        'order_by': 'year, antigen, region, economic_phase',
+        'columns': ('antigen', 'year', 'region', 'economic_phase', 'country_count', 'target_met',
+                    'avg_coverage', 'weighted_coverage', 'population'),
+        'materialised': {'sql': _coverage_rollup_sql('agg_coverage_cube')},
+    },
+    # A-Level 3: improvement between two years, ranked
+    'improvement': {
+        'sql': """
+            SELECT
+                c.CountryID as country_code,
+                c.name as country_name,
+                (v2.coverage - v1.coverage) as rate_increase,
+                v1.coverage as start_coverage,
+                v2.coverage as end_coverage,
+                v1.year as start_year,
+                v2.year as end_year
+            FROM Vaccination v1
+            INNER JOIN Vaccination v2
+                ON v1.country = v2.country
+                AND v1.antigen = v2.antigen
+            INNER JOIN Country c ON v1.country = c.CountryID
+            WHERE typeof(v1.coverage) IN ('integer', 'real')
+                AND typeof(v2.coverage) IN ('integer', 'real')
+                AND v2.coverage > v1.coverage
+        """,
+        'filters': [
+            ('start_year', 'v1.year = ?', int, True),
+            ('end_year', 'v2.year = ?', int, True),
+            ('antigen', 'v1.antigen = ?', str, True),
+        ],
+        'order_by': 'rate_increase DESC, c.name',
+        'columns': ('country_code', 'country_name', 'rate_increase', 'start_coverage',
+                    'end_coverage', 'start_year', 'end_year'),
+        'top_n': True,
+    },
+    # Coverage series for one antigen with rolling average and year-over-year change
+    'coverage/trend': {
+        'sql': _trend_sql(_COVERAGE_SERIES) + """
+            SELECT
+                country as country_code,
+                country_name,
+                key as antigen,
+                year,
+                value as coverage,
+                ROUND(rolling_avg, 2) as rolling_avg,
+                ROUND(yoy_change, 2) as yoy_change,
+                ROUND(window_gain, 2) as window_gain
+            FROM trend
+            WHERE 1 = 1
+        """,
+        'named_filters': [
+            ('antigen', str),
+            ('window', _window_size, 3),
+            ('country', str, None),
+        ],
+        # Applied after the window functions, so the first years shown still
+        # see the earlier ones
+        'filters': [
+            ('start_year', 'year >= ?', int, False),
+            ('end_year', 'year <= ?', int, False),
+        ],
+        'order_by': 'country_name, year',
+        'columns': ('country_code', 'country_name', 'antigen', 'year', 'coverage', 'rolling_avg',
+                    'yoy_change', 'window_gain'),
+    },
+    # Per-country trend statistics for one antigen
+    'coverage/trend/summary': {
+        'sql': _trend_summary_sql(_COVERAGE_SERIES, 'window_gain')
+               + COVERAGE_TREND_SUMMARY_COLUMNS + " WHERE 1 = 1",
+        'named_filters': [
+            ('antigen', str),
+            ('window', _window_size, 3),
+            ('country', str, None),
+        ],
+        'filters': [],
+        'order_by': 'country_name',
+        'columns': ('country_code', 'country_name', 'antigen', 'first_year', 'last_year',
+                    'years_reported', 'first_coverage', 'last_coverage', 'total_change',
+                    'annual_change_pct', 'largest_rise', 'largest_rise_year', 'largest_fall',
+                    'largest_fall_year', 'best_window_gain', 'best_window_end_year'),
+    },
+    # Countries with the biggest coverage gain within any `window` years, ranked
+    'coverage/most-improved': {
+        'sql': _trend_summary_sql(_COVERAGE_SERIES, 'window_gain')
+               + COVERAGE_TREND_SUMMARY_COLUMNS + " WHERE best > 0",
+        'named_filters': [
+            ('antigen', str),
+            ('window', _window_size, 5),
+            ('country', str, None),
+        ],
+        'filters': [],
+        'order_by': 'best_window_gain DESC, country_name',
+        'columns': ('country_code', 'country_name', 'antigen', 'best_window_gain',
+                    'best_window_end_year', 'first_year', 'last_year', 'first_coverage',
+                    'last_coverage', 'total_change', 'annual_change_pct'),
+        'top_n': True,
+    },
+    # B-Level 2: cases per 100k by economy phase
+    'infections': {
+        'sql': """
+            SELECT
+                it.id as infection_type,
+                it.description as disease,
+                c.CountryID as country_code,
+                c.name as country,
+                COALESCE(e.phase, 'Unassigned') as economic_phase,
+                id.year,
+                ROUND((id.cases * 100000.0 / cp.population), 2) as cases_per_100k,
+                id.cases as total_cases
+            FROM InfectionData id
+            INNER JOIN Country c ON id.country = c.CountryID
+            LEFT JOIN Economy e ON c.economy = e.economyID
+            INNER JOIN Infection_Type it ON id.inf_type = it.id
+            INNER JOIN CountryPopulation cp
+                ON id.country = cp.country AND id.year = cp.year
+            WHERE 1 = 1
+        """,
+        'filters': [
+            ('economy', "COALESCE(e.phase, 'Unassigned') = ?", str, False),
+            ('infection_type', 'id.inf_type = ?', str, False),
+            ('year', 'id.year = ?', int, False),
+            ('country', 'id.country = ?', str, False),
+        ],
+        'order_by': 'id.year, it.id, cases_per_100k DESC, c.name',
+        'columns': ('infection_type', 'disease', 'country_code', 'country', 'economic_phase',
+                    'year', 'cases_per_100k', 'total_cases'),
+    },
+    # B-Level 2 summary: total cases per economy phase
+    'infections/summary': {
+        'sql': """
+            SELECT
+                it.id as infection_type,
+                it.description as disease,
+                COALESCE(e.phase, 'Unassigned') as economic_phase,
+                id.year,
+                SUM(id.cases) as total_cases,
+                COUNT(DISTINCT c.CountryID) as country_count
+            FROM InfectionData id
+            INNER JOIN Country c ON id.country = c.CountryID
+            LEFT JOIN Economy e ON c.economy = e.economyID
+            INNER JOIN Infection_Type it ON id.inf_type = it.id
+            WHERE 1 = 1
+        """,
+        'filters': [
+            ('infection_type', 'id.inf_type = ?', str, False),
+            ('year', 'id.year = ?', int, False),
+        ],
+        'group_by': 'it.id, id.year, COALESCE(e.phase, \'Unassigned\')',
+        'order_by': 'id.year, it.id, total_cases DESC, economic_phase',
+        'columns': ('infection_type', 'disease', 'economic_phase', 'year', 'total_cases',
+                    'country_count'),
+        'materialised': {
+            'sql': """
+                SELECT
+                    it.id as infection_type,
+                    it.description as disease,
+                    ic.phase as economic_phase,
+                    ic.year,
+                    ic.total_cases,
+                    ic.country_count
+                FROM agg_infection_cube ic
+                INNER JOIN Infection_Type it ON ic.inf_type = it.id
+                WHERE ic.region = '*' AND ic.phase != '*'
+            """,
+            'filters': [
+                ('infection_type', 'ic.inf_type = ?', str, False),
+                ('year', 'ic.year = ?', int, False),
+            ],
+            'group_by': None,
+            'order_by': 'ic.year, it.id, total_cases DESC, economic_phase',
+        },
+    },
+    # Infection cube: countries, cases and population-weighted cases per 100k
+    'rollup/infections': {
+        'sql': _infection_rollup_sql(f"({aggregates.infection_cube_sql('1 = 1')})"),
+        'filters': [
+            ('infection_type', 'inf_type = ?', str, False),
+            ('year', 'year = ?', int, False),
+            ('region', 'region = ?', str, False),
+            ('economy', 'phase = ?', str, False),
+        ],
+        'order_by': 'year, infection_type, region, economic_phase',
+        'columns': ('infection_type', 'year', 'region', 'economic_phase', 'country_count',
+                    'total_cases', 'population', 'cases_per_100k'),
+        'materialised': {'sql': _infection_rollup_sql('agg_infection_cube')},
+    },
+    # B-Level 3: countries above the average infection rate, ranked
+    'infections/above-average': {
+        'sql': """
+            WITH rates AS (
+                SELECT
+                    id.inf_type,
+                    id.country,
+                    id.year,
+                    id.cases,
+                    (id.cases * 100000.0 / cp.population) as rate
+                FROM InfectionData id
+                INNER JOIN CountryPopulation cp
+                    ON id.country = cp.country AND id.year = cp.year
+                WHERE id.inf_type = :infection_type AND id.year = :year
+            ),
+            average AS (SELECT AVG(rate) as avg_rate FROM rates)
+            SELECT
+                c.CountryID as country_code,
+                c.name as country,
+                it.description as infection_type,
+                ROUND(rates.rate, 2) as infection_per_100k,
+                ROUND(average.avg_rate, 2) as global_average,
+                rates.year,
+                rates.cases as total_cases
+            FROM rates
+            CROSS JOIN average
+            INNER JOIN Country c ON rates.country = c.CountryID
+            INNER JOIN Infection_Type it ON rates.inf_type = it.id
+            WHERE rates.rate > average.avg_rate
+        """,
+        # Bound by name inside the CTE rather than appended to the WHERE clause
+        'named_filters': [
+            ('infection_type', str),
+            ('year', int),
+        ],
+        'filters': [],
+        'order_by': 'infection_per_100k DESC, c.name',
+        'columns': ('country_code', 'country', 'infection_type', 'infection_per_100k',
+                    'global_average', 'year', 'total_cases'),
+        'top_n': True,
+    },
+    # Cases per 100k series for one infection type with rolling average and change
+    'infections/trend': {
+        'sql': _trend_sql(_INFECTION_SERIES) + """
+            SELECT
+                country as country_code,
+                country_name as country,
+                key as infection_type,
+                year,
+                cases as total_cases,
+                population,
+                ROUND(value, 2) as cases_per_100k,
+                ROUND(rolling_avg, 2) as rolling_avg,
+                ROUND(yoy_change, 2) as yoy_change
+            FROM trend
+            WHERE 1 = 1
+        """,
+        'named_filters': [
+            ('infection_type', str),
+            ('window', _window_size, 3),
+            ('country', str, None),
+        ],
+        'filters': [
+            ('start_year', 'year >= ?', int, False),
+            ('end_year', 'year <= ?', int, False),
+        ],
+        'order_by': 'country, year',
+        'columns': ('country_code', 'country', 'infection_type', 'year', 'total_cases', 'population',
+                    'cases_per_100k', 'rolling_avg', 'yoy_change'),
+    },
+    # Per-country trend statistics for one infection type; a fall is an improvement here
+    'infections/trend/summary': {
+        'sql': _trend_summary_sql(_INFECTION_SERIES, 'window_drop') + """
+            SELECT
+                country as country_code,
+                country_name as country,
+                key as infection_type,
+                first_year,
+                last_year,
+                years_reported,
+                ROUND(first_value, 2) as first_per_100k,
+                ROUND(last_value, 2) as last_per_100k,
+                ROUND(last_value - first_value, 2) as total_change,
+                """ + _ANNUAL_CHANGE + """ as annual_change_pct,
+                ROUND(largest_rise, 2) as largest_rise,
+                largest_rise_year,
+                ROUND(largest_fall, 2) as largest_fall,
+                largest_fall_year,
+                ROUND(best, 2) as best_window_drop,
+                best_year as best_window_end_year
+            FROM summary
+            WHERE 1 = 1
+        """,
+        'named_filters': [
+            ('infection_type', str),
+            ('window', _window_size, 3),
+            ('country', str, None),
+        ],
+        'filters': [],
+        'order_by': 'country',
+        'columns': ('country_code', 'country', 'infection_type', 'first_year', 'last_year',
+                    'years_reported', 'first_per_100k', 'last_per_100k', 'total_change',
+                    'annual_change_pct', 'largest_rise', 'largest_rise_year', 'largest_fall',
+                    'largest_fall_year', 'best_window_drop', 'best_window_end_year'),
+    },
+}
+
+
+# Request parsing
+
+def _convert(name, value, converter):
+    try:
+        return converter(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"Invalid value for '{name}': {value!r}")
+
+
+def _int_arg(name, default, minimum=0, maximum=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    value = _convert(name, value, int)
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(f"'{name}' must be between {minimum} and {maximum}")
+    return value
+
+
+def _build_query(endpoint):
+    """SQL and params for an endpoint from the request's query string."""
+    sql = endpoint['sql']
+    params = []
+    named = {}
+
+    # (name, converter) is required; (name, converter, default) is optional
+    for name, converter, *default in endpoint.get('named_filters', []):
+        value = request.args.get(name)
+        if not value:
+            if not default:
+                raise ApiError(f"Missing required parameter '{name}'")
+            named[name] = default[0]
+            continue
+        named[name] = _convert(name, value, converter)
+
+    for name, clause, converter, required in endpoint['filters']:
+        value = request.args.get(name)
+        if value is None or value == '':
+            if required:
+                raise ApiError(f"Missing required parameter '{name}'")
+            continue
+        sql += f" AND {clause}"
+        params.append(_convert(name, value, converter))
+
+    if endpoint.get('group_by'):
+        sql += f" GROUP BY {endpoint['group_by']}"
+    sql += f" ORDER BY {endpoint['order_by']}"
+
+    # Ranked endpoints: top_n caps the ranking, limit/offset page through it
+    if endpoint.get('top_n'):
+        top_n = _int_arg('top_n', 10, minimum=1, maximum=MAX_LIMIT)
+        sql += f" LIMIT {top_n}"
+
+    limit = _int_arg('limit', DEFAULT_LIMIT, minimum=0, maximum=MAX_LIMIT)
+    offset = _int_arg('offset', 0)
+    sql = f"SELECT * FROM ({sql}) LIMIT ? OFFSET ?"
+    params += [limit if limit else -1, offset]
+
+    if named:
+        # Mixing named and positional placeholders isn't allowed, so name them all
+        for i, value in enumerate(params):
+            sql = sql.replace('?', f':p{i}', 1)
+            named[f'p{i}'] = value
+        return sql, named, limit, offset
+    return sql, params, limit, offset
+
+
+def _selected_fields(endpoint):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(endpoint['columns'])
+    selected = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in selected if f not in endpoint['columns']]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. "
+                       f"Available: {', '.join(endpoint['columns'])}")
+    return selected
+
+
+def _wants_csv():
+    fmt = request.args.get('format')
+    if fmt:
+        if fmt not in ('json', 'csv'):
+            raise ApiError("format must be 'json' or 'csv'")
+        return fmt == 'csv'
+    best = request.accept_mimetypes.best_match(['application/json', 'text/csv'])
+    return best == 'text/csv'
+
+
+# Streaming
+
+def _iter_rows(cursor, fields):
+    """Yield rows from the cursor as tuples of the selected fields, in chunks."""
+    columns = [col[0] for col in cursor.description]
+    indexes = [columns.index(f) for f in fields]
+    while True:
+        chunk = cursor.fetchmany(CHUNK_SIZE)
+        if not chunk:
+            break
+        for row in chunk:
+            yield tuple(row[i] for i in indexes)
+
+
+def _stream_json(rows, fields, meta):
+    yield '{"fields": ' + json.dumps(fields) + ', "data": ['
+    count = 0
+    for row in rows:
+        prefix = ',' if count else ''
+        yield prefix + json.dumps(dict(zip(fields, row)))
+        count += 1
+    meta = dict(meta, count=count)
+    if meta['limit'] and count == meta['limit']:
+        meta['next_offset'] = meta['offset'] + count
+    yield '], "meta": ' + json.dumps(meta) + '}'
+
+
+def _stream_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _materialised(endpoint, pool):
+    """
+    The endpoint with its 'materialised' keys applied if the aggregate tables
+    are built and none of their partitions is waiting for a refresh.
+    """
+    if 'materialised' not in endpoint:
+        return endpoint
+    with pool.acquire() as conn:
+        if not current_app.extensions['analytics_backends']['sqlite'].aggregates_ready(conn):
+            return endpoint
+    return {**endpoint, **endpoint['materialised']}
+
+
+def _respond(name):
+    pool = current_app.extensions['db_pool']
+    endpoint = _materialised(ENDPOINTS[name], pool)
+    sql, params, limit, offset = _build_query(endpoint)
+    fields = _selected_fields(endpoint)
+    wants_csv = _wants_csv()
+
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+    except sqlite3.Error:
+        conn.close()
+        raise
+
+    def generate():
+        # The connection goes back to the pool once the last row has been sent
+        try:
+            rows = _iter_rows(cursor, fields)
+            if wants_csv:
+                yield from _stream_csv(rows, fields)
+            else:
+                meta = {'endpoint': name, 'limit': limit, 'offset': offset}
+                yield from _stream_json(rows, fields, meta)
+        finally:
+            conn.close()
+
+    mimetype = 'text/csv' if wants_csv else 'application/json'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    if wants_csv:
+        filename = name.replace('/', '_')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+# Routes
+
+@api.route('/')
+def index():
+    """List the available endpoints with their parameters and fields."""
+    return jsonify({
+        name: {
+            'url': f"{api.url_prefix}/{name}",
+            'parameters': ([f[0] for f in endpoint['filters']]
+                           + [f[0] for f in endpoint.get('named_filters', [])]
+                           + (['top_n'] if endpoint.get('top_n') else [])
+                           + ['limit', 'offset', 'fields', 'format']),
+            'fields': list(endpoint['columns']),
+        }
+        for name, endpoint in ENDPOINTS.items()
+    })
+
+
+@api.route('/coverage')
+def coverage():
+    """Vaccination coverage rows (A-Level 2), filterable by year/antigen/country."""
+    return _respond('coverage')
+
+
+@api.route('/coverage/regions')
+def coverage_regions():
+    """Countries meeting the 90% target per region (A-Level 2, Table 2)."""
+    return _respond('coverage/regions')
+
+
+@api.route('/improvement')
+def improvement():
+    """Top-N coverage improvements between two years (A-Level 3)."""
+    return _respond('improvement')
+
+
+@api.route('/infections')
+def infections():
+    """Cases per 100,000 people by economy phase (B-Level 2)."""
+    return _respond('infections')
+
+
+@api.route('/infections/summary')
+def infections_summary():
+    """Total cases per economy phase (B-Level 2 summary)."""
+    return _respond('infections/summary')
+
+
+@api.route('/infections/above-average')
+def infections_above_average():
+    """Countries above the average infection rate (B-Level 3)."""
+    return _respond('infections/above-average')
+
+
+@api.route('/rollup/coverage')
+def rollup_coverage():
+    """Coverage cube rows per (antigen, year, region, economy phase) with '*' rollups."""
+    return _respond('rollup/coverage')
+
+
+@api.route('/rollup/infections')
+def rollup_infections():
+    """Infection cube rows per (infection type, year, region, economy phase) with '*' rollups."""
+    return _respond('rollup/infections')
+
+
+@api.route('/country/<country_id>')
+def country_profile(country_id):
+    """Everything about one country, from the per-country index (JSON only)."""
+    profile = current_app.extensions['country_index'].get(country_id)
+    if profile is None:
+        return jsonify({'error': f"No country with code '{country_id}'"}), 404
+    return jsonify({
+        'country_code': profile.country_code,
+        'name': profile.name,
+        'region': profile.region,
+        'economy': profile.economy,
+        'population': [point._asdict() for point in profile.population],
+        'coverage': {series.antigen: [point._asdict() for point in series.points]
+                     for series in profile.coverage},
+        'infections': {series.inf_type: {'description': series.description,
+                                         'series': [point._asdict() for point in series.points]}
+                       for series in profile.infections},
+    })
+
+
+# Leaderboards: the ranked lists behind a_level3 / b_level3 (leaderboard.py),
+# shared with the pages. top_n is a slice; country=XXX adds its standing.
+
+def _required_arg(name, converter=str):
+    value = request.args.get(name)
+    if not value:
+        raise ApiError(f"Missing required parameter '{name}'")
+    return _convert(name, value, converter)
+
+
+def _leaderboard(key, build, score, name, partitions):
+    top_n = _int_arg('top_n', 10, minimum=1, maximum=MAX_LIMIT)
+    country_id = request.args.get('country')
+    if country_id:
+        profile = current_app.extensions['country_index'].get(country_id)
+        if profile is None:
+            return jsonify({'error': f"No country with code '{country_id}'"}), 404
+
+    backends = current_app.extensions['analytics_backends']
+    backend = backends.get(current_app.config['ANALYTICS_BACKEND'], backends['sqlite'])
+    with current_app.extensions['db_pool'].acquire() as conn:
+        board = current_app.extensions['leaderboards'].board(
+            (backend.name,) + key, lambda: build(backend, conn), score, name, partitions)
+        result = {'size': len(board.rows), 'rows': [row._asdict() for row in board.rows[:top_n]]}
+        if country_id:
+            standing = leaderboard.standing(board, profile.name)
+            result['country'] = {
+                'country_code': profile.country_code,
+                'rank': standing.rank if standing else None,
+                'percentile': standing.percentile if standing else None,
+                'row': standing.row._asdict() if standing else None,
+            }
+    return jsonify(result)
+
+
+@api.route('/leaderboard/improvement')
+def leaderboard_improvement():
+    """a_level3 ranking: every country whose coverage increased between two years."""
+    start_year = _required_arg('start_year', int)
+    end_year = _required_arg('end_year', int)
+    antigen = _required_arg('antigen')
+    return _leaderboard(
+        ('a_level3', start_year, end_year, antigen),
+        lambda backend, conn: backend.a3_improvement(conn, start_year, end_year, antigen, None),
+        'rate_increase', 'country_name', ingest.coverage_partitions([antigen], [start_year, end_year]))
+
+
+@api.route('/leaderboard/above-average')
+def leaderboard_above_average():
+    """b_level3 ranking: every country above the average infection rate."""
+    infection_type = _required_arg('infection_type')
+    year = _required_arg('year', int)
+    return _leaderboard(
+        ('b_level3', infection_type, year),
+        lambda backend, conn: backend.b3_above_average(conn, infection_type, year, None),
+        'infection_per_100k', 'country', ingest.infection_partitions([infection_type], [year]))
+
+
+@api.route('/coverage/trend')
+def coverage_trend():
+    """Coverage series per country for one antigen, with rolling average and yearly change."""
+    return _respond('coverage/trend')
+
+
+@api.route('/coverage/trend/summary')
+def coverage_trend_summary():
+    """Per-country coverage trend statistics for one antigen."""
+    return _respond('coverage/trend/summary')
+
+
+@api.route('/coverage/most-improved')
+def coverage_most_improved():
+    """Top-N countries by coverage gained within any window of years."""
+    return _respond('coverage/most-improved')
+
+
+@api.route('/infections/trend')
+def infections_trend():
+    """Cases per 100k series per country for one infection type."""
+    return _respond('infections/trend')
+
+
+@api.route('/infections/trend/summary')
+def infections_trend_summary():
+    """Per-country infection rate trend statistics for one infection type."""
+    return _respond('infections/trend/summary')
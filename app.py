@@ -1,27 +1,168 @@
-
-from flask import Flask, render_template, request
+from flask import Flask, Response, current_app, redirect, render_template, request, jsonify, url_for
+from flask.cli import AppGroup
+from werkzeug.local import LocalProxy
+import click
+import os
+import secrets
 import sqlite3
+import time
+
+import aggregates
+import comparison
+import db_indexes
+import ingest
+import snapshot
+from analytics import SqliteBackend
+from api import api
+from columnar import ColumnarBackend
+from country_index import CountryIndex, pivot
+from data_version import DataVersion
+from compression import Compression
+from db_executor import DBExecutor, ExecutorBusy
+from fragment_cache import FragmentCache, precompile_templates
+from http_cache import HttpCache, uncacheable
+from leaderboard import Leaderboards
+from profiling import QueryProfiler
+from db_pool import ConnectionPool
+from reference_cache import ReferenceCache
+from result_cache import QueryCache
+
+# Default settings; create_app(config) overrides any of them
+DEFAULT_CONFIG = dict(
+    SECRET_KEY=os.environ.get('SECRET_KEY'),  # None = random per start (set it when running several processes)
+    DATABASE=os.environ.get('IMMUNISATION_DB', 'immunisation.db'),  # e.g. a synthetic DB for benchmarks
+    DB_POOL_SIZE=8,               # max connections kept open per process
+    DB_READ_ONLY=True,            # open with mode=ro
+    DB_IMMUTABLE=False,           # add immutable=1 (only if the file never changes while running)
+    DB_MMAP_SIZE=64 * 1024 * 1024,
+    DB_CACHE_SIZE=-16000,         # negative = KiB, so ~16MB page cache per connection
+    DB_HEALTH_CHECK_INTERVAL=30,  # seconds idle before a connection is re-checked
+    DB_POOL_TIMEOUT=5,            # seconds to wait when every connection is in use
+    DB_VERSION_CHECK_INTERVAL=1,  # seconds between checks for a changed DB file
+    RESULT_CACHE_SIZE=512,        # analysis results kept in memory (LRU)
+    RESULT_CACHE_TTL=None,        # seconds, or None to keep results until the DB changes
+    LEADERBOARD_MAX_BOARDS=1024,  # ranked a_level3/b_level3 lists kept in memory (LRU)
+    USE_AGGREGATES=True,          # read materialised aggregate tables when they exist
+    ANALYTICS_BACKEND='sqlite',   # 'sqlite' or 'numpy' (columnar, needs NumPy installed)
+    ANALYTICS_BACKEND_OVERRIDE=False,  # allow an X-Analytics-Backend header to pick per request
+    COLUMNAR_SNAPSHOT=os.environ.get('IMMUNISATION_SNAPSHOT'),  # `flask db snapshot` file for the numpy backend
+    HTTP_CACHE_ENABLED=True,      # ETag/Last-Modified/304 handling for GET pages and API
+    HTTP_CACHE_CONTROL='public, max-age=300',
+    HTTP_CACHE_EXCLUDE=('/stats', '/static', '/metrics'),
+    COMPRESSION_ENABLED=True,     # gzip/brotli (brotli needs the `brotli` package) per Accept-Encoding
+    COMPRESSION_MIN_SIZE=1024,    # bytes; smaller responses are sent uncompressed
+    COMPRESSION_GZIP_LEVEL=6,
+    COMPRESSION_BROTLI_QUALITY=5,
+    COMPRESSION_CACHE_MAX_BYTES=8 * 1024 * 1024,  # compressed bodies reused while their ETag matches
+    FRAGMENT_CACHE_MAX_BYTES=8 * 1024 * 1024,  # rendered results sections kept in memory
+    FRAGMENT_CACHE_COMPRESS=False,  # zlib-compress large fragments (less memory, more CPU)
+    TEMPLATE_BYTECODE_CACHE_DIR=None,  # directory for compiled templates, or None for memory only
+    PROFILING_ENABLED=True,       # per-query/per-route timings for /metrics
+    SLOW_QUERY_MS=100,            # log queries slower than this with their query plan (None = off)
+    DB_EXECUTOR_WORKERS=4,        # threads running a page's independent queries concurrently (0 = inline)
+    DB_EXECUTOR_QUEUE_SIZE=16,    # tasks allowed to wait for a thread before answering 503
+    DB_EXECUTOR_QUEUE_TIMEOUT=0.5,  # seconds to wait for a queue slot
+    DB_QUERY_TIMEOUT=10,          # seconds a page's queries may run before being aborted (None = no limit)
+)
+
+
+# Services (pools, caches, backends) belong to the app built by create_app().
+# These proxies look them up on the current app, so routes use them like globals.
+
+def _service(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+db_pool = _service('db_pool')
+db_executor = _service('db_executor')
+data_version = _service('data_version')
+reference_data = _service('reference_data')
+country_index = _service('country_index')
+query_cache = _service('query_cache')
+leaderboards = _service('leaderboards')
+fragment_cache = _service('fragment_cache')
+analytics_backends = _service('analytics_backends')
+http_cache = _service('http_cache')
+compression = _service('compression')
+query_profiler = _service('query_profiler')
+
+# Routes are collected here and added to every app create_app() builds
+_routes = []
+
+
+def route(rule, **options):
+    """Like @app.route, for the app(s) made by create_app()."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
 
-app = Flask(__name__)
-app.secret_key = 'student_project_secret_key_2025'
 
 # error handling
 def get_db_connection():
     """
-    Establishes connection to the SQLite database.
+    Checks out a connection to the SQLite database from the pool.
+    conn.close() returns it to the pool rather than closing it.
     Uses try/except to handle missing database file.
     """
     try:
-        conn = sqlite3.connect('immunisation.db')
-        conn.row_factory = sqlite3.Row  # Allows accessing columns by name
-        return conn
+        return db_pool.acquire()
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
 
+
+def executor_busy(e):
+    """Backpressure: too many queries queued, ask the client to retry."""
+    return f"Server busy ({e}), please retry shortly.", 503, {'Retry-After': '1'}
+
+
+def wants_partial():
+    """
+    HTMX-style request for just the results section of a page: an
+    HX-Request header (sent by static/partial.js) or ?partial=1.
+    """
+    return request.headers.get('HX-Request') == 'true' or request.values.get('partial') == '1'
+
+
+def top_n_arg(default=10, maximum=50):
+    """
+    The ranked pages' top_n: the form allows 1-50, anything else (missing,
+    not a number, out of range) falls back to the default or is clamped.
+    """
+    top_n = request.values.get('top_n', default, type=int)
+    return min(max(top_n, 1), maximum)
+
+
+def render_page(template, **context):
+    """
+    Render an analysis page, or only its results section (and any error)
+    when wants_partial(), leaving out the layout and the filter forms with
+    their year / antigen option lists. Pages showing an error are never
+    cached: the DB (and so the ETag) is unchanged when the error clears.
+    """
+    if context.get('error_message'):
+        uncacheable()
+    if wants_partial():
+        return render_template('partials/results_only.html',
+                               results_html=context.get('results_html', ''),
+                               error_message=context.get('error_message'))
+    return render_template(template, **context)
+
+
+def get_backend():
+    """
+    The analytics backend for this request. With ANALYTICS_BACKEND_OVERRIDE on,
+    an X-Analytics-Backend header picks one per request so both can be A/B tested.
+    """
+    name = current_app.config['ANALYTICS_BACKEND']
+    if current_app.config['ANALYTICS_BACKEND_OVERRIDE']:
+        name = request.headers.get('X-Analytics-Backend', name)
+    return analytics_backends.get(name, analytics_backends['sqlite'])
+
 # HOME PAGE 
 
-@app.route('/')
+@route('/')
 def index():
     """
     Home page showing project overview and navigation to all A-Level and B-Level pages.
@@ -30,7 +171,7 @@ def index():
 
 # A-LEVEL 1 - Landing Page with Key Vaccination Insights
 
-@app.route('/a_level1')
+@route('/a_level1')
 def a_level1():
     """
     A-Level 1: Landing page displaying 4 key vaccination insights from database.
@@ -46,34 +187,34 @@ def a_level1():
     
     if conn:
         try:
-            # Query 1: Get year range from Vaccination table
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT MIN(year) as min_year, MAX(year) as max_year 
-                FROM Vaccination
-            """)
-            year_data = cursor.fetchone()
+            # The four queries are independent, so they run concurrently
+            year_data, total_vaccinations, disease_count, diseases = db_executor.run_all(conn, [
+                # Query 1: Get year range from Vaccination table
+                lambda c: c.execute("""
+                    SELECT MIN(year) as min_year, MAX(year) as max_year 
+                    FROM Vaccination
+                """).fetchone(),
+
+                # Query 2: Count total vaccination records
+                lambda c: c.execute("SELECT COUNT(*) as count FROM Vaccination").fetchone()['count'],
+
+                # Query 3: Count distinct infectious diseases
+                lambda c: c.execute("SELECT COUNT(*) as count FROM Infection_Type").fetchone()['count'],
+
+                # Query 4: Get list of all infectious diseases
+                lambda c: c.execute("SELECT description FROM Infection_Type ORDER BY description").fetchall(),
+            ])
             year_range = f"{year_data['min_year']} to {year_data['max_year']}"
             
-            # Query 2: Count total vaccination records
-            cursor.execute("SELECT COUNT(*) as count FROM Vaccination")
-            total_vaccinations = cursor.fetchone()['count']
-            
-            # Query 3: Count distinct infectious diseases
-            cursor.execute("SELECT COUNT(*) as count FROM Infection_Type")
-            disease_count = cursor.fetchone()['count']
-            
-            # Query 4: Get list of all infectious diseases
-            cursor.execute("SELECT description FROM Infection_Type ORDER BY description")
-            diseases = cursor.fetchall()
-            
         except sqlite3.Error as e:
             error_message = f"Database query error: {e}"
         finally:
             conn.close()
     else:
         error_message = "Unable to connect to database. Please ensure immunisation.db exists."
-    
+
+    if error_message:
+        uncacheable()
     return render_template('a_level1.html', 
                          year_range=year_range,
                          total_vaccinations=total_vaccinations,
@@ -84,7 +225,7 @@ def a_level1():
 
 # A-LEVEL 2
 
-@app.route('/a_level2', methods=['GET', 'POST'])
+@route('/a_level2', methods=['GET', 'POST'])
 def a_level2():
     """
     A-Level 2: Interactive page showing vaccination coverage analysis.
@@ -94,68 +235,97 @@ def a_level2():
     - Table 1: Countries with >= 90% coverage for selected antigen/year
     - Table 2: Count of countries meeting 90% target per region
 
+    Selecting several years and/or antigens shows both as country x
+    (antigen, year) comparison tables, answered by one query (see comparison.py).
     """
     conn = get_db_connection()
+    backend = get_backend()
     
     # Variables for  dropdowns and result
     years = []
     antigens = []
-    countries_table = []
-    regions_table = []
+    results_html = ''
     error_message = None
     selected_year = None
     selected_antigen = None
+    compare_years = []
+    compare_antigens = []
+    comparing = False
     
     if conn:
         try:
-            # Get available years for dropdown 
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT year FROM Vaccination ORDER BY year DESC")
-            years = [row['year'] for row in cursor.fetchall()]
-            
-            # Get available antigens for dropdown
-            cursor.execute("SELECT DISTINCT antigen FROM Vaccination ORDER BY antigen")
-            antigens = [row['antigen'] for row in cursor.fetchall()]
+            # Get available years and antigens for dropdowns (cached)
+            refs = reference_data.get()
+            years = refs['vaccination_years_desc']
+            antigens = refs['antigens']
             
-            # If form submitted with POST request
-            if request.method == 'POST':
-                selected_year = request.form.get('year')
-                selected_antigen = request.form.get('antigen')
-                
-                if selected_year and selected_antigen:
-                    # Table 1: Countries with >= 90% coverage
-                    # JOIN Vaccination, Country, and Region tables
-                    cursor.execute("""
-                        SELECT 
-                            v.antigen,
-                            v.year,
-                            c.name as country_name,
-                            r.region,
-                            v.coverage
-                        FROM Vaccination v
-                        INNER JOIN Country c ON v.country = c.CountryID
-                        INNER JOIN Region r ON c.region = r.RegionID
-                        WHERE v.year = ? AND v.antigen = ? AND v.coverage >= 90
-                        ORDER BY v.coverage DESC, c.name
-                    """, (selected_year, selected_antigen))
-                    countries_table = cursor.fetchall()
-                    
-                    # Table 2: Count of countries meeting 90% target per region
-                    # Uses GROUP BY to aggregate by region
-                    cursor.execute("""
-                        SELECT 
-                            v.antigen,
-                            v.year,
-                            r.region,
-                            COUNT(DISTINCT c.CountryID) as country_count
-                        FROM Vaccination v
-                        INNER JOIN Country c ON v.country = c.CountryID
-                        INNER JOIN Region r ON c.region = r.RegionID
-                        WHERE v.year = ? AND v.antigen = ? AND v.coverage >= 90
-                        GROUP BY r.region
-                        ORDER BY country_count DESC, r.region
-                    """, (selected_year, selected_antigen))
-                    regions_table = cursor.fetchall()
+            # If form submitted (GET query string or POST)
+            if request.method == 'POST' or request.args:
+                selected_year = request.values.get('year')
+                selected_antigen = request.values.get('antigen')
+
+                # Several years and/or antigens selected: one comparison table
+                compare_years = comparison.selected(request.values.getlist('year'), refs['vaccination_years'])
+                compare_antigens = comparison.selected(request.values.getlist('antigen'), antigens)
+                columns = len(compare_years) * len(compare_antigens)
+
+                if columns > comparison.MAX_COLUMNS:
+                    error_message = (f"Too many years x antigens selected "
+                                     f"(at most {comparison.MAX_COLUMNS} combinations).")
+                    selected_year = selected_antigen = None
+
+                elif columns > 1:
+                    comparing = True
+                    selected_year = selected_antigen = None
+                    params = (backend.name, tuple(compare_years), tuple(compare_antigens))
+                    partitions = ingest.coverage_partitions(compare_antigens, compare_years)
+                    results_html = fragment_cache.get('partials/a_level2_comparison.html', params) or ''
+                    if not results_html:
+                        # Every (year, antigen) in one grouped query; the per-region
+                        # counts are worked out from the same rows
+                        rows, = db_executor.run_all(conn, [
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'a_level2', 'batch', tuple(compare_years), tuple(compare_antigens)),
+                                lambda: backend.a2_countries_batch(c, compare_years, compare_antigens),
+                                partitions),
+                        ], heavy=True)
+
+                        results_html = fragment_cache.render(
+                            'partials/a_level2_comparison.html', params, partitions,
+                            matrix=comparison.coverage_matrix(rows, compare_years, compare_antigens),
+                            compare_years=compare_years,
+                            compare_antigens=compare_antigens)
+
+                elif selected_year and selected_antigen:
+                    # The rendered results section is cached, so a repeat
+                    # request skips both the queries and the table rendering
+                    params = (backend.name, selected_year, selected_antigen)
+                    # Tags for dropping just these results when an ingest changes this (antigen, year)
+                    partitions = ingest.coverage_partitions([selected_antigen], [selected_year])
+                    results_html = fragment_cache.get('partials/a_level2_results.html', params) or ''
+                    if not results_html:
+                        countries_table, regions_table = db_executor.run_all(conn, [
+                            # Table 1: Countries with >= 90% coverage
+                            # JOIN Vaccination, Country, and Region tables
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'a_level2', 'countries', selected_year, selected_antigen),
+                                lambda: backend.a2_countries(c, selected_year, selected_antigen),
+                                partitions),
+
+                            # Table 2: Count of countries meeting 90% target per region
+                            # Uses GROUP BY to aggregate by region
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'a_level2', 'regions', selected_year, selected_antigen),
+                                lambda: backend.a2_regions(c, selected_year, selected_antigen),
+                                partitions),
+                        ], heavy=True)
+
+                        results_html = fragment_cache.render(
+                            'partials/a_level2_results.html', params, partitions,
+                            countries_table=countries_table,
+                            regions_table=regions_table,
+                            selected_year=selected_year,
+                            selected_antigen=selected_antigen)
                     
         except sqlite3.Error as e:
             error_message = f"Database query error: {e}"
@@ -164,19 +334,21 @@ def a_level2():
     else:
         error_message = "Unable to connect to database."
     
-    return render_template('a_level2.html',
+    return render_page('a_level2.html',
                          years=years,
                          antigens=antigens,
-                         countries_table=countries_table,
-                         regions_table=regions_table,
+                         results_html=results_html,
                          selected_year=selected_year,
                          selected_antigen=selected_antigen,
+                         compare_years=compare_years,
+                         compare_antigens=compare_antigens,
+                         comparing=comparing,
                          error_message=error_message)
 
 
 # A-LEVEL 3 
 
-@app.route('/a_level3', methods=['GET', 'POST'])
+@route('/a_level3', methods=['GET', 'POST'])
 def a_level3():
     """
     A-Level 3: Analysis of vaccination rate improvements.
@@ -187,61 +359,98 @@ def a_level3():
     
     Calculates vaccination rate improvement between two years.
     Uses JOINs across Vaccination and CountryPopulation tables.
+
+    The comparison form ranks several antigens side by side, optionally with
+    the coverage for every year in between, from one query (see comparison.py).
     """
     conn = get_db_connection()
+    backend = get_backend()
     
     years = []
     antigens = []
-    results = []
+    results_html = ''
     error_message = None
     start_year = None
     end_year = None
     selected_antigen = None
     top_n = 10  # Default value
+    compare_antigens = []
+    every_year = False
+    comparing = False
     
     if conn:
         try:
-            cursor = conn.cursor()
-            
-            # Get available years and antigens for dropdowns
-            cursor.execute("SELECT DISTINCT year FROM Vaccination ORDER BY year")
-            years = [row['year'] for row in cursor.fetchall()]
+            # Get available years and antigens for dropdowns (cached)
+            refs = reference_data.get()
+            years = refs['vaccination_years']
+            antigens = refs['antigens']
             
-            cursor.execute("SELECT DISTINCT antigen FROM Vaccination ORDER BY antigen")
-            antigens = [row['antigen'] for row in cursor.fetchall()]
-            
-            # If form submitted
-            if request.method == 'POST':
-                start_year = request.form.get('start_year')
-                end_year = request.form.get('end_year')
-                selected_antigen = request.form.get('antigen')
-                top_n = int(request.form.get('top_n', 10))
-                
-                if start_year and end_year and selected_antigen:
-                    # Calculate vaccination rate improvement
-                    # Rate = (coverage * population) / population for consistency
-                    # Improvement = end_coverage - start_coverage
-                    cursor.execute("""
-                        SELECT 
-                            c.name as country_name,
-                            (v2.coverage - v1.coverage) as rate_increase,
-                            v1.coverage as start_coverage,
-                            v2.coverage as end_coverage,
-                            ? as start_year,
-                            ? as end_year
-                        FROM Vaccination v1
-                        INNER JOIN Vaccination v2 
-                            ON v1.country = v2.country 
-                            AND v1.antigen = v2.antigen
-                        INNER JOIN Country c ON v1.country = c.CountryID
-                        WHERE v1.year = ? 
-                            AND v2.year = ?
-                            AND v1.antigen = ?
-                            AND v2.coverage > v1.coverage
-                        ORDER BY rate_increase DESC
-                        LIMIT ?
-                    """, (start_year, end_year, start_year, end_year, selected_antigen, top_n))
-                    results = cursor.fetchall()
+            # If form submitted (GET query string or POST)
+            if request.method == 'POST' or request.args:
+                # Years as ints, as the API has them: leaderboards are shared
+                start_year = request.values.get('start_year', type=int)
+                end_year = request.values.get('end_year', type=int)
+                selected_antigen = request.values.get('antigen')
+                top_n = top_n_arg()
+
+                # Several antigens, or every year between start and end: one comparison table
+                compare_antigens = comparison.selected(request.values.getlist('antigen'), antigens)
+                every_year = bool(request.values.get('every_year'))
+                comparing = bool(start_year and end_year and compare_antigens
+                                 and (request.values.get('compare') or every_year
+                                      or len(compare_antigens) > 1))
+
+                if comparing:
+                    selected_antigen = None
+                    compare_years = comparison.year_range(start_year, end_year, years)
+                    if not every_year:
+                        compare_years = compare_years[:1] + compare_years[1:][-1:]
+                    if len(compare_antigens) * (len(compare_years) + 1) > comparison.MAX_COLUMNS:
+                        error_message = (f"Too many antigens x years selected "
+                                         f"(at most {comparison.MAX_COLUMNS} columns).")
+                        comparing = False
+
+                if comparing:
+                    params = (backend.name, tuple(compare_years), tuple(compare_antigens), top_n)
+                    partitions = ingest.coverage_partitions(compare_antigens, compare_years)
+                    results_html = fragment_cache.get('partials/a_level3_comparison.html', params) or ''
+                    if not results_html:
+                        # Coverage for every antigen and year in one scan, rather
+                        # than a self-join per antigen; pivoted and ranked in Python
+                        rows, = db_executor.run_all(conn, [
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'a_level3', 'series', tuple(compare_years), tuple(compare_antigens)),
+                                lambda: backend.a3_coverage_series(c, compare_years, compare_antigens),
+                                partitions),
+                        ], heavy=True)
+
+                        results_html = fragment_cache.render(
+                            'partials/a_level3_comparison.html', params, partitions,
+                            matrix=comparison.improvement_matrix(rows, compare_years, compare_antigens, top_n),
+                            start_year=start_year,
+                            end_year=end_year)
+
+                elif start_year and end_year and selected_antigen:
+                    params = (backend.name, start_year, end_year, selected_antigen, top_n)
+                    partitions = ingest.coverage_partitions([selected_antigen], [start_year, end_year])
+                    results_html = fragment_cache.get('partials/a_level3_results.html', params) or ''
+                    if not results_html:
+                        # Calculate vaccination rate improvement
+                        # Improvement = end_coverage - start_coverage
+                        # Every improving country is ranked once per (years, antigen); any top_n is a slice
+                        results, = db_executor.run_all(conn, [
+                            lambda c: leaderboards.top(
+                                (backend.name, 'a_level3', start_year, end_year, selected_antigen), top_n,
+                                lambda: backend.a3_improvement(c, start_year, end_year, selected_antigen, None),
+                                'rate_increase', 'country_name', partitions),
+                        ], heavy=True)
+
+                        results_html = fragment_cache.render(
+                            'partials/a_level3_results.html', params, partitions,
+                            results=results,
+                            start_year=start_year,
+                            end_year=end_year,
+                            selected_antigen=selected_antigen)
                     
         except sqlite3.Error as e:
             error_message = f"Database query error: {e}"
@@ -250,20 +459,23 @@ def a_level3():
     else:
         error_message = "Unable to connect to database."
     
-    return render_template('a_level3.html',
+    return render_page('a_level3.html',
                          years=years,
                          antigens=antigens,
-                         results=results,
+                         results_html=results_html,
                          start_year=start_year,
                          end_year=end_year,
                          selected_antigen=selected_antigen,
                          top_n=top_n,
+                         compare_antigens=compare_antigens,
+                         every_year=every_year,
+                         comparing=comparing,
                          error_message=error_message)
 
 
 # B-LEVEL 1 - Mission Statement
 
-@app.route('/b_level1')
+@route('/b_level1')
 def b_level1():
     """
     B-Level 1: Mission statement page showing:
@@ -303,7 +515,9 @@ def b_level1():
             conn.close()
     else:
         error_message = "Unable to connect to database."
-    
+
+    if error_message:
+        uncacheable()
     return render_template(
         'b_level1.html',
         personas=personas,
@@ -314,7 +528,7 @@ def b_level1():
 
 # B-LEVEL 2 - Infection Data by Economic Status
 
-@app.route('/b_level2', methods=['GET', 'POST'])
+@route('/b_level2', methods=['GET', 'POST'])
 def b_level2():
     """
     B-Level 2: Focused view of infection data filtered by economic status.
@@ -324,12 +538,12 @@ def b_level2():
     - Year
     """
     conn = get_db_connection()
+    backend = get_backend()
     
     economic_statuses = []
     infection_types = []
     years = []
-    detailed_results = []
-    summary_results = []
+    results_html = ''
     error_message = None
     selected_economy = None
     selected_infection = None
@@ -337,68 +551,45 @@ def b_level2():
     
     if conn:
         try:
-            cursor = conn.cursor()
-            
-            # Get available economic statuses
-            cursor.execute("SELECT DISTINCT phase FROM Economy ORDER BY phase")
-            economic_statuses = [row['phase'] for row in cursor.fetchall()]
-            
-            # Get available infection types
-            cursor.execute("SELECT id, description FROM Infection_Type ORDER BY description")
-            infection_types = cursor.fetchall()
+            # Get available economic statuses, infection types and years (cached)
+            refs = reference_data.get()
+            economic_statuses = refs['economy_phases']
+            infection_types = refs['infection_types']
+            years = refs['infection_years']
             
-            # Get available years from InfectionData
-            cursor.execute("SELECT DISTINCT year FROM InfectionData ORDER BY year DESC")
-            years = [row['year'] for row in cursor.fetchall()]
-            
-            # If form submitted
-            if request.method == 'POST':
-                selected_economy = request.form.get('economy')
-                selected_infection = request.form.get('infection_type')
-                selected_year = request.form.get('year')
+            # If form submitted (GET query string or POST)
+            if request.method == 'POST' or request.args:
+                selected_economy = request.values.get('economy')
+                selected_infection = request.values.get('infection_type')
+                selected_year = request.values.get('year')
                 
                 if selected_economy and selected_infection and selected_year:
-                    # Detailed table: Cases per 100,000 people
-                    # Calculate: (cases / population) * 100,000
-                    cursor.execute("""
-                        SELECT 
-                            it.description as disease,
-                            c.name as country,
-                            e.phase as economic_phase,
-                            id.year,
-                            ROUND((id.cases * 100000.0 / cp.population), 2) as cases_per_100k,
-                            id.cases as total_cases
-                        FROM InfectionData id
-                        INNER JOIN Country c ON id.country = c.CountryID
-                        INNER JOIN Economy e ON c.economy = e.economyID
-                        INNER JOIN Infection_Type it ON id.inf_type = it.id
-                        INNER JOIN CountryPopulation cp 
-                            ON id.country = cp.country AND id.year = cp.year
-                        WHERE e.phase = ? 
-                            AND it.id = ?
-                            AND id.year = ?
-                        ORDER BY cases_per_100k DESC
-                    """, (selected_economy, selected_infection, selected_year))
-                    detailed_results = cursor.fetchall()
-                    
-                    # Summary table: Total cases by economic phase
-                    # Uses GROUP BY to aggregate data
-                    cursor.execute("""
-                        SELECT 
-                            it.description as disease,
-                            e.phase as economic_phase,
-                            id.year,
-                            SUM(id.cases) as total_cases,
-                            COUNT(DISTINCT c.CountryID) as country_count
-                        FROM InfectionData id
-                        INNER JOIN Country c ON id.country = c.CountryID
-                        INNER JOIN Economy e ON c.economy = e.economyID
-                        INNER JOIN Infection_Type it ON id.inf_type = it.id
-                        WHERE it.id = ? AND id.year = ?
-                        GROUP BY e.phase
-                        ORDER BY total_cases DESC
-                    """, (selected_infection, selected_year))
-                    summary_results = cursor.fetchall()
+                    params = (backend.name, selected_economy, selected_infection, selected_year)
+                    partitions = ingest.infection_partitions([selected_infection], [selected_year])
+                    results_html = fragment_cache.get('partials/b_level2_results.html', params) or ''
+                    if not results_html:
+                        detailed_results, summary_results = db_executor.run_all(conn, [
+                            # Detailed table: Cases per 100,000 people
+                            # Calculate: (cases / population) * 100,000
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'b_level2', 'detailed', selected_economy, selected_infection, selected_year),
+                                lambda: backend.b2_detailed(c, selected_economy, selected_infection, selected_year),
+                                partitions),
+
+                            # Summary table: Total cases by economic phase
+                            # Uses GROUP BY to aggregate data
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'b_level2', 'summary', selected_infection, selected_year),
+                                lambda: backend.b2_summary(c, selected_infection, selected_year),
+                                partitions),
+                        ], heavy=True)
+
+                        results_html = fragment_cache.render(
+                            'partials/b_level2_results.html', params, partitions,
+                            detailed_results=detailed_results,
+                            summary_results=summary_results,
+                            selected_economy=selected_economy,
+                            selected_year=selected_year)
                     
         except sqlite3.Error as e:
             error_message = f"Database query error: {e}"
@@ -407,12 +598,11 @@ def b_level2():
     else:
         error_message = "Unable to connect to database."
     
-    return render_template('b_level2.html',
+    return render_page('b_level2.html',
                          economic_statuses=economic_statuses,
                          infection_types=infection_types,
                          years=years,
-                         detailed_results=detailed_results,
-                         summary_results=summary_results,
+                         results_html=results_html,
                          selected_economy=selected_economy,
                          selected_infection=selected_infection,
                          selected_year=selected_year,
@@ -421,7 +611,7 @@ def b_level2():
 
 # B-LEVEL 3 - Countries with Above Average Infection Rate
 
-@app.route('/b_level3', methods=['GET', 'POST'])
+@route('/b_level3', methods=['GET', 'POST'])
 def b_level3():
     """
     B-Level 3: Deep analysis showing countries with above-average infection rates.
@@ -431,11 +621,11 @@ def b_level3():
     - Number of top countries to display
     """
     conn = get_db_connection()
+    backend = get_backend()
     
     infection_types = []
     years = []
-    results = []
-    global_average = None
+    results_html = ''
     error_message = None
     selected_infection = None
     selected_year = None
@@ -443,62 +633,43 @@ def b_level3():
     
     if conn:
         try:
-            cursor = conn.cursor()
-            
-            # Get available infection types
-            cursor.execute("SELECT id, description FROM Infection_Type ORDER BY description")
-            infection_types = cursor.fetchall()
+            # Get available infection types and years (cached)
+            refs = reference_data.get()
+            infection_types = refs['infection_types']
+            years = refs['infection_years']
             
-            # Get available years
-            cursor.execute("SELECT DISTINCT year FROM InfectionData ORDER BY year DESC")
-            years = [row['year'] for row in cursor.fetchall()]
-            
-            # If form submitted
-            if request.method == 'POST':
-                selected_infection = request.form.get('infection_type')
-                selected_year = request.form.get('year')
-                top_n = int(request.form.get('top_n', 10))
+            # If form submitted (GET query string or POST)
+            if request.method == 'POST' or request.args:
+                selected_infection = request.values.get('infection_type')
+                selected_year = request.values.get('year', type=int)  # as in the API
+                top_n = top_n_arg()
                 
                 if selected_infection and selected_year:
-                    # Calculate global average infection rate per 100,000
-                    cursor.execute("""
-                        SELECT 
-                            AVG((id.cases * 100000.0 / cp.population)) as avg_rate
-                        FROM InfectionData id
-                        INNER JOIN CountryPopulation cp 
-                            ON id.country = cp.country AND id.year = cp.year
-                        WHERE id.inf_type = ? AND id.year = ?
-                    """, (selected_infection, selected_year))
-                    avg_result = cursor.fetchone()
-                    global_average = round(avg_result['avg_rate'], 2) if avg_result['avg_rate'] else 0
-                    
-                    # Get countries with above-average infection rates
-                    
-                    cursor.execute("""
-                        SELECT 
-                            c.name as country,
-                            it.description as infection_type,
-                            ROUND((id.cases * 100000.0 / cp.population), 2) as infection_per_100k,
-                            id.year,
-                            id.cases as total_cases
-                        FROM InfectionData id
-                        INNER JOIN Country c ON id.country = c.CountryID
-                        INNER JOIN Infection_Type it ON id.inf_type = it.id
-                        INNER JOIN CountryPopulation cp 
-                            ON id.country = cp.country AND id.year = cp.year
-                        WHERE id.inf_type = ? 
-                            AND id.year = ?
-                            AND (id.cases * 100000.0 / cp.population) > (
-                                SELECT AVG((cases * 100000.0 / population))
-                                FROM InfectionData id2
-                                INNER JOIN CountryPopulation cp2 
-                                    ON id2.country = cp2.country AND id2.year = cp2.year
-                                WHERE id2.inf_type = ? AND id2.year = ?
-                            )
-                        ORDER BY infection_per_100k DESC
-                        LIMIT ?
-                    """, (selected_infection, selected_year, selected_infection, selected_year, top_n))
-                    results = cursor.fetchall()
+                    params = (backend.name, selected_infection, selected_year, top_n)
+                    partitions = ingest.infection_partitions([selected_infection], [selected_year])
+                    results_html = fragment_cache.get('partials/b_level3_results.html', params) or ''
+                    if not results_html:
+                        avg_rate, results = db_executor.run_all(conn, [
+                            # Calculate global average infection rate per 100,000
+                            lambda c: query_cache.fetch(
+                                (backend.name, 'b_level3', 'average', selected_infection, selected_year),
+                                lambda: backend.b3_average(c, selected_infection, selected_year),
+                                partitions),
+
+                            # Countries with above-average infection rates, ranked once per
+                            # (infection type, year); any top_n is a slice
+                            lambda c: leaderboards.top(
+                                (backend.name, 'b_level3', selected_infection, selected_year), top_n,
+                                lambda: backend.b3_above_average(c, selected_infection, selected_year, None),
+                                'infection_per_100k', 'country', partitions),
+                        ], heavy=True)
+                        global_average = round(avg_rate, 2) if avg_rate else 0
+
+                        results_html = fragment_cache.render(
+                            'partials/b_level3_results.html', params, partitions,
+                            results=results,
+                            global_average=global_average,
+                            selected_year=selected_year)
                     
         except sqlite3.Error as e:
             error_message = f"Database query error: {e}"
@@ -507,22 +678,381 @@ def b_level3():
     else:
         error_message = "Unable to connect to database."
     
-    return render_template('b_level3.html',
+    return render_page('b_level3.html',
                          infection_types=infection_types,
                          years=years,
-                         results=results,
-                         global_average=global_average,
+                         results_html=results_html,
                          selected_infection=selected_infection,
                          selected_year=selected_year,
                          top_n=top_n,
                          error_message=error_message)
 
 
-# Application Entry Point
-if __name__ == '__main__':
-    # Run Flask development server (localhost)
-    app.run(host='127.0.0.1', port=5000, debug=True)
+# COUNTRY PROFILE - everything about one country from the per-country index
+
+@route('/country')
+@route('/country/<country_id>')
+def country(country_id=None):
+    """
+    Country profile: region, economy, population, and every antigen's coverage
+    and every infection type's cases per 100,000 by year. The selector submits
+    ?country=XXX, which redirects to /country/XXX.
+    """
+    if country_id is None and request.args.get('country'):
+        return redirect(url_for('country', country_id=request.args['country']))
+
+    countries = []
+    profile = None
+    results_html = ''
+    error_message = None
+    status = 200
+
+    try:
+        countries = country_index.countries()
+        if country_id:
+            profile = country_index.get(country_id)
+            if profile is None:
+                error_message = f"No country with code '{country_id}'."
+                status = 404
+            else:
+                # Spans every partition, so any data change drops it (no partition tags)
+                params = (profile.country_code,)
+                results_html = fragment_cache.get('partials/country_profile.html', params) or ''
+                if not results_html:
+                    antigens, coverage_rows = pivot(profile.coverage)
+                    _, infection_rows = pivot(profile.infections)
+                    results_html = fragment_cache.render(
+                        'partials/country_profile.html', params, None,
+                        profile=profile,
+                        antigens=antigens,
+                        coverage_rows=coverage_rows,
+                        infection_rows=infection_rows,
+                        population=dict(profile.population),
+                        latest_population=profile.population[-1] if profile.population else None)
+    except sqlite3.Error as e:
+        error_message = f"Database query error: {e}"
+        status = 500
 
+    return render_page('country.html',
+                         countries=countries,
+                         profile=profile,
+                         results_html=results_html,
+                         error_message=error_message), status
 
-if __name__ == "__main__":
-    app.run(debug=True)
+
+# Pool statistics
+
+@route('/stats/db')
+def db_stats():
+    """
+    Connection pool counters (hits, misses, open/idle connections) as JSON.
+    """
+    return jsonify(db_pool.stats())
+
+
+@route('/stats/cache')
+def cache_stats():
+    """
+    Cache counters (hits, misses, invalidations) and the current data version as JSON.
+    """
+    return jsonify({
+        'data_version': data_version.current(),
+        'reference_data': reference_data.stats(),
+        'country_index': country_index.stats(),
+        'query_results': query_cache.stats(),
+        'leaderboards': leaderboards.stats(),
+        'http': http_cache.stats(),
+        'compression': compression.stats(),
+        'fragments': fragment_cache.stats(),
+        'db_executor': db_executor.stats(),
+    })
+
+
+@route('/metrics')
+def metrics():
+    """
+    Query and request latency histograms, rows fetched, slow query counts and
+    pool/cache counters in Prometheus text format.
+    """
+    return Response(query_profiler.render(), mimetype='text/plain; version=0.0.4')
+
+
+# CLI: flask db ...
+
+db_cli = AppGroup('db', help='Database maintenance commands.')
+
+
+@db_cli.command('optimize')
+@click.option('--no-analyze', is_flag=True, help='Skip running ANALYZE after creating indexes.')
+@click.option('--rebuild', is_flag=True, help='Drop and recreate the route indexes.')
+@click.option('--check', is_flag=True, help='Exit with an error if any route query still scans a large table.')
+def db_optimize(no_analyze, rebuild, check):
+    """
+    Create covering indexes for every route's query pattern, run ANALYZE and
+    print EXPLAIN QUERY PLAN before/after for each route query.
+    """
+    db_path = current_app.config['DATABASE']
+    if rebuild:
+        conn = sqlite3.connect(db_path)
+        with conn:
+            db_indexes.drop_indexes(conn)
+        conn.close()
+
+    remaining = db_indexes.optimize(db_path, analyze=not no_analyze, echo=click.echo)
+
+    regressions = {name: scans for name, scans in remaining.items() if scans}
+    if regressions:
+        click.echo("\nQueries still doing full table scans:")
+        for name, scans in regressions.items():
+            click.echo(f"  {name}: {'; '.join(scans)}")
+        if check:
+            raise SystemExit(1)
+    else:
+        click.echo("\nAll route queries use an index.")
+
+
+@db_cli.command('materialise')
+@click.option('--full', is_flag=True, help='Rebuild every partition, not just the changed ones.')
+def db_materialise(full):
+    """
+    Build the aggregate tables (per-100k infection rates, per-year averages,
+    regional 90% coverage counts) read by the analysis pages. After the first
+    build only partitions whose source rows changed are rebuilt.
+    """
+    infection, coverage = aggregates.materialise(current_app.config['DATABASE'], full=full)
+    click.echo(f"Rebuilt {len(infection)} (inf_type, year) infection partition(s)")
+    click.echo(f"Rebuilt {len(coverage)} (antigen, year) coverage partition(s)")
+
+
+@db_cli.command('ingest')
+@click.argument('table', type=click.Choice(sorted(ingest.TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'jsonl']),
+              help='Extract format (default: from the file extension).')
+@click.option('--batch-size', default=ingest.BATCH_SIZE, show_default=True,
+              help='Rows written per transaction.')
+def db_ingest(table, path, fmt, batch_size):
+    """
+    Upsert a CSV/JSON extract into Vaccination, InfectionData or
+    CountryPopulation while the app keeps serving. Rows referencing unknown
+    countries, antigens or infection types are rejected. Only the aggregate
+    partitions and cached results the new rows touch are rebuilt.
+    """
+    try:
+        result = ingest.ingest(current_app.config['DATABASE'], table, path, fmt=fmt,
+                               batch_size=batch_size, echo=click.echo)
+    except (ValueError, sqlite3.Error) as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"Ingest {result.version}: {result.rows_read} rows read, {result.rows_inserted} inserted, "
+               f"{result.rows_updated} updated, {result.rows_rejected} rejected in {result.seconds:.2f}s")
+    for line_num, reason in result.rejects:
+        click.echo(f"  rejected line {line_num}: {reason}")
+    if result.rows_rejected > len(result.rejects):
+        click.echo(f"  ... and {result.rows_rejected - len(result.rejects)} more")
+    click.echo(f"Changed {len(result.partitions)} partition(s); "
+               f"rebuilt {result.aggregates_refreshed} aggregate partition(s)")
+
+
+@db_cli.command('snapshot')
+@click.option('--out', type=click.Path(dir_okay=False),
+              help='Snapshot file (default: COLUMNAR_SNAPSHOT, or the DB path with a .snapshot suffix).')
+@click.option('--check', is_flag=True, help='Only report whether the existing snapshot matches the DB.')
+@click.option('--verify', is_flag=True,
+              help='Like --check, and also compare the DB checksum and the CRC of every array.')
+def db_snapshot(out, check, verify):
+    """
+    Write the columnar store (typed arrays with dictionary-encoded codes and
+    precomputed per-100k rates) to a binary file that the numpy backend maps
+    at startup instead of loading the tables from SQLite.
+    """
+    db_path = current_app.config['DATABASE']
+    out = out or current_app.config['COLUMNAR_SNAPSHOT'] or os.path.splitext(db_path)[0] + '.snapshot'
+    if check or verify:
+        try:
+            if verify:
+                snapshot.verify(out, db_path)
+            else:
+                snapshot.check(out, db_path)
+        except (OSError, snapshot.SnapshotError) as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{out} matches {db_path}" + (" (checksum and CRC verified)" if verify else ""))
+        return
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        header = snapshot.export(conn, db_path, out)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+    click.echo(f"Wrote {out}: {os.path.getsize(out) / 1024:.0f}KB, {len(header['arrays'])} arrays, "
+               f"DB checksum {header['db_checksum'][:12]} in {time.perf_counter() - start:.2f}s")
+
+
+# App factory
+
+def _connection_pool(config, size, factory):
+    return ConnectionPool(
+        config['DATABASE'],
+        size=size,
+        read_only=config['DB_READ_ONLY'],
+        immutable=config['DB_IMMUTABLE'],
+        mmap_size=config['DB_MMAP_SIZE'],
+        cache_size=config['DB_CACHE_SIZE'],
+        health_check_interval=config['DB_HEALTH_CHECK_INTERVAL'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        factory=factory,
+    )
+
+
+def create_app(config=None):
+    """
+    Build the Flask app with its connection pools, caches and analytics
+    backends. `config` is a dict of settings overriding DEFAULT_CONFIG.
+    Reference data, templates and (if selected) the columnar store are
+    loaded here, so the first request doesn't pay for them.
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+
+    # Times every query run through the pool and every request, exported at /metrics
+    profiler = QueryProfiler(slow_query_ms=app.config['SLOW_QUERY_MS'],
+                             enabled=app.config['PROFILING_ENABLED'])
+    profiler.init_app(app)
+
+    pool = _connection_pool(app.config, app.config['DB_POOL_SIZE'], profiler.connection_class)
+    app.extensions['db_pool'] = pool
+    profiler.add_gauges('db_pool', pool.stats)
+
+    # Runs a page's independent queries at the same time, on its own connections
+    executor = DBExecutor(
+        _connection_pool(app.config, max(1, app.config['DB_EXECUTOR_WORKERS']), profiler.connection_class),
+        workers=app.config['DB_EXECUTOR_WORKERS'],
+        queue_size=app.config['DB_EXECUTOR_QUEUE_SIZE'],
+        timeout=app.config['DB_QUERY_TIMEOUT'],
+        queue_timeout=app.config['DB_EXECUTOR_QUEUE_TIMEOUT'],
+    )
+    app.extensions['db_executor'] = executor
+    profiler.add_gauges('db_executor', executor.stats)
+    app.register_error_handler(ExecutorBusy, executor_busy)
+
+    # Watches immunisation.db so caches know when to throw their contents away
+    version = DataVersion(app.config['DATABASE'],
+                          check_interval=app.config['DB_VERSION_CHECK_INTERVAL'])
+    app.extensions['data_version'] = version
+
+    # ETag / Last-Modified / Cache-Control on pages and API responses
+    HttpCache(app, version)
+    # gzip / brotli bodies, reused per ETag (after HttpCache, which computes the ETag)
+    Compression(app, version)
+
+    # Dropdown/reference lists, loaded once at startup and reloaded when the DB changes
+    references = ReferenceCache(pool.acquire, version)
+    app.extensions['reference_data'] = references
+    try:
+        references.get()
+    except sqlite3.Error as e:
+        print(f"Reference data not loaded at startup: {e}")
+
+    # Per-country profiles for /country/<CountryID>, built in one pass over each table
+    app.extensions['country_index'] = CountryIndex(pool.acquire, version)
+
+    # Results of the analysis queries, keyed on (route, filters)
+    results = QueryCache(version,
+                         maxsize=app.config['RESULT_CACHE_SIZE'],
+                         ttl=app.config['RESULT_CACHE_TTL'])
+    app.extensions['query_cache'] = results
+
+    # Rendered HTML of the results sections, keyed on (template, filters)
+    fragments = FragmentCache(version,
+                              max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'],
+                              compress=app.config['FRAGMENT_CACHE_COMPRESS'])
+    app.extensions['fragment_cache'] = fragments
+
+    # Ranked a_level3 / b_level3 lists, built on first request and kept
+    boards = Leaderboards(version, maxsize=app.config['LEADERBOARD_MAX_BOARDS'])
+    app.extensions['leaderboards'] = boards
+
+    profiler.add_gauges('query_cache', results.stats)
+    profiler.add_gauges('leaderboards', boards.stats)
+    profiler.add_gauges('fragment_cache', fragments.stats)
+
+    # Analysis backends: SQL against the DB, or NumPy arrays held in memory
+    backends = {'sqlite': SqliteBackend(version, use_aggregates=app.config['USE_AGGREGATES'])}
+    try:
+        backends['numpy'] = ColumnarBackend(version, snapshot_path=app.config['COLUMNAR_SNAPSHOT'])
+    except RuntimeError as e:
+        if app.config['ANALYTICS_BACKEND'] == 'numpy':
+            print(f"NumPy analytics backend unavailable, using SQLite: {e}")
+    app.extensions['analytics_backends'] = backends
+
+    # Load the arrays at startup rather than on the first request
+    if app.config['ANALYTICS_BACKEND'] == 'numpy' and 'numpy' in backends:
+        try:
+            with pool.acquire() as conn:
+                backends['numpy'].store(conn)
+        except sqlite3.Error as e:
+            print(f"Columnar store not loaded at startup: {e}")
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    # JSON/CSV API under /api/v1
+    app.register_blueprint(api)
+    app.cli.add_command(db_cli)
+
+    # Compile all templates now rather than on each page's first request
+    precompile_templates(app, app.config['TEMPLATE_BYTECODE_CACHE_DIR'])
+    return app
+
+
+def warm_up(app):
+    """
+    Get a process ready to serve: open every pooled connection (and read a
+    page through each) and make sure reference data and the country index
+    are loaded.
+    Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    for pool in (app.extensions['db_pool'], app.extensions['db_executor'].pool):
+        conns = []
+        try:
+            for _ in range(pool.size):
+                conn = pool.acquire()
+                conns.append(conn)
+                conn.execute("SELECT COUNT(*) FROM Country").fetchone()
+        except sqlite3.Error as e:
+            print(f"Warm-up could not open a connection: {e}")
+        finally:
+            for conn in conns:
+                conn.close()
+    try:
+        app.extensions['reference_data'].get()
+        # Built here rather than in create_app() so serve.py's master builds it once for every worker
+        app.extensions['country_index'].countries()
+    except sqlite3.Error as e:
+        print(f"Reference data not loaded during warm-up: {e}")
+    return time.perf_counter() - start
+
+
+def release_connections(app):
+    """
+    Close every SQLite connection the app holds. SQLite connections must not
+    be carried across fork(), so the launcher calls this before forking;
+    they are reopened on first use.
+    """
+    app.extensions['db_pool'].clear()
+    app.extensions['db_executor'].pool.clear()
+    app.extensions['data_version'].close()
+
+
+# Application Entry Point (development server; see serve.py for production)
+if __name__ == '__main__':
+    # Run Flask development server (localhost)
+    create_app().run(host='127.0.0.1', port=5000, debug=True)
@@ -0,0 +1,39 @@
+"""
+Optional ASGI entry point, for serving the app with an async server:
+
+    pip install asgiref uvicorn
+    uvicorn asgi:application --workers 4
+    uvicorn --factory asgi:create_asgi_app --workers 4   # same, built per worker
+
+The Flask views stay synchronous: sqlite3 has no async driver, so the event
+loop hands each request to asgiref's thread pool and is never blocked by a
+query. Within a request, the independent queries still run concurrently on
+the DB executor (see db_executor.py), with its backpressure and timeouts.
+
+asgiref is only imported when an ASGI app is built, so importing this module
+(or app.py) never needs it.
+"""
+
+from app import create_app
+
+
+def create_asgi_app(config=None):
+    """create_app(config) wrapped for ASGI servers."""
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError as e:
+        raise RuntimeError("The ASGI entry point needs asgiref (pip install asgiref)") from e
+    return WsgiToAsgi(create_app(config))
+
+
+_application = None
+
+
+def __getattr__(name):
+    # `asgi:application` is built on first use rather than at import
+    global _application
+    if name != 'application':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _application is None:
+        _application = create_asgi_app()
+    return _application
@@ -0,0 +1,473 @@
+"""
+Benchmark / load-test harness for every route in app.py.
+
+Drives the app through Flask's test client, so no server is needed:
+
+    python benchmark.py run --out before.json
+    python benchmark.py run --workers 8 --mode thread --db big.db --out big.json
+    python benchmark.py synth --scale 10 --out big.db
+    python benchmark.py compare before.json after.json
+
+`run` sends GET requests to every route, plus GET and POST requests across
+a grid of year / antigen / infection type / economy / top_n values for the
+routes that take parameters. For each route it reports p50/p95/p99 latency,
+throughput and peak Python memory (tracemalloc). Results are saved as JSON
+so two runs can be compared with `compare`.
+
+`synth` writes a scaled-up copy of immunisation.db with the same schema:
+every country is cloned `scale` times with its population, vaccination
+and infection rows, and the numbers are jittered by up to +/-10%
+(coverage stays within 0-100%).
+"""
+
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+# Parameters each route takes; routes not listed here are only requested
+# without parameters. Values come from the DB (see parameter_values()).
+ROUTE_PARAMS = {
+    '/a_level2': ('year', 'antigen'),
+    '/a_level3': ('start_year', 'end_year', 'antigen', 'top_n'),
+    '/b_level2': ('economy', 'infection_type', 'year'),
+    '/b_level3': ('infection_type', 'year', 'top_n'),
+    '/api/v1/coverage': ('year', 'antigen'),
+    '/api/v1/coverage/regions': ('year', 'antigen'),
+    '/api/v1/improvement': ('start_year', 'end_year', 'antigen'),
+    '/api/v1/infections': ('economy', 'infection_type', 'year'),
+    '/api/v1/infections/summary': ('infection_type', 'year'),
+    '/api/v1/infections/above-average': ('infection_type', 'year', 'top_n'),
+    '/api/v1/rollup/coverage': ('year', 'antigen'),
+    '/api/v1/rollup/infections': ('infection_type', 'year'),
+    '/api/v1/coverage/trend': ('antigen',),
+    '/api/v1/coverage/trend/summary': ('antigen',),
+    '/api/v1/coverage/most-improved': ('antigen', 'top_n'),
+    '/api/v1/infections/trend': ('infection_type',),
+    '/api/v1/infections/trend/summary': ('infection_type',),
+    '/api/v1/leaderboard/improvement': ('start_year', 'end_year', 'antigen', 'top_n'),
+    '/api/v1/leaderboard/above-average': ('infection_type', 'year', 'top_n'),
+}
+
+# API endpoints that return 400 without their parameters (no bare request)
+REQUIRES_PARAMS = ('/api/v1/improvement', '/api/v1/infections/above-average',
+                   '/api/v1/coverage/trend', '/api/v1/coverage/trend/summary',
+                   '/api/v1/coverage/most-improved', '/api/v1/infections/trend',
+                   '/api/v1/infections/trend/summary', '/api/v1/leaderboard/improvement',
+                   '/api/v1/leaderboard/above-average')
+
+# Pages whose forms submit parameters (these also get POST requests)
+FORM_ROUTES = ('/a_level2', '/a_level3', '/b_level2', '/b_level3')
+
+# Not benchmarked: counters only, and their cost isn't interesting
+SKIP_PREFIXES = ('/static', '/stats', '/metrics')
+
+TOP_N_VALUES = (5, 10, 50)
+
+
+def _load_app(db_path):
+    """An app built by create_app(), for db_path if given (else app.py's DATABASE)."""
+    from app import create_app
+    if db_path:
+        return create_app({'DATABASE': os.path.abspath(db_path)})
+    return create_app()
+
+
+def parameter_values(conn, per_param=3):
+    """
+    A representative handful of values for every route parameter: the
+    oldest, middle and newest years, and the first few antigens, infection
+    types and economy phases.
+    """
+    def spread(values):
+        if len(values) <= per_param:
+            return values
+        step = (len(values) - 1) / (per_param - 1)
+        return [values[round(i * step)] for i in range(per_param)]
+
+    def column(sql):
+        return [row[0] for row in conn.execute(sql)]
+
+    vaccination_years = column("SELECT DISTINCT year FROM Vaccination ORDER BY year")
+    return {
+        'year': spread(vaccination_years),
+        'start_year': vaccination_years[:1],
+        'end_year': vaccination_years[-1:],
+        'antigen': column("SELECT DISTINCT antigen FROM Vaccination ORDER BY antigen")[:per_param],
+        'infection_type': column("SELECT id FROM Infection_Type ORDER BY id")[:per_param],
+        'economy': column("SELECT phase FROM Economy ORDER BY economyID")[:per_param],
+        'top_n': list(TOP_N_VALUES),
+    }
+
+
+def request_grid(flask_app, values):
+    """
+    Every request to make as (route name, method, path, params).
+    Route names are "<METHOD> <path>", the unit results are reported in.
+    """
+    paths = sorted({
+        rule.rule for rule in flask_app.url_map.iter_rules()
+        if 'GET' in rule.methods and not rule.arguments
+        and not rule.rule.startswith(SKIP_PREFIXES)
+    })
+
+    grid = []
+    for path in paths:
+        if path not in REQUIRES_PARAMS:
+            grid.append((f"GET {path}", 'GET', path, {}))
+        names = ROUTE_PARAMS.get(path)
+        if not names:
+            continue
+        for combo in itertools.product(*(values[name] for name in names)):
+            params = dict(zip(names, combo))
+            grid.append((f"GET {path} [filtered]", 'GET', path, params))
+            if path in FORM_ROUTES:
+                grid.append((f"POST {path}", 'POST', path, params))
+    return grid
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _Runner:
+    """Sends requests through one app's test client and times them."""
+
+    def __init__(self, flask_app, cold=False):
+        self.flask_app = flask_app
+        self.cold = cold
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        return client
+
+    def send(self, method, path, params):
+        """Returns (seconds, ok)."""
+        if self.cold:
+            # Measure the queries and rendering, not the in-process caches
+            self.flask_app.extensions['query_cache'].clear()
+            self.flask_app.extensions['fragment_cache'].clear()
+        client = self._client()
+        start = time.perf_counter()
+        if method == 'POST':
+            response = client.post(path, data=params)
+        else:
+            response = client.get(path, query_string=params)
+        # Streamed API responses only do their work when read
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code < 400
+
+    def run_batch(self, requests, workers):
+        """
+        Send a batch of (method, path, params) with `workers` threads.
+        Returns (latencies, errors, wall seconds, peak traced bytes).
+        The peak is measured from what was already allocated before the batch.
+        """
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda r: self.send(*r), requests))
+        else:
+            results = [self.send(*r) for r in requests]
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        latencies = [elapsed for elapsed, _ in results]
+        errors = sum(1 for _, ok in results if not ok)
+        return latencies, errors, wall, peak
+
+
+def _process_worker(args):
+    """Entry point for --mode process: runs one share of every route's requests."""
+    db_path, batches, cold, warmup = args
+    runner = _Runner(_load_app(db_path), cold=cold)
+    if warmup:
+        for requests in batches.values():
+            if requests:
+                runner.send(*requests[0])
+    tracemalloc.start()
+    results = {name: runner.run_batch(requests, 1) for name, requests in batches.items()}
+    tracemalloc.stop()
+    return results
+
+
+def _summarise(latencies, errors, wall, peak):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmark(db_path=None, repeat=5, workers=1, mode='thread', cold=False,
+                  warmup=True, routes=None, echo=print):
+    """
+    Benchmark every route and return the results as a dict (see module docstring).
+    routes: optional list of substrings; only matching route names are run.
+    """
+    flask_app = _load_app(db_path)
+    db_file = flask_app.config['DATABASE']
+
+    conn = sqlite3.connect(db_file)
+    try:
+        values = parameter_values(conn)
+    finally:
+        conn.close()
+
+    batches = {}
+    for name, method, path, params in request_grid(flask_app, values):
+        if routes and not any(pattern in name for pattern in routes):
+            continue
+        batches.setdefault(name, []).append((method, path, params))
+    batches = {name: requests * repeat for name, requests in batches.items()}
+
+    runner = _Runner(flask_app, cold=cold)
+    if warmup:
+        # One pass so startup work (template compile, first queries) isn't timed
+        for requests in batches.values():
+            for request in requests[:len(requests) // repeat]:
+                runner.send(*request)
+
+    results = {}
+    if mode == 'process' and workers > 1:
+        # Deal each route's requests round-robin to the worker processes
+        shares = [{name: requests[i::workers] for name, requests in batches.items()}
+                  for i in range(workers)]
+        context = multiprocessing.get_context('spawn')
+        start = time.perf_counter()
+        with context.Pool(workers) as pool:
+            per_worker = pool.map(_process_worker, [(db_path, share, cold, warmup) for share in shares])
+        total_wall = time.perf_counter() - start
+        for name in batches:
+            latencies, errors, wall, peak = [], 0, 0.0, 0
+            for worker_results in per_worker:
+                w_latencies, w_errors, w_wall, w_peak = worker_results[name]
+                latencies += w_latencies
+                errors += w_errors
+                # Workers run in parallel, so the route took as long as the slowest one
+                wall = max(wall, w_wall)
+                peak = max(peak, w_peak)
+            results[name] = _summarise(latencies, errors, wall, peak)
+            echo(_format_line(name, results[name]))
+    else:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for name, requests in batches.items():
+            results[name] = _summarise(*runner.run_batch(requests, workers))
+            echo(_format_line(name, results[name]))
+        total_wall = time.perf_counter() - start
+        tracemalloc.stop()
+
+    total_requests = sum(r['requests'] for r in results.values())
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': os.path.abspath(db_file),
+            'database_bytes': os.path.getsize(db_file),
+            'analytics_backend': flask_app.config['ANALYTICS_BACKEND'],
+            'mode': mode,
+            'workers': workers,
+            'repeat': repeat,
+            'cold': cold,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'total_requests': total_requests,
+            'total_seconds': round(total_wall, 3),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'routes': results,
+    }
+
+
+def _format_line(name, result):
+    return (f"{name:<45} n={result['requests']:<6} p50={result['p50_ms']}ms "
+            f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+            f"{result['throughput_rps']} req/s peak={result['peak_memory_kb']}KB"
+            + (f" errors={result['errors']}" if result['errors'] else ""))
+
+
+def compare_results(before, after, threshold=0.10, metric='p95_ms'):
+    """
+    Per-route change in `metric` between two runs.
+    Returns a list of (route, before, after, relative change, regressed).
+    """
+    rows = []
+    for name in sorted(set(before['routes']) | set(after['routes'])):
+        old = before['routes'].get(name, {}).get(metric)
+        new = after['routes'].get(name, {}).get(metric)
+        if old is None or new is None:
+            rows.append((name, old, new, None, False))
+            continue
+        change = (new - old) / old if old else 0.0
+        # Throughput regresses when it goes down, latency when it goes up
+        regressed = -change > threshold if metric == 'throughput_rps' else change > threshold
+        rows.append((name, old, new, change, regressed))
+    return rows
+
+
+# Synthetic data
+
+def _jitter(rng, high=None):
+    """Scales numbers by a random 0.9-1.1, capped at high if given."""
+    def jitter(value):
+        # Blank coverage strings ('') are kept as they are
+        if not isinstance(value, (int, float)):
+            return value
+        value = max(round(value * rng.uniform(0.9, 1.1), 2), 0)
+        return value if high is None else min(value, high)
+    return jitter
+
+
+def generate_synthetic_db(source, target, scale=10, seed=0):
+    """
+    Write a copy of source to target with every country cloned so the
+    Country, CountryPopulation, Vaccination and InfectionData tables have
+    `scale` times as many rows. Clone k of country ABW is "ABW<k>", named
+    "Aruba <k>". Returns {table: row count} for the new DB.
+    """
+    import aggregates
+
+    if os.path.exists(target):
+        os.remove(target)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        rng = random.Random(seed)
+        dst.create_function('jitter', 1, _jitter(rng), deterministic=False)
+        # A coverage over 100% can't happen and would inflate the 90% target counts
+        dst.create_function('jitter_coverage', 1, _jitter(rng, high=100), deterministic=False)
+
+        # Aggregate triggers would log every inserted row; rebuild afterwards instead
+        materialised = aggregates.is_materialised(dst)
+        triggers = [name for (name,) in dst.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+        with dst:
+            for name in triggers:
+                dst.execute(f"DROP TRIGGER {name}")
+
+            for k in range(2, scale + 1):
+                dst.execute("""
+                    INSERT INTO Country (CountryID, name, region, economy)
+                    SELECT CountryID || :k, name || ' ' || :k, region, economy FROM Country
+                    WHERE length(CountryID) = 3
+                """, {'k': k})
+                dst.execute("""
+                    INSERT INTO CountryPopulation (country, year, population)
+                    SELECT country || :k, year, jitter(population) FROM CountryPopulation
+                    WHERE length(country) = 3
+                """, {'k': k})
+                dst.execute("""
+                    INSERT INTO Vaccination (inf_type, antigen, country, year, target_num, doses, coverage)
+                    SELECT inf_type, antigen, country || :k, year,
+                           jitter(target_num), jitter(doses), jitter_coverage(coverage)
+                    FROM Vaccination WHERE length(country) = 3
+                """, {'k': k})
+                dst.execute("""
+                    INSERT INTO InfectionData (inf_type, country, year, cases)
+                    SELECT inf_type, country || :k, year, jitter(cases) FROM InfectionData
+                    WHERE length(country) = 3
+                """, {'k': k})
+        counts = {table: dst.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('Country', 'CountryPopulation', 'Vaccination', 'InfectionData')}
+    finally:
+        dst.close()
+        src.close()
+
+    if materialised:
+        aggregates.materialise(target, full=True)
+    return counts
+
+
+# CLI
+
+@click.group()
+def cli():
+    """Benchmark the app's routes or generate a larger test database."""
+
+
+@cli.command('run')
+@click.option('--db', 'db_path', default=None, help='Database to benchmark (default: app.py DATABASE).')
+@click.option('--repeat', default=5, show_default=True, help='Times each request in the grid is sent.')
+@click.option('--workers', default=1, show_default=True, help='Concurrent threads or processes.')
+@click.option('--mode', type=click.Choice(['thread', 'process']), default='thread', show_default=True)
+@click.option('--cold', is_flag=True, help='Clear the result and fragment caches before every request.')
+@click.option('--no-warmup', is_flag=True, help='Time the first pass too.')
+@click.option('--route', 'routes', multiple=True, help='Only run routes whose name contains this (repeatable).')
+@click.option('--out', default=None, help='Write the results to this JSON file.')
+def run_command(db_path, repeat, workers, mode, cold, no_warmup, routes, out):
+    """Benchmark every route and print p50/p95/p99, throughput and memory."""
+    results = run_benchmark(db_path, repeat=repeat, workers=workers, mode=mode, cold=cold,
+                            warmup=not no_warmup, routes=routes, echo=click.echo)
+    meta = results['meta']
+    click.echo(f"\n{meta['total_requests']} requests in {meta['total_seconds']}s "
+               f"({mode}, {workers} worker(s))")
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        click.echo(f"Results written to {out}")
+
+
+@cli.command('compare')
+@click.argument('before', type=click.File())
+@click.argument('after', type=click.File())
+@click.option('--metric', default='p95_ms', show_default=True,
+              type=click.Choice(['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'throughput_rps', 'peak_memory_kb']))
+@click.option('--threshold', default=0.10, show_default=True, help='Relative change counted as a regression.')
+def compare_command(before, after, metric, threshold):
+    """Compare two result files; exits 1 if any route regressed."""
+    rows = compare_results(json.load(before), json.load(after), threshold=threshold, metric=metric)
+    regressions = 0
+    for name, old, new, change, regressed in rows:
+        change_text = f"{change:+.1%}" if change is not None else 'n/a'
+        flag = '  REGRESSION' if regressed else ''
+        click.echo(f"{name:<45} {old!s:>10} -> {new!s:<10} {change_text:>8}{flag}")
+        regressions += regressed
+    if regressions:
+        click.echo(f"\n{regressions} route(s) regressed by more than {threshold:.0%} on {metric}")
+        sys.exit(1)
+
+
+@cli.command('synth')
+@click.option('--source', default='immunisation.db', show_default=True)
+@click.option('--out', required=True, help='Path of the database to create (overwritten).')
+@click.option('--scale', default=10, show_default=True, help='Row multiplier, e.g. 10 or 100.')
+@click.option('--seed', default=0, show_default=True)
+def synth_command(source, out, scale, seed):
+    """Generate a scaled-up copy of the database with the same schema."""
+    counts = generate_synthetic_db(source, out, scale=scale, seed=seed)
+    for table, count in counts.items():
+        click.echo(f"{table}: {count} rows")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,453 @@
+"""
+Columnar in-memory analytics backend (NumPy).
+
+Vaccination, InfectionData and CountryPopulation are loaded once into NumPy
+arrays, with country / antigen / inf_type codes dictionary-encoded to small
+ints. Rows are sorted by (antigen, year) and (inf_type, year) so each
+route's filter is an O(1) slice lookup, and the rest of the work (coverage
+deltas, per-100k rates, top-N via argpartition, above-average selection) is
+vectorised. Results come back as the same named tuples the SQLite backend
+returns, so the two can be swapped behind the routes and compared.
+
+The arrays can also be mapped from a `flask db snapshot` file (snapshot.py)
+instead of being rebuilt from SQLite rows in every process.
+
+NumPy is optional: ColumnarBackend raises RuntimeError if it isn't installed.
+"""
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+import snapshot
+from aggregates import UNASSIGNED
+from result_cache import row_type
+
+COVERAGE_TARGET = 90
+
+# Same column names as the SQL in queries.py
+A2_COUNTRY_ROW = row_type(('antigen', 'year', 'country_name', 'region', 'coverage'))
+A2_REGION_ROW = row_type(('antigen', 'year', 'region', 'country_count'))
+A2_BATCH_ROW = row_type(('antigen', 'year', 'country_code', 'country_name', 'region', 'coverage'))
+A3_SERIES_ROW = row_type(('country_code', 'country_name', 'antigen', 'year', 'coverage'))
+A3_ROW = row_type(('country_name', 'rate_increase', 'start_coverage', 'end_coverage',
+                   'start_year', 'end_year'))
+B2_DETAILED_ROW = row_type(('disease', 'country', 'economic_phase', 'year',
+                            'cases_per_100k', 'total_cases'))
+B2_SUMMARY_ROW = row_type(('disease', 'economic_phase', 'year', 'total_cases', 'country_count'))
+B3_ROW = row_type(('country', 'infection_type', 'infection_per_100k', 'year', 'total_cases'))
+
+
+def _to_int(value):
+    """Form values arrive as strings; anything that isn't a number matches nothing."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _nullable(value):
+    """NaN back to None (SQL NULL) and NumPy scalars to plain Python values."""
+    value = value.item() if hasattr(value, 'item') else value
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _number(value):
+    """
+    REAL column value as a float. NULL and the blank strings some extract rows
+    carry in place of a number are both treated as missing (NaN).
+    """
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+def _top(values, names, limit):
+    """
+    Indexes of the `limit` largest values, highest first and ties by name,
+    as ORDER BY value DESC, name LIMIT limit. Only the values that can make
+    the cut (every tie at the boundary included) are sorted.
+    """
+    if limit <= 0 or not len(values):
+        return []
+    if limit < len(values):
+        cutoff = np.partition(values, len(values) - limit)[len(values) - limit]
+        candidates = np.flatnonzero(values >= cutoff).tolist()
+    else:
+        candidates = range(len(values))
+    return sorted(candidates, key=lambda i: (-values[i], names[i]))[:limit]
+
+
+def _partitions(*keys):
+    """
+    Sort order for the given key columns plus {(key, ...): (start, end)} slices
+    into the sorted arrays, one entry per distinct key combination.
+    """
+    order = np.lexsort(tuple(reversed(keys)))
+    sorted_keys = [k[order] for k in keys]
+    n = len(order)
+    if n == 0:
+        return order, {}
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for k in sorted_keys:
+        change[1:] |= k[1:] != k[:-1]
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], n)
+    slices = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        slices[tuple(k[start].item() for k in sorted_keys)] = (start, end)
+    return order, slices
+
+
+class ColumnarStore:
+    """
+    Immutable snapshot of the analysis tables as NumPy arrays.
+    Build with ColumnarStore.load(conn), or snapshot.load(path, db_path).
+    """
+
+    @classmethod
+    def load(cls, conn):
+        store = cls()
+        cursor = conn.cursor()
+
+        # Dictionaries (code -> int)
+        countries = cursor.execute(
+            "SELECT CountryID, name, region, economy FROM Country ORDER BY CountryID").fetchall()
+        regions = dict(cursor.execute("SELECT RegionID, region FROM Region").fetchall())
+        economies = dict(cursor.execute("SELECT economyID, phase FROM Economy").fetchall())
+        infection_types = dict(cursor.execute("SELECT id, description FROM Infection_Type").fetchall())
+
+        vaccination = cursor.execute(
+            "SELECT antigen, country, year, coverage FROM Vaccination").fetchall()
+        infection = cursor.execute(
+            "SELECT inf_type, country, year, cases FROM InfectionData").fetchall()
+        population = cursor.execute(
+            "SELECT country, year, population FROM CountryPopulation").fetchall()
+
+        country_ids = sorted({row[0] for row in countries}
+                             | {row[1] for row in vaccination}
+                             | {row[1] for row in infection}
+                             | {row[0] for row in population})
+        store.country_codes = {cid: i for i, cid in enumerate(country_ids)}
+        store.country_ids = country_ids
+        n_countries = len(country_ids)
+
+        # Per-country attributes; countries missing from the Country table have
+        # no name, matching what an INNER JOIN Country would drop
+        store.country_name = np.empty(n_countries, dtype=object)
+        store.in_country_table = np.zeros(n_countries, dtype=bool)
+        store.country_region = np.empty(n_countries, dtype=object)  # region name or UNASSIGNED
+        store.country_economy = np.empty(n_countries, dtype=object)  # economy phase or None
+        for cid, name, region, economy in countries:
+            code = store.country_codes[cid]
+            store.country_name[code] = name
+            store.in_country_table[code] = True
+            store.country_region[code] = regions.get(region, UNASSIGNED)
+            store.country_economy[code] = economies.get(economy)
+
+        store.infection_descriptions = infection_types
+
+        # Vaccination, sorted and sliced by (antigen, year)
+        antigen_ids = sorted({row[0] for row in vaccination})
+        store.antigen_codes = {a: i for i, a in enumerate(antigen_ids)}
+        store.antigen_ids = antigen_ids
+        v_antigen = np.array([store.antigen_codes[r[0]] for r in vaccination], dtype=np.int16)
+        v_country = np.array([store.country_codes[r[1]] for r in vaccination], dtype=np.int32)
+        v_year = np.array([r[2] for r in vaccination], dtype=np.int32)
+        v_coverage = np.array([_number(r[3]) for r in vaccination], dtype=np.float64)
+        order, store.vaccination_slices = _partitions(v_antigen, v_year)
+        store.v_country = v_country[order]
+        store.v_coverage = v_coverage[order]
+
+        # Population as a dense (country, year) grid; NaN = NULL population
+        years = [r[1] for r in population] + [r[2] for r in infection]
+        store.year0 = min(years) if years else 0
+        n_years = (max(years) - store.year0 + 1) if years else 0
+        store.population = np.full((n_countries, n_years), np.nan)
+        store.has_population = np.zeros((n_countries, n_years), dtype=bool)
+        for cid, year, pop in population:
+            code = store.country_codes[cid]
+            store.has_population[code, year - store.year0] = True
+            store.population[code, year - store.year0] = _number(pop)
+
+        # InfectionData, sorted and sliced by (inf_type, year), with the
+        # per-100k rate precomputed for every row
+        inf_type_ids = sorted({row[0] for row in infection})
+        store.inf_type_codes = {t: i for i, t in enumerate(inf_type_ids)}
+        store.inf_type_ids = inf_type_ids
+        i_type = np.array([store.inf_type_codes[r[0]] for r in infection], dtype=np.int16)
+        i_country = np.array([store.country_codes[r[1]] for r in infection], dtype=np.int32)
+        i_year = np.array([r[2] for r in infection], dtype=np.int32)
+        i_cases = np.array([_number(r[3]) for r in infection], dtype=np.float64)
+        order, store.infection_slices = _partitions(i_type, i_year)
+        store.i_country = i_country[order]
+        store.i_cases = i_cases[order]
+        i_year = i_year[order]
+        year_index = i_year - store.year0
+        store.i_has_population = store.has_population[store.i_country, year_index]
+        pop = store.population[store.i_country, year_index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = store.i_cases * 100000.0 / pop
+        # x / 0 is NULL in SQLite
+        rate[~np.isfinite(rate)] = np.nan
+        store.i_rate = rate
+        return store
+
+    def vaccination(self, antigen, year):
+        """(country codes, coverage) for one (antigen, year), or None."""
+        code = self.antigen_codes.get(antigen)
+        year = _to_int(year)
+        bounds = self.vaccination_slices.get((code, year))
+        if bounds is None:
+            return None
+        start, end = bounds
+        return self.v_country[start:end], self.v_coverage[start:end]
+
+    def infection(self, inf_type, year):
+        """(country codes, cases, rate, has_population) for one (inf_type, year), or None."""
+        code = self.inf_type_codes.get(inf_type)
+        year = _to_int(year)
+        bounds = self.infection_slices.get((code, year))
+        if bounds is None:
+            return None
+        start, end = bounds
+        return (self.i_country[start:end], self.i_cases[start:end],
+                self.i_rate[start:end], self.i_has_population[start:end])
+
+
+class ColumnarBackend:
+    """
+    Answers the analysis queries from a ColumnarStore.
+    Methods take the same arguments as SqliteBackend; the connection argument
+    is only used to (re)load the arrays when the DB has changed.
+
+    With `snapshot_path` set the arrays are mapped from that snapshot file,
+    falling back to loading them from SQLite while it is stale or unreadable.
+    """
+
+    name = 'numpy'
+
+    def __init__(self, data_version, snapshot_path=None):
+        if np is None:
+            raise RuntimeError("The numpy analytics backend requires NumPy (pip install numpy)")
+        self._data_version = data_version
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._store = None
+        self._store_version = None
+        self.loads = 0
+        self.snapshot_loads = 0
+        data_version.on_change(self.invalidate)
+
+    def invalidate(self, version=None):
+        self._store = None
+
+    def store(self, conn):
+        """Current ColumnarStore, (re)loading it from conn if the DB has changed."""
+        version = self._data_version.current()
+        store = self._store
+        if store is not None and self._store_version == version:
+            return store
+        with self._lock:
+            if self._store is None or self._store_version != version:
+                self._store = self._load(conn)
+                self._store_version = version
+                self.loads += 1
+            return self._store
+
+    def _load(self, conn):
+        if self.snapshot_path:
+            try:
+                store = snapshot.load(self.snapshot_path, self._data_version.db_path)
+                self.snapshot_loads += 1
+                return store
+            except (OSError, snapshot.SnapshotError) as e:
+                print(f"Columnar snapshot not used, loading from SQLite: {e}")
+        return ColumnarStore.load(conn)
+
+    # A-Level 2
+
+    def _a2_passing(self, store, year, antigen):
+        """Country codes with >= 90% coverage that survive the Country join."""
+        data = store.vaccination(antigen, year)
+        if data is None:
+            return None, None
+        country, coverage = data
+        keep = coverage >= COVERAGE_TARGET
+        keep &= store.in_country_table[country]
+        return country[keep], coverage[keep]
+
+    def a2_countries(self, conn, year, antigen):
+        store = self.store(conn)
+        country, coverage = self._a2_passing(store, year, antigen)
+        if country is None or not len(country):
+            return []
+        names = store.country_name[country]
+        # ORDER BY coverage DESC, name
+        order = sorted(range(len(country)), key=lambda i: (-coverage[i], names[i]))
+        year = _to_int(year)
+        return [A2_COUNTRY_ROW(antigen, year, names[i], store.country_region[country[i]],
+                               float(coverage[i]))
+                for i in order]
+
+    def a2_regions(self, conn, year, antigen):
+        store = self.store(conn)
+        country, _coverage = self._a2_passing(store, year, antigen)
+        if country is None or not len(country):
+            return []
+        counts = {}
+        for region, code in zip(store.country_region[country], country.tolist()):
+            counts.setdefault(region, set()).add(code)
+        year = _to_int(year)
+        rows = [A2_REGION_ROW(antigen, year, region, len(codes)) for region, codes in counts.items()]
+        rows.sort(key=lambda row: (-row.country_count, row.region))
+        return rows
+
+    # A-Level 3
+
+    def a3_improvement(self, conn, start_year, end_year, antigen, limit):
+        store = self.store(conn)
+        start = store.vaccination(antigen, start_year)
+        end = store.vaccination(antigen, end_year)
+        if start is None or end is None:
+            return []
+        start_country, start_cov = start
+        end_country, end_cov = end
+
+        # Line both years up by country code
+        end_by_country = np.full(len(store.country_name), np.nan)
+        end_by_country[end_country] = end_cov
+        matched_end = end_by_country[start_country]
+
+        keep = (matched_end > start_cov) & store.in_country_table[start_country]
+        country = start_country[keep]
+        start_cov = start_cov[keep]
+        end_cov = matched_end[keep]
+        increase = end_cov - start_cov
+        if not len(increase):
+            return []
+
+        # Top-N without sorting everything (ORDER BY rate_increase DESC, name)
+        limit = len(increase) if limit is None else _to_int(limit) or 0
+        names = store.country_name[country]
+        return [A3_ROW(names[i], float(increase[i]),
+                       float(start_cov[i]), float(end_cov[i]),
+                       start_year, end_year)
+                for i in _top(increase, names, limit)]
+
+    # Batch comparisons
+
+    def a2_countries_batch(self, conn, years, antigens):
+        store = self.store(conn)
+        rows = []
+        for antigen in antigens:
+            for year in years:
+                country, coverage = self._a2_passing(store, year, antigen)
+                if country is None:
+                    continue
+                year = _to_int(year)
+                rows += [A2_BATCH_ROW(antigen, year, store.country_ids[code], store.country_name[code],
+                                      store.country_region[code], value)
+                         for code, value in zip(country.tolist(), coverage.tolist())]
+        # ORDER BY name, antigen, year
+        rows.sort(key=lambda row: (row.country_name, row.antigen, row.year))
+        return rows
+
+    def a3_coverage_series(self, conn, years, antigens):
+        store = self.store(conn)
+        rows = []
+        for antigen in antigens:
+            for year in years:
+                data = store.vaccination(antigen, year)
+                if data is None:
+                    continue
+                country, coverage = data
+                keep = store.in_country_table[country] & ~np.isnan(coverage)
+                year = _to_int(year)
+                rows += [A3_SERIES_ROW(store.country_ids[code], store.country_name[code], antigen, year, value)
+                         for code, value in zip(country[keep].tolist(), coverage[keep].tolist())]
+        rows.sort(key=lambda row: (row.country_name, row.antigen, row.year))
+        return rows
+
+    # B-Level 2
+
+    def b2_detailed(self, conn, economy, inf_type, year):
+        store = self.store(conn)
+        data = store.infection(inf_type, year)
+        if data is None or inf_type not in store.infection_descriptions:
+            return []
+        country, cases, rate, has_pop = data
+        keep = has_pop & store.in_country_table[country] & (store.country_economy[country] == economy)
+        country, cases, rate = country[keep], cases[keep], rate[keep]
+
+        # ORDER BY cases_per_100k DESC (NULLs last), name
+        rounded = [None if r != r else round(r, 2) for r in rate.tolist()]
+        names = store.country_name[country]
+        order = sorted(range(len(rounded)),
+                       key=lambda i: (rounded[i] is None, -(rounded[i] or 0), names[i]))
+        disease = store.infection_descriptions[inf_type]
+        year = _to_int(year)
+        return [B2_DETAILED_ROW(disease, names[i], economy, year,
+                                rounded[i], _nullable(cases[i]))
+                for i in order]
+
+    def b2_summary(self, conn, inf_type, year):
+        store = self.store(conn)
+        data = store.infection(inf_type, year)
+        if data is None or inf_type not in store.infection_descriptions:
+            return []
+        country, cases, _rate, _has_pop = data
+        phases = store.country_economy[country]
+        phases[phases == None] = UNASSIGNED  # noqa: E711 (elementwise)
+        keep = store.in_country_table[country]
+        groups = {}
+        for phase, code, value in zip(phases[keep], country[keep].tolist(), cases[keep].tolist()):
+            total, codes = groups.get(phase, (None, set()))
+            if value == value:  # SUM ignores NULLs
+                total = value if total is None else total + value
+            codes.add(code)
+            groups[phase] = (total, codes)
+
+        disease = store.infection_descriptions[inf_type]
+        year = _to_int(year)
+        rows = [B2_SUMMARY_ROW(disease, phase, year, total, len(codes))
+                for phase, (total, codes) in groups.items()]
+        rows.sort(key=lambda row: (row.total_cases is None, -(row.total_cases or 0), row.economic_phase))
+        return rows
+
+    # B-Level 3
+
+    def b3_average(self, conn, inf_type, year):
+        store = self.store(conn)
+        data = store.infection(inf_type, year)
+        if data is None:
+            return None
+        _country, _cases, rate, has_pop = data
+        rates = rate[has_pop]
+        rates = rates[~np.isnan(rates)]
+        return float(rates.mean()) if len(rates) else None
+
+    def b3_above_average(self, conn, inf_type, year, limit):
+        store = self.store(conn)
+        average = self.b3_average(conn, inf_type, year)
+        data = store.infection(inf_type, year)
+        if average is None or data is None or inf_type not in store.infection_descriptions:
+            return []
+        country, cases, rate, has_pop = data
+        keep = has_pop & store.in_country_table[country] & (rate > average)
+        country, cases, rate = country[keep], cases[keep], rate[keep]
+
+        # ORDER BY infection_per_100k DESC, name: ranked on the rounded rate, as shown
+        limit = len(rate) if limit is None else _to_int(limit) or 0
+        rounded = np.array([round(r, 2) for r in rate.tolist()])
+        names = store.country_name[country]
+
+        description = store.infection_descriptions[inf_type]
+        year = _to_int(year)
+        return [B3_ROW(names[i], description, float(rounded[i]),
+                       year, _nullable(cases[i]))
+                for i in _top(rounded, names, limit)]
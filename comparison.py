@@ -0,0 +1,120 @@
+"""
+Comparison tables for several years / antigens at once.
+
+a_level2 and a_level3 normally answer one (year, antigen) or one antigen per
+request, so comparing them meant one request (and one set of joins) each.
+In comparison mode the backend fetches every selected combination with one
+grouped query (a2_countries_batch / a3_coverage_series) and the rows are
+pivoted here into a country x (antigen, year) matrix:
+
+- coverage_matrix(): a_level2, coverage where the 90% target is met, plus the
+  number of countries meeting it per region in each column
+- improvement_matrix(): a_level3, coverage in each selected year and the
+  change between the first and last, ranked by the biggest improvement
+"""
+
+from collections import namedtuple
+
+# Upper bound on the columns one comparison may ask for
+MAX_COLUMNS = 60
+
+CoverageMatrix = namedtuple('CoverageMatrix', ('columns', 'rows', 'regions'))
+CoverageRow = namedtuple('CoverageRow', ('country_code', 'country_name', 'region', 'values'))
+RegionRow = namedtuple('RegionRow', ('region', 'counts'))
+
+ImprovementMatrix = namedtuple('ImprovementMatrix', ('antigens', 'years', 'rows'))
+ImprovementRow = namedtuple('ImprovementRow', ('country_code', 'country_name', 'values', 'increases'))
+
+
+def selected(values, known):
+    """
+    The submitted values that are in the known list (dropdown reference data),
+    without duplicates and in the known list's order.
+    """
+    wanted = {str(value) for value in values if value}
+    return [value for value in known if str(value) in wanted]
+
+
+def year_range(start_year, end_year, known):
+    """Every known year from start_year to end_year inclusive."""
+    try:
+        start, end = int(start_year), int(end_year)
+    except (TypeError, ValueError):
+        return []
+    return [year for year in known if start <= year <= end]
+
+
+def coverage_matrix(rows, years, antigens):
+    """
+    Pivot a2_countries_batch rows into one row per country with a coverage
+    value (or None) per (antigen, year) column. Countries meeting the target
+    in the most columns come first.
+    """
+    columns = [(antigen, year) for antigen in antigens for year in years]
+    index = {column: i for i, column in enumerate(columns)}
+
+    countries = {}
+    for row in rows:
+        i = index.get((row.antigen, row.year))
+        if i is None:
+            continue
+        entry = countries.get(row.country_code)
+        if entry is None:
+            entry = countries[row.country_code] = CoverageRow(
+                row.country_code, row.country_name, row.region, [None] * len(columns))
+        entry.values[i] = row.coverage
+
+    matrix_rows = sorted(countries.values(),
+                         key=lambda r: (-sum(v is not None for v in r.values), r.country_name))
+
+    # Countries meeting the target per region, for every column at once
+    counts = {}
+    for row in matrix_rows:
+        region_counts = counts.setdefault(row.region, [0] * len(columns))
+        for i, value in enumerate(row.values):
+            if value is not None:
+                region_counts[i] += 1
+    regions = sorted((RegionRow(region, c) for region, c in counts.items()),
+                     key=lambda r: (-sum(r.counts), r.region))
+
+    return CoverageMatrix(columns, matrix_rows, regions)
+
+
+def improvement_matrix(rows, years, antigens, limit):
+    """
+    Pivot a3_coverage_series rows into one row per country with its coverage
+    in each year and the increase from the first to the last year, per antigen.
+
+    As on the single-antigen page only increases count: a country is listed
+    if it improved for at least one antigen, and countries are ranked by
+    their biggest increase. At most `limit` rows are returned.
+    """
+    if not years:
+        return ImprovementMatrix(antigens, years, [])
+    start_year, end_year = years[0], years[-1]
+    year_index = {year: i for i, year in enumerate(years)}
+    antigen_index = {antigen: i for i, antigen in enumerate(antigens)}
+
+    countries = {}
+    for row in rows:
+        a, y = antigen_index.get(row.antigen), year_index.get(row.year)
+        if a is None or y is None:
+            continue
+        entry = countries.get(row.country_code)
+        if entry is None:
+            entry = countries[row.country_code] = ImprovementRow(
+                row.country_code, row.country_name,
+                [[None] * len(years) for _ in antigens], [None] * len(antigens))
+        entry.values[a][y] = row.coverage
+
+    improved = []
+    for entry in countries.values():
+        for a, values in enumerate(entry.values):
+            start, end = values[year_index[start_year]], values[year_index[end_year]]
+            if start is not None and end is not None and end > start:
+                entry.increases[a] = end - start
+        if any(increase is not None for increase in entry.increases):
+            improved.append(entry)
+
+    improved.sort(key=lambda r: (-max(i for i in r.increases if i is not None), r.country_name))
+    return ImprovementMatrix(antigens, years, improved[:max(limit, 0)])
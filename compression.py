@@ -0,0 +1,216 @@
+"""
+Negotiated gzip / brotli compression for pages and API responses.
+
+The analysis pages are mostly table markup and compress 5-10x, which
+matters on slow links. After each request the response is compressed with
+the best encoding the client's Accept-Encoding allows:
+
+- brotli ('br') if the optional `brotli` package is installed, else gzip
+- only text, JSON, JS and SVG bodies of at least COMPRESSION_MIN_SIZE bytes
+- streamed responses (the API) are compressed chunk by chunk as they are sent
+
+A response's ETag (see http_cache.py) already identifies its body, so the
+compressed bytes are kept per (ETag, encoding). A later request with the same
+ETag is answered with them straight from before_request, without running the
+view or compressing again. The store is bounded by COMPRESSION_CACHE_MAX_BYTES
+(least recently used first) and cleared when the data changes.
+"""
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Content types worth compressing (images, archives etc. already are)
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings, available):
+    """
+    The encoding in `available` with the highest quality in the request's
+    Accept-Encoding (earlier ones win ties), or None for identity.
+    """
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def compress_stream(chunks, encoding, gzip_level=6, brotli_quality=5):
+    """Compress an iterable of byte chunks, flushing after each so rows still arrive as they're read."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=brotli_quality)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31 = gzip wrapper
+        process, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        if chunk:
+            yield process(chunk) + flush()
+    yield finish()
+
+
+class Compression:
+    """
+    Adds response compression to a Flask app. Create it after HttpCache so
+    the request's ETag is known when before_request runs.
+
+    Settings (app.config):
+    - COMPRESSION_ENABLED: turn the whole thing on/off
+    - COMPRESSION_MIN_SIZE: smaller bodies are sent as they are
+    - COMPRESSION_GZIP_LEVEL / COMPRESSION_BROTLI_QUALITY: CPU vs size
+    - COMPRESSION_CACHE_MAX_BYTES: compressed bodies kept for reuse (0 = none)
+    """
+
+    def __init__(self, app, data_version):
+        self.app = app
+        self.encodings = available_encodings()
+        self._bodies = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.compressed = 0
+        self.streamed = 0
+        self.hits = 0
+        self.evictions = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        data_version.on_change(self.clear)
+        app.extensions['compression'] = self
+
+    def _encoding(self):
+        if not self.app.config['COMPRESSION_ENABLED']:
+            return None
+        return negotiate(request.accept_encodings, self.encodings)
+
+    def _levels(self):
+        return {'gzip_level': self.app.config['COMPRESSION_GZIP_LEVEL'],
+                'brotli_quality': self.app.config['COMPRESSION_BROTLI_QUALITY']}
+
+    def _before_request(self):
+        etag = g.get('http_etag')
+        if etag is None:
+            return None
+        encoding = self._encoding()
+        if encoding is None:
+            return None
+        with self._lock:
+            entry = self._bodies.get((etag, encoding))
+            if entry is None:
+                return None
+            self._bodies.move_to_end((etag, encoding))
+            self.hits += 1
+        body, content_type = entry
+        g.compression_cached = True
+        response = self.app.response_class(body, content_type=content_type)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _after_request(self, response):
+        if g.pop('compression_cached', False):
+            return response
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        # Caches must keep compressed and uncompressed copies apart
+        response.vary.add('Accept-Encoding')
+        encoding = self._encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            original, chunks = response.response, response.iter_encoded()
+
+            def generate():
+                try:
+                    yield from compress_stream(chunks, encoding, **self._levels())
+                finally:
+                    if hasattr(original, 'close'):
+                        original.close()
+
+            response.response = generate()
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            self.streamed += 1
+            return response
+
+        data = response.get_data()
+        if len(data) < self.app.config['COMPRESSION_MIN_SIZE']:
+            return response
+        body = compress(data, encoding, **self._levels())
+        if len(body) >= len(data):
+            return response
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(body)
+
+        # Error pages (see http_cache.uncacheable) are sent but never replayed
+        etag = g.get('http_etag')
+        if etag is not None and not g.get('http_uncacheable'):
+            self._store((etag, encoding), body, response.content_type)
+        return response
+
+    def _store(self, key, body, content_type):
+        max_bytes = self.app.config['COMPRESSION_CACHE_MAX_BYTES']
+        if len(body) > max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._bodies[key] = (body, content_type)
+            self._bytes += len(body)
+            while self._bytes > max_bytes:
+                _, (evicted, _) = self._bodies.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self, version=None):
+        """Drop every stored body (called automatically when the DB changes)."""
+        with self._lock:
+            self._bodies.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'encodings': list(self.encodings),
+            'compressed': self.compressed,
+            'streamed': self.streamed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+            'cached_bodies': len(self._bodies),
+            'cached_bytes': self._bytes,
+            'hits': self.hits,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,150 @@
+"""
+Per-country index for the country profile page and API.
+
+Everything about one country (coverage history for every antigen, the
+per-100k series for every infection type, population, region and economy)
+would otherwise take a scan of Vaccination and InfectionData per antigen /
+infection type, filtered by country. Instead the index reads each table once,
+ordered by country, and groups the rows into one CountryProfile per
+CountryID whose series are already sorted by year. A profile is then a
+single dict lookup.
+
+Like ReferenceCache, the index is built on first use (or at startup) and
+rebuilt when the DataVersion watcher reports that the DB has changed.
+"""
+
+import itertools
+import threading
+from collections import namedtuple
+from operator import itemgetter
+
+import queries
+
+CountryProfile = namedtuple('CountryProfile', ('country_code', 'name', 'region', 'economy',
+                                               'population', 'coverage', 'infections'))
+CoverageSeries = namedtuple('CoverageSeries', ('antigen', 'points'))
+InfectionSeries = namedtuple('InfectionSeries', ('inf_type', 'description', 'points'))
+
+PopulationPoint = namedtuple('PopulationPoint', ('year', 'population'))
+CoveragePoint = namedtuple('CoveragePoint', ('year', 'coverage'))
+InfectionPoint = namedtuple('InfectionPoint', ('year', 'cases', 'population', 'cases_per_100k'))
+
+
+def _by_country(rows):
+    """{country: [rows]} from rows already ordered by country (first column)."""
+    return {country: list(group) for country, group in itertools.groupby(rows, key=itemgetter(0))}
+
+
+def pivot(series_list):
+    """
+    (keys, rows) table of several year series: keys are the series' first
+    field (antigen / inf_type), rows are (year, [point or None per key]),
+    newest year first.
+    """
+    keys = [series[0] for series in series_list]
+    by_year = {}
+    for i, series in enumerate(series_list):
+        for point in series.points:
+            by_year.setdefault(point.year, [None] * len(keys))[i] = point
+    return keys, sorted(by_year.items(), reverse=True)
+
+
+class CountryIndex:
+    """
+    CountryProfiles keyed by CountryID.
+
+    - get(country_id) returns one profile (or None), building the index on first use
+    - countries() lists (country_code, name) for the country selector
+    - the index is dropped automatically when the data version changes
+    """
+
+    def __init__(self, connect, data_version):
+        self._connect = connect
+        self._data_version = data_version
+        self._lock = threading.Lock()
+        self._profiles = None
+        self._loaded_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        data_version.on_change(self.invalidate)
+
+    def _load(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            # Plain tuples: tens of thousands of rows go straight into namedtuples
+            cursor.row_factory = None
+            countries = cursor.execute(queries.COUNTRY_PROFILES).fetchall()
+            population = _by_country(cursor.execute(queries.COUNTRY_POPULATION_SERIES).fetchall())
+            coverage = _by_country(cursor.execute(queries.COUNTRY_COVERAGE_SERIES).fetchall())
+            infections = _by_country(cursor.execute(queries.COUNTRY_INFECTION_SERIES).fetchall())
+        finally:
+            conn.close()
+
+        profiles = {}
+        for code, name, region, economy in countries:
+            coverage_series = tuple(
+                CoverageSeries(antigen, tuple(CoveragePoint(year, value) for _, _, year, value in rows))
+                for antigen, rows in itertools.groupby(coverage.get(code, ()), key=itemgetter(1)))
+            infection_series = tuple(
+                InfectionSeries(inf_type, rows[0][2],
+                                tuple(InfectionPoint(*row[3:]) for row in rows))
+                for inf_type, rows in ((key, list(group)) for key, group in
+                                       itertools.groupby(infections.get(code, ()), key=itemgetter(1))))
+            profiles[code] = CountryProfile(
+                code, name, region, economy,
+                tuple(PopulationPoint(year, value) for _, year, value in population.get(code, ())),
+                coverage_series,
+                infection_series)
+        return profiles
+
+    def _index(self):
+        version = self._data_version.current()
+        profiles = self._profiles
+        if profiles is not None and self._loaded_version == version:
+            self.hits += 1
+            return profiles
+
+        with self._lock:
+            # Another thread may have built it while we waited
+            if self._profiles is not None and self._loaded_version == version:
+                self.hits += 1
+                return self._profiles
+            self.misses += 1
+            self._profiles = self._load()
+            self._loaded_version = version
+            return self._profiles
+
+    def get(self, country_id):
+        """
+        The CountryProfile for country_id (case-insensitive), or None.
+        Raises sqlite3.Error if the database can't be read.
+        """
+        return self._index().get((country_id or '').upper())
+
+    def countries(self):
+        """(country_code, name) for every country, by name."""
+        return [(profile.country_code, profile.name) for profile in self._index().values()]
+
+    def invalidate(self, version=None):
+        """Drop the index; the next lookup rebuilds it."""
+        with self._lock:
+            if self._profiles is not None:
+                self.invalidations += 1
+            self._profiles = None
+            self._loaded_version = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'loaded': self._profiles is not None,
+            'version': self._loaded_version,
+            'countries': len(self._profiles) if self._profiles is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'invalidations': self.invalidations,
+        }
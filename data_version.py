@@ -0,0 +1,178 @@
+"""
+Tracks whether immunisation.db has changed since the app last looked at it.
+
+Caches built on top of the database (reference data, query results, ...) ask
+this watcher for the current version and register a callback to be told when
+it moves, instead of each cache stat'ing the file on its own.
+
+A change is detected when either:
+- the DB file's mtime/size changes (file replaced or rewritten), or
+- `PRAGMA data_version` changes (another connection committed a write)
+
+When the write was made by `flask db ingest`, `changes` lists the
+partitions it touched, so caches can keep entries built from other ones.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import ingest
+
+
+class DataVersion:
+    """
+    Watches the database file and exposes a version number that increases
+    every time the data changes. Checks are throttled to once every
+    `check_interval` seconds so calling current() on every request is cheap.
+    """
+
+    def __init__(self, db_path, check_interval=1.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.version = 1
+        self.changed_at = time.time()
+        # Partitions changed by the last change as (kind, key, year) tuples,
+        # or None if unknown (treat everything as changed)
+        self.changes = None
+
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._conn = None
+        self._last_check = 0.0
+        self._signature = self._file_signature()
+        self._inode = self._file_inode()
+        self._data_version = self._read_data_version()
+        self._ingest_state = ingest.ingest_state(self._conn) if self._conn is not None else None
+
+    def _file_signature(self):
+        """
+        (mtime_ns, size) of the DB file and its -wal file. In WAL mode commits
+        land in the -wal file first, so the main file alone can look unchanged.
+        """
+        signature = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        if signature[0] is None:
+            return None
+        return tuple(signature)
+
+    def _file_inode(self):
+        try:
+            return os.stat(self.db_path).st_ino
+        except OSError:
+            return None
+
+    def _read_changes(self, replaced):
+        """Partitions behind the change just detected (None = unknown), see ingest.py."""
+        if self._conn is None:
+            self._ingest_state = None
+            return None
+        try:
+            if replaced:
+                self._ingest_state = ingest.ingest_state(self._conn)
+                return None
+            changes, self._ingest_state = ingest.changed_partitions(self._conn, self._ingest_state)
+            return changes
+        except sqlite3.Error:
+            return None
+
+    @property
+    def token(self):
+        """
+        Identifier for the current contents of the DB file that is the same in
+        every worker process (unlike `version`, which is a per-process counter).
+        Used for HTTP ETags.
+        """
+        self.check()
+        if self._signature is None:
+            return 'missing'
+        return '-'.join(f"{mtime:x}.{size:x}" for mtime, size in
+                        (part for part in self._signature if part is not None))
+
+    @property
+    def last_modified(self):
+        """Unix time the DB file (or its -wal file) was last written, or None."""
+        self.check()
+        if self._signature is None:
+            return None
+        return max(part[0] for part in self._signature if part is not None) / 1e9
+
+    def _read_data_version(self):
+        """
+        PRAGMA data_version is per connection, so a single watcher connection
+        is kept open for the lifetime of the app.
+        """
+        try:
+            if self._conn is None:
+                uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            self._conn = None
+            return None
+
+    def close(self):
+        """Close the watcher connection (reopened on the next check)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def on_change(self, callback):
+        """Register callback(version) to run whenever the data changes."""
+        self._listeners.append(callback)
+
+    def check(self, force=False):
+        """Look for a change now (at most once per check_interval unless forced)."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+
+        with self._lock:
+            self._last_check = now
+            signature = self._file_signature()
+            if signature != self._signature:
+                # File replaced: the old watcher connection points at the old inode
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            data_version = self._read_data_version()
+
+            if signature == self._signature and data_version == self._data_version:
+                return False
+
+            inode = self._file_inode()
+            self.changes = self._read_changes(replaced=inode != self._inode)
+            self._inode = inode
+            self._signature = signature
+            self._data_version = data_version
+            self.version += 1
+            self.changed_at = time.time()
+            version = self.version
+
+        for callback in self._listeners:
+            callback(version)
+        return True
+
+    def current(self):
+        """Current data version (checks the DB first if the interval has passed)."""
+        self.check()
+        return self.version
+
+    def bump(self):
+        """Force a new version, e.g. after this process has written to the DB."""
+        self.check(force=True)
+        with self._lock:
+            self.changes = None
+            self.version += 1
+            self.changed_at = time.time()
+            version = self.version
+        for callback in self._listeners:
+            callback(version)
+        return version
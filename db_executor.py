@@ -0,0 +1,159 @@
+"""
+Bounded thread pool for running a request's independent queries at the same
+time (e.g. the four a_level1 counts, or the two b_level2 tables).
+
+sqlite3 releases the GIL while a statement runs, so queries on separate
+connections really do overlap. The executor has its own connection pool
+(one connection per worker), so it can never deadlock with request threads
+that are holding a connection from the main pool.
+
+Protection against overload:
+- backpressure: at most workers + queue_size tasks are queued or running;
+  beyond that ExecutorBusy is raised (the app turns it into a 503)
+- heavy lane: tasks marked heavy (the analysis queries) can use at most
+  workers - 1 threads, so lightweight page loads always get a worker
+- timeout: every task gets a deadline; a query still running when it passes
+  is aborted through SQLite's progress handler and QueryTimeout is raised
+
+With workers=0 the tasks run one after another on the caller's connection
+(same behaviour as before, with the timeout still applied).
+"""
+
+import contextvars
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# SQLite VM instructions between deadline checks
+PROGRESS_STEPS = 10000
+
+
+class ExecutorBusy(Exception):
+    """Too many queries queued; the request should be retried later."""
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    """A query ran past the request's deadline and was aborted."""
+
+
+class DBExecutor:
+    """
+    Runs callables of the form task(conn) on a bounded pool of worker threads.
+
+    - pool: ConnectionPool the workers take connections from (size >= workers)
+    - workers: number of threads (0 = run tasks inline)
+    - queue_size: extra tasks allowed to wait for a thread before ExecutorBusy
+    - timeout: seconds a request's tasks may take in total (None = no limit)
+    - queue_timeout: seconds to wait for a queue slot before ExecutorBusy
+    """
+
+    def __init__(self, pool=None, workers=4, queue_size=16, timeout=10.0, queue_timeout=0.5):
+        self.pool = pool
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db') if workers else None
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+        self._heavy_slots = threading.BoundedSemaphore(max(1, workers - 1)) if workers else None
+
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.running = 0
+
+    # Running tasks
+
+    def _run(self, task, conn, deadline):
+        """Run one task on conn with the deadline enforced by a progress handler."""
+        if deadline is not None:
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+        try:
+            return task(conn)
+        except sqlite3.OperationalError as e:
+            if deadline is not None and time.monotonic() > deadline:
+                with self._lock:
+                    self.timeouts += 1
+                raise QueryTimeout(f"query timed out after {self.timeout}s") from e
+            raise
+        finally:
+            if deadline is not None:
+                conn.set_progress_handler(None, 0)
+
+    def _run_pooled(self, task, deadline, heavy):
+        with self._lock:
+            self.running += 1
+        conn = self.pool.acquire()
+        try:
+            return self._run(task, conn, deadline)
+        finally:
+            conn.close()
+            with self._lock:
+                self.running -= 1
+            self._slots.release()
+            if heavy:
+                self._heavy_slots.release()
+
+    def run_all(self, conn, tasks, heavy=False):
+        """
+        Run every task(conn) and return their results in order.
+
+        In pooled mode each task gets its own connection from the executor's
+        pool and `conn` is unused; inline they all share `conn`. Raises
+        ExecutorBusy if the queue is full and QueryTimeout past the deadline;
+        other exceptions from a task are re-raised.
+        """
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        if self._executor is None:
+            return [self._run(task, conn, deadline) for task in tasks]
+
+        futures = []
+        try:
+            for task in tasks:
+                if heavy and not self._heavy_slots.acquire(timeout=self.queue_timeout):
+                    raise ExecutorBusy("too many analysis queries running")
+                if not self._slots.acquire(timeout=self.queue_timeout):
+                    if heavy:
+                        self._heavy_slots.release()
+                    raise ExecutorBusy("database executor queue is full")
+                with self._lock:
+                    self.submitted += 1
+                # Run in a copy of the caller's context so Flask's request/g
+                # (used by the query profiler) are visible in the worker
+                context = contextvars.copy_context()
+                futures.append(self._executor.submit(context.run, self._run_pooled, task, deadline, heavy))
+        except ExecutorBusy:
+            with self._lock:
+                self.rejected += 1
+            # Let the tasks already submitted finish on their own
+            raise
+
+        results = []
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic()) + 1.0
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise QueryTimeout(f"query timed out after {self.timeout}s")
+        return results
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'timeout': self.timeout,
+            'running': self.running,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,130 @@
+"""
+Secondary indexes for the dashboard's query patterns, plus the
+`flask db optimize` migration that creates them.
+
+The primary keys don't match how the routes filter:
+- Vaccination PK is (inf_type, antigen, country, year) but a_level2 filters on
+  (year, antigen, coverage) and a_level3 joins on (country, antigen, year)
+- InfectionData PK is (inf_type, country, year) but b_level2/b_level3 filter on
+  (inf_type, year)
+so without these indexes every submit scans the whole table.
+"""
+
+import sqlite3
+
+import aggregates
+import queries
+
+# (name, table, columns) - trailing columns make the index covering, so
+# SQLite can answer the route query without touching the table rows
+INDEXES = [
+    # a_level2 (year = ? AND antigen = ? AND coverage >= 90) and a_level3's v1 side
+    ('idx_vaccination_antigen_year_coverage', 'Vaccination',
+     ('antigen', 'year', 'coverage', 'country')),
+    # a_level3's v2 side: lookup by (country, antigen, year)
+    ('idx_vaccination_country_antigen_year', 'Vaccination',
+     ('country', 'antigen', 'year', 'coverage')),
+    # dropdown: SELECT DISTINCT year FROM Vaccination
+    ('idx_vaccination_year', 'Vaccination', ('year',)),
+    # b_level2 / b_level3: inf_type = ? AND year = ?
+    ('idx_infectiondata_type_year', 'InfectionData',
+     ('inf_type', 'year', 'country', 'cases')),
+    # dropdown: SELECT DISTINCT year FROM InfectionData
+    ('idx_infectiondata_year', 'InfectionData', ('year',)),
+    # b_level2 / b_level3: population lookup without touching the table rows
+    ('idx_countrypopulation_country_year', 'CountryPopulation',
+     ('country', 'year', 'population')),
+    # b_level2: Country -> Economy join filtered on phase
+    ('idx_country_economy', 'Country', ('economy', 'CountryID', 'name')),
+]
+
+# Lookup tables small enough that a full scan is fine (names and route aliases)
+SMALL_TABLES = {'Country', 'Region', 'Economy', 'Infection_Type', 'Antigen',
+                'c', 'r', 'e', 'it'}
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN rows for a query as a list of strings."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan):
+    """Plan steps that scan a large table without using any index."""
+    scans = []
+    for step in plan:
+        parts = step.split()
+        if len(parts) >= 2 and parts[0] == 'SCAN' and 'INDEX' not in step \
+                and parts[1] not in SMALL_TABLES:
+            scans.append(step)
+    return scans
+
+
+def route_queries(conn):
+    """Route queries to explain, including the aggregate-table ones if built."""
+    route_queries = dict(queries.ROUTE_QUERIES)
+    if aggregates.is_materialised(conn):
+        route_queries.update(queries.AGGREGATE_ROUTE_QUERIES)
+    return route_queries
+
+
+def explain_all(conn):
+    """EXPLAIN QUERY PLAN for every route query, keyed by query name."""
+    return {name: explain(conn, sql, params)
+            for name, (sql, params) in route_queries(conn).items()}
+
+
+def create_indexes(conn):
+    """Create any missing indexes. Returns the names of indexes created."""
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, table, columns in INDEXES:
+        if name in existing:
+            continue
+        conn.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+        created.append(name)
+    return created
+
+
+def drop_indexes(conn):
+    """Drop the indexes in INDEXES (used to measure the baseline)."""
+    for name, _table, _columns in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def optimize(db_path, analyze=True, echo=print):
+    """
+    Create the route indexes, refresh planner statistics and print each route
+    query's plan before and after. Returns a dict of query name -> list of
+    remaining full-table scans (empty lists mean every query uses an index).
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        before = explain_all(conn)
+
+        with conn:
+            created = create_indexes(conn)
+        if analyze:
+            conn.execute("ANALYZE")
+            conn.commit()
+
+        after = explain_all(conn)
+    finally:
+        conn.close()
+
+    echo(f"Created {len(created)} index(es): {', '.join(created) or 'none'}")
+    if analyze:
+        echo("ANALYZE: planner statistics refreshed")
+
+    remaining = {}
+    for name in after:
+        echo(f"\n== {name}")
+        echo("  before:")
+        for step in before.get(name, []):
+            echo(f"    {step}")
+        echo("  after:")
+        for step in after[name]:
+            echo(f"    {step}")
+        remaining[name] = full_scans(after[name])
+    return remaining
@@ -0,0 +1,249 @@
+"""
+Connection pool for the immunisation SQLite database.
+
+Opening a new sqlite3 connection on every request throws away SQLite's page
+cache each time, so the small dashboard queries end up dominated by
+connect/teardown cost. The pool keeps a bounded set of read-only connections
+alive and hands them out to request threads, setting the pragmas once per
+connection instead of once per request.
+"""
+
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+def _add_math_functions(conn):
+    """
+    Register pow() when SQLite was built without its math functions
+    (SQLITE_ENABLE_MATH_FUNCTIONS, 3.35+); the API's trend summaries use it.
+    """
+    try:
+        conn.execute("SELECT pow(1, 1)")
+    except sqlite3.OperationalError:
+        conn.create_function('pow', 2, math.pow, deterministic=True)
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled sqlite3 connection.
+    Calling close() gives the connection back to the pool instead of closing it,
+    so existing route code using get_db_connection()/conn.close() keeps working.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def raw(self):
+        """The underlying sqlite3.Connection."""
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections shared between request threads.
+
+    - Connections are opened in read-only URI mode (mode=ro, optionally immutable=1)
+    - Pragmas (mmap_size, cache_size, WAL for writable connections) are applied once
+    - Idle connections are reused most-recently-used first (LIFO), so each worker
+      keeps hitting a connection whose page cache is already warm
+    - Idle connections are health-checked before reuse and recycled when the
+      database file is replaced on disk
+    - Hits/misses are counted so pool behaviour can be inspected from the app
+    """
+
+    def __init__(self, db_path, size=8, read_only=True, immutable=False,
+                 mmap_size=64 * 1024 * 1024, cache_size=-16000,
+                 health_check_interval=30.0, timeout=5.0, factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.size = size
+        self.read_only = read_only
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.factory = factory  # sqlite3.Connection subclass, e.g. for query profiling
+
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._last_used = {}
+        self._generation = 0
+        self._conn_generation = {}
+        self._file_signature = self._current_signature()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.failed_health_checks = 0
+
+    # Connection setup
+
+    def _uri(self):
+        path = os.path.abspath(self.db_path)
+        params = []
+        if self.read_only:
+            params.append('mode=ro')
+            if self.immutable:
+                params.append('immutable=1')
+        query = f"?{'&'.join(params)}" if params else ''
+        return f"file:{path}{query}"
+
+    def _current_signature(self):
+        """(mtime, size) of the database file, used to spot a replaced DB."""
+        try:
+            stat = os.stat(self.db_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _open(self):
+        conn = sqlite3.connect(self._uri(), uri=True, timeout=self.timeout,
+                               check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row  # Allows accessing columns by name
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        _add_math_functions(conn)
+        if not self.read_only:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn_generation[id(conn)] = self._generation
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            self.failed_health_checks += 1
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._conn_generation.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+            self.discarded += 1
+
+    # Checkout / release
+
+    def _check_file(self):
+        """Drop every idle connection if the database file has been replaced."""
+        signature = self._current_signature()
+        if signature != self._file_signature:
+            self._file_signature = signature
+            with self._lock:
+                self._generation += 1
+            self.clear()
+
+    def _checkout_idle(self, block):
+        try:
+            if block:
+                return self._idle.get(timeout=self.timeout)
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None
+
+    def acquire(self):
+        """
+        Check out a connection. Returns a PooledConnection whose close() puts
+        the connection back into the pool.
+        Raises sqlite3.OperationalError if the pool stays exhausted for `timeout` seconds.
+        """
+        self._check_file()
+
+        while True:
+            conn = self._checkout_idle(block=False)
+            if conn is None:
+                with self._lock:
+                    can_open = self._open_count < self.size
+                    if can_open:
+                        self._open_count += 1
+                        self.misses += 1
+                if can_open:
+                    try:
+                        conn = self._open()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._open_count -= 1
+                        raise
+                    return PooledConnection(self, conn)
+
+                # Pool is at capacity - wait for another request to give one back
+                conn = self._checkout_idle(block=True)
+                if conn is None:
+                    raise sqlite3.OperationalError("connection pool exhausted")
+
+            last_used = self._last_used.get(id(conn), 0)
+            if time.monotonic() - last_used > self.health_check_interval and not self._healthy(conn):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self.hits += 1
+            return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection to the pool (or close it if the pool is full)."""
+        # Connections checked out before the DB file changed are not reused
+        if self._conn_generation.get(id(conn)) != self._generation:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def clear(self):
+        """Close all idle connections (e.g. after the DB file changed)."""
+        while True:
+            conn = self._checkout_idle(block=False)
+            if conn is None:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """Pool counters as a plain dict."""
+        total = self.hits + self.misses
+        return {
+            'size': self.size,
+            'open': self._open_count,
+            'idle': self._idle.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'discarded': self.discarded,
+            'failed_health_checks': self.failed_health_checks,
+        }
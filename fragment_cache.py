@@ -0,0 +1,172 @@
+"""
+Cache of rendered HTML for the results sections of the analysis pages.
+
+For a large result (e.g. a_level2 in a year where most countries pass 90%)
+most of the response time goes to Jinja looping over the rows to build the
+tables, so the rendered section is kept instead and dropped into the page as
+`results_html`. Entries are keyed on (template, filters):
+
+- memory is bounded by the total size of the stored HTML (LRU eviction)
+- fragments above a size threshold can be stored zlib-compressed
+- everything is cleared when the DataVersion watcher reports a DB change,
+  except after an ingest, which only drops fragments tagged with one of the
+  partitions it touched (see ingest.py)
+
+precompile_templates() compiles every template at startup (optionally into a
+Jinja bytecode cache on disk) so the first request doesn't pay for it.
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+import ingest
+
+
+def precompile_templates(app, cache_dir=None):
+    """
+    Compile every template in the app's template folder now. With cache_dir
+    set the compiled bytecode is also written there, so later processes (and
+    restarts) load templates without re-parsing them. Returns the number of
+    templates compiled.
+    """
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        # Templates already compiled in memory would otherwise skip the new cache
+        if app.jinja_env.cache is not None:
+            app.jinja_env.cache.clear()
+
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+        compiled += 1
+    return compiled
+
+
+class FragmentCache:
+    """
+    Bounded LRU cache of rendered template fragments.
+
+    - max_bytes: total size of stored fragments before the least recently
+      used are evicted
+    - compress: store fragments of at least compress_min_size bytes
+      zlib-compressed (smaller, at the cost of a decompress per hit)
+    """
+
+    def __init__(self, data_version, max_bytes=8 * 1024 * 1024, compress=False,
+                 compress_min_size=4096):
+        self._data_version = data_version
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.compressed = 0
+
+        data_version.on_change(self._on_change)
+
+    def _on_change(self, version):
+        changes = self._data_version.changes
+        if changes is None:
+            self.clear()
+        else:
+            self.invalidate(changes)
+
+    def _key(self, template, params):
+        return (template,) + tuple(params)
+
+    def get(self, template, params):
+        """Rendered fragment for template + filter values as Markup, or None."""
+        # Gives the watcher a chance to clear us if the DB has changed
+        self._data_version.current()
+        key = self._key(template, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        data, is_compressed, _partitions = entry
+        if is_compressed:
+            data = zlib.decompress(data)
+        return Markup(data.decode('utf-8'))
+
+    def set(self, template, params, html, partitions=None):
+        data = html.encode('utf-8')
+        is_compressed = False
+        if self.compress and len(data) >= self.compress_min_size:
+            data = zlib.compress(data, 1)
+            is_compressed = True
+        # Not worth evicting everything else for one oversized fragment
+        if len(data) > self.max_bytes:
+            return
+
+        key = self._key(template, params)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (data, is_compressed, partitions)
+            self.size += len(data)
+            if is_compressed:
+                self.compressed += 1
+            while self.size > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def render(self, template, params, partitions=None, **context):
+        """
+        Render template with context, cache it under params (tagged with the
+        data partitions it shows, as for QueryCache.fetch) and return it as Markup.
+        """
+        html = render_template(template, **context)
+        self.set(template, params, html, partitions)
+        return Markup(html)
+
+    def clear(self, version=None):
+        """Drop every fragment (called automatically when the DB changes)."""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.size = 0
+
+    def invalidate(self, partitions):
+        """Drop the fragments built from any of these (kind, key, year) partitions."""
+        with self._lock:
+            stale = [key for key, (_, _, tags) in self._entries.items()
+                     if ingest.affected(tags, partitions)]
+            for key in stale:
+                self.size -= len(self._entries.pop(key)[0])
+            if stale:
+                self.invalidations += 1
+        return len(stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'compress': self.compress,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'compressed': self.compressed,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,145 @@
+"""
+HTTP conditional caching for pages and API responses.
+
+The data only changes when immunisation.db does, so a GET response is fully
+determined by (DB contents, app build, path, query string). That lets the
+ETag be computed *before* the view runs:
+
+- before_request: if If-None-Match (or If-Modified-Since) matches, answer
+  304 straight away without running any queries or rendering templates
+- after_request: attach ETag, Last-Modified and Cache-Control to 200 responses
+
+Compressed responses (see compression.py) get a weak ETag, since their bytes
+differ from the identity encoding; If-None-Match uses weak comparison, so
+either form revalidates.
+
+POST requests are never cached; the filter forms submit with GET so results
+have cacheable URLs. Neither are responses other than 200 or pages a view
+marked with uncacheable() (e.g. one showing a query error or timeout): the
+error may clear while the ETag stays the same.
+"""
+
+import hashlib
+import os
+from email.utils import formatdate
+
+from flask import g, request
+
+
+def uncacheable():
+    """Mark the current response as not cacheable (no ETag / Cache-Control, not stored)."""
+    g.http_uncacheable = True
+
+
+def build_id(root_path):
+    """
+    Fingerprint of the deployed code and templates, so a deploy changes every
+    ETag even if the DB hasn't. Same value in every worker of one deploy.
+    Returns (id, newest file mtime in seconds).
+    """
+    digest = hashlib.sha1()
+    newest = 0
+    for folder in (root_path, os.path.join(root_path, 'templates'),
+                   os.path.join(root_path, 'templates', 'partials')):
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(('.py', '.html')):
+                stat = os.stat(os.path.join(folder, name))
+                digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+                newest = max(newest, stat.st_mtime)
+    return digest.hexdigest()[:12], newest
+
+
+class HttpCache:
+    """
+    Adds ETag / Last-Modified / Cache-Control handling to a Flask app.
+
+    Settings (app.config):
+    - HTTP_CACHE_ENABLED: turn the whole thing on/off
+    - HTTP_CACHE_CONTROL: Cache-Control value for cacheable responses
+    - HTTP_CACHE_EXCLUDE: path prefixes that are never cached (e.g. /stats)
+    """
+
+    def __init__(self, app, data_version):
+        self.app = app
+        self.data_version = data_version
+        self.build, self.build_time = build_id(app.root_path)
+        self.not_modified = 0
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['http_cache'] = self
+
+    def _cacheable(self):
+        if not self.app.config['HTTP_CACHE_ENABLED']:
+            return False
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        return not request.path.startswith(tuple(self.app.config['HTTP_CACHE_EXCLUDE']))
+
+    def etag_for_request(self):
+        """
+        Strong ETag for the current request: DB token + build + path + sorted
+        query args (+ Accept, which picks JSON vs CSV on the API, and
+        HX-Request, which asks a page for its results section only).
+        """
+        parts = [
+            self.data_version.token,
+            self.build,
+            request.path,
+            '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True))),
+            request.headers.get('Accept', '') if request.path.startswith('/api/') else '',
+            request.headers.get('HX-Request', ''),
+        ]
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+    def last_modified(self):
+        """Newest of the DB write time and the deploy time."""
+        db_time = self.data_version.last_modified
+        if db_time is None:
+            return None
+        return max(db_time, self.build_time)
+
+    def _before_request(self):
+        if not self._cacheable():
+            return None
+        etag = self.etag_for_request()
+        g.http_etag = etag
+
+        last_modified = self.last_modified()
+        if request.if_none_match:
+            matched = request.if_none_match.contains_weak(etag)
+        elif request.if_modified_since and last_modified is not None:
+            # HTTP dates have one-second resolution
+            matched = int(last_modified) <= request.if_modified_since.timestamp()
+        else:
+            matched = False
+
+        if matched:
+            self.not_modified += 1
+            response = self.app.response_class(status=304)
+            self._add_headers(response, etag, last_modified)
+            return response
+        return None
+
+    def _after_request(self, response):
+        etag = g.pop('http_etag', None)
+        if etag is None or response.status_code != 200 or g.get('http_uncacheable'):
+            return response
+        self._add_headers(response, etag, self.last_modified())
+        return response
+
+    def _add_headers(self, response, etag, last_modified):
+        response.set_etag(etag, weak='Content-Encoding' in response.headers)
+        if last_modified is not None:
+            response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+        response.headers['Cache-Control'] = self.app.config['HTTP_CACHE_CONTROL']
+        if request.path.startswith('/api/'):
+            response.vary.add('Accept')
+        else:
+            response.vary.add('HX-Request')
+
+    def stats(self):
+        return {'build': self.build, 'not_modified': self.not_modified}
@@ -0,0 +1,368 @@
+"""
+Incremental loading of new WHO/UNICEF extracts into immunisation.db.
+
+    flask db ingest Vaccination extract_2025.csv
+    flask db ingest InfectionData cases.jsonl --batch-size 5000
+
+Instead of replacing the database file (which empties every cache in every
+worker), an extract for Vaccination, InfectionData or CountryPopulation is
+streamed in and upserted in place:
+
+- rows are read in chunks from CSV, a JSON array or JSON Lines
+- each row is converted and checked against Country / Antigen /
+  Infection_Type; rejected rows are counted and reported, not loaded
+- each chunk is written with executemany() in its own transaction, so
+  readers are only ever blocked for one short batch. Rows identical to
+  what is already stored are skipped, and so don't count as changes.
+  The upsert is an UPDATE followed by INSERT OR IGNORE rather than
+  INSERT ... ON CONFLICT DO UPDATE. An upsert's conflict policy would
+  override the INSERT OR IGNORE inside the aggregates.py triggers.
+- the (antigen, year) / (inf_type, year) partitions actually changed are
+  recorded in ingest_log / ingest_partitions. ingest_log.id is the data
+  version the extract went live as.
+- the aggregate tables are refreshed for the changed partitions only (the
+  aggregates.py triggers have already marked them dirty)
+
+Running apps notice the commit through DataVersion. When it was an ingest,
+changed_partitions() tells them which partitions it touched, and the query
+and fragment caches drop only the entries built from those partitions.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+import aggregates
+
+BATCH_SIZE = 1000
+
+# Rejected rows reported in detail (the rest are only counted)
+MAX_REJECTS_SHOWN = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_log (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name    TEXT    NOT NULL,
+    source        TEXT    NOT NULL,
+    started_at    TEXT    NOT NULL,
+    finished_at   TEXT,
+    rows_read     INTEGER NOT NULL DEFAULT 0,
+    rows_inserted INTEGER NOT NULL DEFAULT 0,
+    rows_updated  INTEGER NOT NULL DEFAULT 0,
+    rows_rejected INTEGER NOT NULL DEFAULT 0,
+    commits       INTEGER NOT NULL DEFAULT 0
+);
+
+-- Partitions each ingest changed; key '*' means every key in that year
+CREATE TABLE IF NOT EXISTS ingest_partitions (
+    ingest_id INTEGER NOT NULL REFERENCES ingest_log (id),
+    kind      TEXT    NOT NULL,
+    key       TEXT    NOT NULL,
+    year      INTEGER NOT NULL,
+    PRIMARY KEY (ingest_id, kind, key, year)
+);
+"""
+
+
+def _number(value):
+    """REAL column: blank means NULL."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return float(value)
+
+
+def _text(value):
+    if value is None or not str(value).strip():
+        raise ValueError("is required")
+    return str(value).strip()
+
+
+# Per table: columns in insert order as (name, converter), the primary key,
+# the reference tables each key column must exist in, and the SQL that names
+# the partition a changed row belongs to (see _PARTITION_TRIGGER).
+TABLES = {
+    'Vaccination': {
+        'columns': [('inf_type', _text), ('antigen', _text), ('country', _text), ('year', int),
+                    ('target_num', _number), ('doses', _number), ('coverage', _number)],
+        'key': ('inf_type', 'antigen', 'country', 'year'),
+        'references': {'inf_type': ('Infection_Type', 'id'),
+                       'antigen': ('Antigen', 'AntigenID'),
+                       'country': ('Country', 'CountryID')},
+        'partition': "'coverage', {row}.antigen, {row}.year",
+    },
+    'InfectionData': {
+        'columns': [('inf_type', _text), ('country', _text), ('year', int), ('cases', _number)],
+        'key': ('inf_type', 'country', 'year'),
+        'references': {'inf_type': ('Infection_Type', 'id'),
+                       'country': ('Country', 'CountryID')},
+        'partition': "'infection', {row}.inf_type, {row}.year",
+    },
+    # A population change moves the per-100k rate of every infection type
+    'CountryPopulation': {
+        'columns': [('country', _text), ('year', int), ('population', _number)],
+        'key': ('country', 'year'),
+        'references': {'country': ('Country', 'CountryID')},
+        'partition': "'infection', '*', {row}.year",
+    },
+}
+
+# Temporary triggers collecting the partitions of rows that really changed
+_PARTITION_TRIGGER = """
+CREATE TEMP TRIGGER ingest_{table}_{event} AFTER {event} ON main.{table}
+BEGIN
+    INSERT OR IGNORE INTO ingest_changed VALUES ({partition});
+END
+"""
+
+IngestResult = namedtuple('IngestResult', ('version', 'rows_read', 'rows_inserted', 'rows_updated',
+                                           'rows_rejected',
+                                           'partitions', 'aggregates_refreshed', 'rejects', 'seconds'))
+
+
+# Reading extracts
+
+def read_rows(path, fmt=None):
+    """
+    Yield (line number, dict) for each record in a CSV, JSON array or JSON
+    Lines file. fmt is 'csv', 'json' or 'jsonl'; by default it comes from the
+    file extension. CSV and JSON Lines are streamed; a JSON array is parsed whole.
+    """
+    fmt = fmt or {'.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(
+        os.path.splitext(path)[1].lower(), 'csv')
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line_num, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_num, json.loads(line)
+    elif fmt == 'json':
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+        if not isinstance(records, list):
+            raise ValueError("a JSON extract must be an array of objects")
+        yield from enumerate(records, start=1)
+    else:
+        raise ValueError(f"unknown format {fmt!r} (use csv, json or jsonl)")
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Validation
+
+def _load_references(conn, spec):
+    """{column: set of valid values} for every foreign key column."""
+    return {column: {row[0] for row in conn.execute(f"SELECT {key} FROM {table}")}
+            for column, (table, key) in spec['references'].items()}
+
+
+def convert_row(record, spec, references):
+    """
+    Tuple of column values for one extract record. Column names are matched
+    case-insensitively. Raises ValueError naming the first problem found.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    record = {str(k).strip().lower(): v for k, v in record.items()}
+    values = []
+    for column, converter in spec['columns']:
+        value = record.get(column.lower())
+        try:
+            value = converter(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column}: invalid value {value!r}")
+        valid = references.get(column)
+        if valid is not None and value not in valid:
+            table, key = spec['references'][column]
+            raise ValueError(f"{column}: {value!r} is not in {table}.{key}")
+        values.append(value)
+    return tuple(values)
+
+
+# Writing
+
+def _upsert_statements(table, spec):
+    """
+    (UPDATE sql, function mapping a row to its UPDATE params, INSERT sql).
+    The UPDATE leaves identical rows alone, so re-loading an extract doesn't
+    mark anything as changed; the INSERT OR IGNORE then adds the new rows.
+    """
+    columns = [name for name, _ in spec['columns']]
+    others = [c for c in columns if c not in spec['key']]
+    key_index = [columns.index(c) for c in spec['key']]
+    other_index = [columns.index(c) for c in others]
+
+    update = (f"UPDATE {table} SET " + ', '.join(f"{c} = ?" for c in others)
+              + " WHERE " + ' AND '.join(f"{c} = ?" for c in spec['key'])
+              + " AND (" + ' OR '.join(f"{c} IS NOT ?" for c in others) + ")")
+    insert = (f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+              f"VALUES ({', '.join('?' for _ in columns)})")
+
+    def update_params(row):
+        changed = [row[i] for i in other_index]
+        return changed + [row[i] for i in key_index] + changed
+
+    return update, update_params, insert
+
+
+def _install_partition_triggers(conn, table, spec):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_changed "
+                 "(kind TEXT, key TEXT, year INTEGER, PRIMARY KEY (kind, key, year))")
+    for event in ('INSERT', 'UPDATE'):
+        conn.execute(f"DROP TRIGGER IF EXISTS temp.ingest_{table}_{event}")
+        conn.execute(_PARTITION_TRIGGER.format(
+            table=table, event=event, partition=spec['partition'].format(row='NEW')))
+
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def ingest(db_path, table, path, fmt=None, batch_size=BATCH_SIZE, echo=None):
+    """
+    Load one extract file into `table`. Returns an IngestResult; raises
+    ValueError for an unknown table or format.
+    """
+    spec = TABLES.get(table)
+    if spec is None:
+        raise ValueError(f"can't ingest into {table!r} (choose from {', '.join(TABLES)})")
+    start = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            conn.executescript(SCHEMA)
+            version = conn.execute(
+                "INSERT INTO ingest_log (table_name, source, started_at) VALUES (?, ?, ?)",
+                (table, os.path.abspath(path), _now())).lastrowid
+        _install_partition_triggers(conn, table, spec)
+        references = _load_references(conn, spec)
+        update, update_params, insert = _upsert_statements(table, spec)
+        year_index = [name for name, _ in spec['columns']].index('year')
+
+        rows_read = rows_inserted = rows_updated = rows_rejected = 0
+        rejects = []
+        for chunk in _chunks(read_rows(path, fmt), batch_size):
+            batch = []
+            for line_num, record in chunk:
+                rows_read += 1
+                try:
+                    batch.append(convert_row(record, spec, references))
+                except ValueError as e:
+                    rows_rejected += 1
+                    if len(rejects) < MAX_REJECTS_SHOWN:
+                        rejects.append((line_num, str(e)))
+
+            # One transaction per chunk: the rows, the partitions they changed
+            # and the log's commit counter become visible together
+            with conn:
+                if batch:
+                    # New years have to exist in YearDate before rows can reference them
+                    conn.executemany("INSERT OR IGNORE INTO YearDate (YearID) VALUES (?)",
+                                     {(values[year_index],) for values in batch})
+                    rows_updated += max(conn.executemany(update, map(update_params, batch)).rowcount, 0)
+                    rows_inserted += max(conn.executemany(insert, batch).rowcount, 0)
+                conn.execute("""
+                    INSERT OR IGNORE INTO ingest_partitions (ingest_id, kind, key, year)
+                    SELECT ?, kind, key, year FROM temp.ingest_changed
+                """, (version,))
+                conn.execute("DELETE FROM temp.ingest_changed")
+                conn.execute("""
+                    UPDATE ingest_log
+                    SET rows_read = ?, rows_inserted = ?, rows_updated = ?, rows_rejected = ?,
+                        commits = commits + 1
+                    WHERE id = ?
+                """, (rows_read, rows_inserted, rows_updated, rows_rejected, version))
+            if echo:
+                echo(f"  {rows_read} rows read, {rows_inserted} inserted, {rows_updated} updated, "
+                     f"{rows_rejected} rejected")
+
+        # Finish the log entry in the same transaction as the aggregate refresh
+        conn.execute("UPDATE ingest_log SET finished_at = ?, commits = commits + 1 WHERE id = ?",
+                     (_now(), version))
+        if aggregates.is_materialised(conn):
+            infection, coverage = aggregates.refresh(conn)
+            refreshed = len(infection) + len(coverage)
+        else:
+            conn.commit()
+            refreshed = 0
+
+        partitions = [tuple(row) for row in conn.execute(
+            "SELECT kind, key, year FROM ingest_partitions WHERE ingest_id = ? ORDER BY kind, key, year",
+            (version,))]
+    finally:
+        conn.close()
+
+    return IngestResult(version, rows_read, rows_inserted, rows_updated, rows_rejected, partitions, refreshed,
+                        rejects, time.perf_counter() - start)
+
+
+# Reading the log (used by DataVersion in the running apps)
+
+def ingest_state(conn):
+    """{ingest id: commits} for every logged ingest, or None if nothing was ever ingested."""
+    try:
+        return dict(conn.execute("SELECT id, commits FROM ingest_log").fetchall())
+    except sqlite3.OperationalError:
+        return None
+
+
+def changed_partitions(conn, seen):
+    """
+    Partitions touched by ingests that have committed since `seen` (the
+    ingest_state() recorded at the last check) as (kind, key, year) tuples,
+    plus the new state. The partitions are None if no ingest accounts for
+    the change, i.e. the DB was written some other way and everything
+    should be treated as changed.
+    """
+    state = ingest_state(conn)
+    if state is None:
+        return None, state
+    changed = [ingest_id for ingest_id, commits in state.items()
+               if (seen or {}).get(ingest_id) != commits]
+    if not changed:
+        return None, state
+    rows = conn.execute(
+        f"SELECT DISTINCT kind, key, year FROM ingest_partitions "
+        f"WHERE ingest_id IN ({', '.join('?' for _ in changed)})", changed).fetchall()
+    return [tuple(row) for row in rows], state
+
+
+def coverage_partitions(antigens, years):
+    """Cache tags for results built from these (antigen, year) partitions."""
+    return [('coverage', str(antigen), str(year)) for antigen in antigens for year in years]
+
+
+def infection_partitions(inf_types, years):
+    """Cache tags for results built from these (inf_type, year) partitions."""
+    return [('infection', str(inf_type), str(year)) for inf_type in inf_types for year in years]
+
+
+def affected(tags, partitions):
+    """
+    True if a cache entry tagged with `tags` depends on any of the changed
+    `partitions`. Untagged entries (tags None) are always affected.
+    """
+    if tags is None:
+        return True
+    for kind, key, year in partitions:
+        key, year = str(key), str(year)
+        for tag_kind, tag_key, tag_year in tags:
+            if tag_kind == kind and tag_year == year and key in ('*', tag_key):
+                return True
+    return False
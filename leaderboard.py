@@ -0,0 +1,142 @@
+"""
+Precomputed top-N leaderboards for a_level3 and b_level3.
+
+Both pages rank every qualifying country (coverage increase between two
+years / cases per 100k above the average) and then cut the list at the
+requested top_n. Instead of re-running the ranking for each top_n, the whole
+ranked list is built once per (antigen, start_year, end_year) or
+(inf_type, year), on the first request for it, and kept:
+
+- any top_n is a slice of the stored rows
+- rank and percentile for a country are a dict lookup
+
+Ties share a rank (1, 2, 2, 4) and are listed by country name, so both
+analytics backends produce the same board. Boards are tagged with the data
+partitions they were built from: after an ingest only the boards for the
+touched partitions are dropped (and rebuilt on their next request), and any
+other change drops them all.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+import ingest
+
+Board = namedtuple('Board', ('rows', 'ranks', 'partitions'))
+Standing = namedtuple('Standing', ('rank', 'percentile', 'of', 'row'))
+
+
+def rank(rows, score, name):
+    """
+    Board of rows ranked by their `score` field, highest first, ties by `name`.
+    ranks maps each row's `name` to (rank, index of its row).
+    """
+    rows = sorted(rows, key=lambda row: (-getattr(row, score), getattr(row, name)))
+    ranks = {}
+    previous, current = None, 0
+    for i, row in enumerate(rows):
+        value = getattr(row, score)
+        if value != previous:
+            previous, current = value, i + 1
+        ranks[getattr(row, name)] = (current, i)
+    return Board(rows, ranks, None)
+
+
+def standing(board, country):
+    """
+    Standing(rank, percentile, of, row) of country on board, or None if it
+    isn't on it. percentile is the share of the board ranked at or below it
+    (100 for first place).
+    """
+    entry = board.ranks.get(country)
+    if entry is None:
+        return None
+    position, i = entry
+    size = len(board.rows)
+    return Standing(position, round(100.0 * (size - position + 1) / size, 1), size, board.rows[i])
+
+
+class Leaderboards:
+    """
+    Ranked lists keyed on (backend, route, filters), built lazily and kept
+    until their data changes.
+
+    - maxsize: boards kept before the least recently used is evicted
+    """
+
+    def __init__(self, data_version, maxsize=1024):
+        self._data_version = data_version
+        self.maxsize = maxsize
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+        data_version.on_change(self._on_change)
+
+    def _on_change(self, version):
+        changes = self._data_version.changes
+        with self._lock:
+            if changes is None:
+                if self._boards:
+                    self.invalidations += 1
+                self._boards.clear()
+                return
+            stale = [key for key, board in self._boards.items()
+                     if ingest.affected(board.partitions, changes)]
+            for key in stale:
+                del self._boards[key]
+            self.refreshes += len(stale)
+
+    def board(self, key, build, score, name, partitions=None):
+        """
+        The board for key, building it from build() (every qualifying row, in
+        any order) if it isn't stored. score and name are the row fields to
+        rank by and to look countries up by.
+        """
+        # Gives the watcher a chance to drop stale boards
+        self._data_version.current()
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None:
+                self._boards.move_to_end(key)
+                self.hits += 1
+                return board
+            self.misses += 1
+
+        board = rank(build(), score, name)._replace(partitions=partitions)
+        with self._lock:
+            self._boards[key] = board
+            self._boards.move_to_end(key)
+            while len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+                self.evictions += 1
+        return board
+
+    def top(self, key, top_n, build, score, name, partitions=None):
+        """The first top_n rows of the board for key."""
+        return self.board(key, build, score, name, partitions).rows[:max(top_n, 0)]
+
+    def clear(self):
+        with self._lock:
+            if self._boards:
+                self.invalidations += 1
+            self._boards.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'boards': len(self._boards),
+            'maxsize': self.maxsize,
+            'rows': sum(len(board.rows) for board in list(self._boards.values())),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes,
+            'invalidations': self.invalidations,
+        }
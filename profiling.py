@@ -0,0 +1,342 @@
+"""
+Query profiling and request metrics, exported at /metrics in Prometheus
+text format.
+
+Pooled connections are opened as ProfiledConnection, whose cursors time
+every query from execute() until its rows have been fetched. Each query is
+recorded once with:
+- its wall time and the number of rows fetched
+- its normalised SQL (literals replaced by ?, whitespace collapsed)
+- the route that ran it, so the separate queries inside one page (e.g. the
+  average and the above-average list in b_level3) get separate series
+
+Queries slower than SLOW_QUERY_MS are logged with their EXPLAIN QUERY PLAN
+(at most once a minute per query). Request latency per route is recorded
+by before/after_request hooks, and each response gets a Server-Timing
+header with the DB time spent on it.
+
+Recording costs one lock and a bisect per query, so it can stay on under load.
+"""
+
+import bisect
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+import db_indexes
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0)
+
+# How often the same slow query is EXPLAINed and logged again
+SLOW_LOG_INTERVAL = 60.0
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+# Set while a slow query is being EXPLAINed, so the EXPLAIN isn't profiled too
+_local = threading.local()
+
+
+def normalise_sql(sql):
+    """Collapse whitespace and replace literal values with ? so queries group together."""
+    return _WHITESPACE.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each query to the profiler once its rows have been
+    read: on fetchall(), when fetchone()/fetchmany()/iteration run out, or
+    when the cursor is reused, closed or garbage collected.
+    """
+
+    profiler = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql = sql
+        self._params = parameters
+        self._rows = 0
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - start
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if getattr(self, '_sql', None) is not None:
+            self._elapsed += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif getattr(self, '_sql', None) is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if getattr(self, '_sql', None) is not None:
+            self._rows += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if getattr(self, '_sql', None) is not None:
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if getattr(self, '_sql', None) is not None:
+            self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        sql = getattr(self, '_sql', None)
+        if sql is None:
+            return
+        self._sql = None
+        self.profiler.record(self.connection, sql, self._params, self._elapsed, self._rows)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3.Connection whose cursors (including conn.execute()) are profiled."""
+
+    cursor_class = ProfiledCursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    def execute(self, sql, parameters=()):
+        # Connection.execute() would otherwise skip the cursor's execute()
+        return self.cursor().execute(sql, parameters)
+
+
+class QueryProfiler:
+    """
+    Collects query and request timings and renders them as Prometheus metrics.
+
+    - slow_query_ms: queries slower than this are logged with their query
+      plan (None to turn slow query logging off)
+    - enabled: when False nothing is recorded (the hooks stay installed)
+    """
+
+    def __init__(self, slow_query_ms=100, enabled=True):
+        self.slow_query_ms = slow_query_ms
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._sql = {}            # raw SQL -> (fingerprint, normalised SQL)
+        self._queries = {}        # (route, fingerprint) -> [Histogram, rows, slow]
+        self._requests = {}       # (route, method) -> Histogram
+        self._responses = {}      # (route, method, status) -> count
+        self._last_slow_log = {}  # fingerprint -> time last logged
+        self._gauges = []
+
+        # Each app gets its own cursor class bound to this profiler
+        self.cursor_class = type('ProfiledCursor', (ProfiledCursor,), {'profiler': self})
+        self.connection_class = type('ProfiledConnection', (ProfiledConnection,),
+                                     {'cursor_class': self.cursor_class})
+
+    def init_app(self, app):
+        """Install the request timing hooks and the Server-Timing header."""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['query_profiler'] = self
+
+    def add_gauges(self, prefix, collect):
+        """Export the numeric values of the dict returned by collect() as gauges."""
+        self._gauges.append((prefix, collect))
+
+    # Recording
+
+    def _fingerprint(self, sql):
+        entry = self._sql.get(sql)
+        if entry is None:
+            normalised = normalise_sql(sql)
+            entry = (hashlib.sha1(normalised.encode()).hexdigest()[:10], normalised)
+            # Bounded in case something builds SQL with inline values
+            if len(self._sql) < 4096:
+                self._sql[sql] = entry
+        return entry
+
+    def record(self, conn, sql, params, elapsed, rows):
+        """Record one finished query (called by the cursors)."""
+        if not self.enabled or getattr(_local, 'explaining', False):
+            return
+        fingerprint, normalised = self._fingerprint(sql)
+        # Queries outside a request (startup, CLI) are grouped under "-".
+        # DB executor threads run in a copy of the request's context.
+        in_request = has_request_context()
+        route = (request.endpoint if in_request else None) or '-'
+        timing = g.get('profiling') if in_request else None
+        slow = self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms
+
+        with self._lock:
+            entry = self._queries.get((route, fingerprint))
+            if entry is None:
+                entry = self._queries[(route, fingerprint)] = [Histogram(), 0, 0]
+            entry[0].observe(elapsed)
+            entry[1] += rows
+            if slow:
+                entry[2] += 1
+            if timing is not None:
+                timing[1] += elapsed
+                timing[2] += 1
+
+        if slow:
+            self._log_slow(conn, sql, params, normalised, fingerprint, route, elapsed, rows)
+
+    def _log_slow(self, conn, sql, params, normalised, fingerprint, route, elapsed, rows):
+        now = time.monotonic()
+        last = self._last_slow_log.get(fingerprint)
+        if last is not None and now - last < SLOW_LOG_INTERVAL:
+            return
+        self._last_slow_log[fingerprint] = now
+
+        _local.explaining = True
+        try:
+            plan = '; '.join(db_indexes.explain(conn, sql, params))
+        except sqlite3.Error as e:
+            plan = f"(EXPLAIN failed: {e})"
+        finally:
+            _local.explaining = False
+        logger.warning("Slow query %s on %s: %.1fms, %d rows: %s | plan: %s",
+                       fingerprint, route, elapsed * 1000, rows, normalised, plan)
+
+    # Request hooks
+
+    def _before_request(self):
+        # [request start, DB seconds, queries] for the Server-Timing header
+        g.profiling = [time.perf_counter(), 0.0, 0]
+
+    def _after_request(self, response):
+        timing = g.get('profiling')
+        if timing is None or not self.enabled:
+            return response
+        start, db_time, db_queries = timing
+        elapsed = time.perf_counter() - start
+        key = (request.endpoint or '-', request.method)
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(elapsed)
+            status_key = key + (response.status_code,)
+            self._responses[status_key] = self._responses.get(status_key, 0) + 1
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_time * 1000:.2f};desc="{db_queries} queries", '
+            f'app;dur={elapsed * 1000:.2f}')
+        return response
+
+    # Export
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            queries = {key: (entry[0].counts[:], entry[0].total, entry[0].count, entry[1], entry[2])
+                       for key, entry in self._queries.items()}
+            requests = {key: (h.counts[:], h.total, h.count) for key, h in self._requests.items()}
+            responses = dict(self._responses)
+        normalised = {fingerprint: sql for fingerprint, sql in self._sql.values()}
+
+        lines = [
+            '# HELP immunisation_db_query_duration_seconds Query wall time including fetching rows.',
+            '# TYPE immunisation_db_query_duration_seconds histogram',
+        ]
+        for (route, fingerprint), (counts, total, count, _, _) in sorted(queries.items()):
+            lines += _histogram_lines('immunisation_db_query_duration_seconds',
+                                      f'route="{route}",query="{fingerprint}"', counts, total, count)
+
+        lines += ['# HELP immunisation_db_query_rows_total Rows fetched.',
+                  '# TYPE immunisation_db_query_rows_total counter']
+        lines += [f'immunisation_db_query_rows_total{{route="{route}",query="{fingerprint}"}} {rows}'
+                  for (route, fingerprint), (_, _, _, rows, _) in sorted(queries.items())]
+
+        lines += ['# HELP immunisation_db_slow_queries_total Queries slower than the slow query threshold.',
+                  '# TYPE immunisation_db_slow_queries_total counter']
+        lines += [f'immunisation_db_slow_queries_total{{route="{route}",query="{fingerprint}"}} {slow}'
+                  for (route, fingerprint), (_, _, _, _, slow) in sorted(queries.items())]
+
+        lines += ['# HELP immunisation_db_query_info Normalised SQL for each query fingerprint.',
+                  '# TYPE immunisation_db_query_info gauge']
+        seen = sorted({fingerprint for _, fingerprint in queries})
+        lines += [f'immunisation_db_query_info{{query="{fingerprint}",sql="{_escape(normalised[fingerprint])}"}} 1'
+                  for fingerprint in seen if fingerprint in normalised]
+
+        lines += ['# HELP immunisation_http_request_duration_seconds Request latency per route.',
+                  '# TYPE immunisation_http_request_duration_seconds histogram']
+        for (route, method), (counts, total, count) in sorted(requests.items()):
+            lines += _histogram_lines('immunisation_http_request_duration_seconds',
+                                      f'route="{route}",method="{method}"', counts, total, count)
+
+        lines += ['# HELP immunisation_http_responses_total Responses per route and status code.',
+                  '# TYPE immunisation_http_responses_total counter']
+        lines += [f'immunisation_http_responses_total{{route="{route}",method="{method}",status="{status}"}} {count}'
+                  for (route, method, status), count in sorted(responses.items())]
+
+        for prefix, collect in self._gauges:
+            for name, value in sorted(collect().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f'immunisation_{prefix}_{name}'
+                    lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, labels, counts, total, count):
+    cumulative = 0
+    for bound, bucket in zip(DURATION_BUCKETS + ('+Inf',), counts):
+        cumulative += bucket
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f'{name}_sum{{{labels}}} {total:.6f}'
+    yield f'{name}_count{{{labels}}} {count}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
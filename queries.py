@@ -0,0 +1,363 @@
+"""
+SQL used by the dashboard routes.
+
+Keeping the statements in one place lets the routes, `flask db optimize`
+(EXPLAIN QUERY PLAN before/after) and any other tooling run exactly the same SQL.
+"""
+
+# Dropdown / reference queries
+
+VACCINATION_YEARS = "SELECT DISTINCT year FROM Vaccination ORDER BY year"
+
+VACCINATION_YEARS_DESC = "SELECT DISTINCT year FROM Vaccination ORDER BY year DESC"
+
+VACCINATION_ANTIGENS = "SELECT DISTINCT antigen FROM Vaccination ORDER BY antigen"
+
+INFECTION_YEARS = "SELECT DISTINCT year FROM InfectionData ORDER BY year DESC"
+
+ECONOMY_PHASES = "SELECT DISTINCT phase FROM Economy ORDER BY phase"
+
+INFECTION_TYPES = "SELECT id, description FROM Infection_Type ORDER BY description"
+
+
+# A-Level 2: Countries with >= 90% coverage
+# JOIN Vaccination, Country, and Region tables. Countries without a Region
+# row are listed under 'Unassigned' (aggregates.UNASSIGNED) rather than
+# dropped, and blank coverage values are skipped rather than compared as text.
+A2_COUNTRIES = """
+    SELECT
+        v.antigen,
+        v.year,
+        c.name as country_name,
+        COALESCE(r.region, 'Unassigned') as region,
+        v.coverage
+    FROM Vaccination v
+    INNER JOIN Country c ON v.country = c.CountryID
+    LEFT JOIN Region r ON c.region = r.RegionID
+    WHERE v.year = ? AND v.antigen = ?
+        AND typeof(v.coverage) IN ('integer', 'real')
+        AND v.coverage >= 90
+    ORDER BY v.coverage DESC, c.name
+"""
+
+# A-Level 2: Count of countries meeting 90% target per region
+# Uses GROUP BY to aggregate by region
+A2_REGIONS = """
+    SELECT
+        v.antigen,
+        v.year,
+        COALESCE(r.region, 'Unassigned') as region,
+        COUNT(DISTINCT c.CountryID) as country_count
+    FROM Vaccination v
+    INNER JOIN Country c ON v.country = c.CountryID
+    LEFT JOIN Region r ON c.region = r.RegionID
+    WHERE v.year = ? AND v.antigen = ?
+        AND typeof(v.coverage) IN ('integer', 'real')
+        AND v.coverage >= 90
+    GROUP BY COALESCE(r.region, 'Unassigned')
+    ORDER BY country_count DESC, region
+"""
+
+# A-Level 3: Vaccination rate improvement between two years
+# Improvement = end_coverage - start_coverage
+# Blank coverage values sort above every number in SQLite, so they are
+# skipped rather than counted as an increase.
+# Params: (start_year, end_year, start_year, end_year, antigen, top_n)
+A3_IMPROVEMENT = """
+    SELECT
+        c.name as country_name,
+        (v2.coverage - v1.coverage) as rate_increase,
+        v1.coverage as start_coverage,
+        v2.coverage as end_coverage,
+        ? as start_year,
+        ? as end_year
+    FROM Vaccination v1
+    INNER JOIN Vaccination v2
+        ON v1.country = v2.country
+        AND v1.antigen = v2.antigen
+    INNER JOIN Country c ON v1.country = c.CountryID
+    WHERE v1.year = ?
+        AND v2.year = ?
+        AND v1.antigen = ?
+        AND typeof(v1.coverage) IN ('integer', 'real')
+        AND typeof(v2.coverage) IN ('integer', 'real')
+        AND v2.coverage > v1.coverage
+    ORDER BY rate_increase DESC, c.name
+    LIMIT ?
+"""
+
+# Batch versions for comparing several years / antigens in one request
+# (see comparison.py). {years} and {antigens} are filled in with one ?
+# placeholder per value by in_list(). Blank coverage values are skipped
+# rather than compared as text.
+
+# A-Level 2 batch: every (antigen, year) cell where a country meets the 90% target
+A2_COUNTRIES_BATCH = """
+    SELECT
+        v.antigen,
+        v.year,
+        c.CountryID as country_code,
+        c.name as country_name,
+        COALESCE(r.region, 'Unassigned') as region,
+        v.coverage
+    FROM Vaccination v
+    INNER JOIN Country c ON v.country = c.CountryID
+    LEFT JOIN Region r ON c.region = r.RegionID
+    WHERE v.year IN ({years})
+        AND v.antigen IN ({antigens})
+        AND typeof(v.coverage) IN ('integer', 'real')
+        AND v.coverage >= 90
+    ORDER BY c.name, v.antigen, v.year
+"""
+
+# A-Level 3 batch: coverage for every selected (antigen, year), read in one scan
+# instead of a self-join per antigen
+A3_COVERAGE_SERIES = """
+    SELECT
+        c.CountryID as country_code,
+        c.name as country_name,
+        v.antigen,
+        v.year,
+        v.coverage
+    FROM Vaccination v
+    INNER JOIN Country c ON v.country = c.CountryID
+    WHERE v.year IN ({years})
+        AND v.antigen IN ({antigens})
+        AND typeof(v.coverage) IN ('integer', 'real')
+    ORDER BY c.name, v.antigen, v.year
+"""
+
+
+def in_list(values):
+    """Placeholders for an IN (...) list with one ? per value."""
+    return ', '.join('?' * len(values))
+
+
+# B-Level 2: Cases per 100,000 people
+# Calculate: (cases / population) * 100,000
+B2_DETAILED = """
+    SELECT
+        it.description as disease,
+        c.name as country,
+        e.phase as economic_phase,
+        id.year,
+        ROUND((id.cases * 100000.0 / cp.population), 2) as cases_per_100k,
+        id.cases as total_cases
+    FROM InfectionData id
+    INNER JOIN Country c ON id.country = c.CountryID
+    INNER JOIN Economy e ON c.economy = e.economyID
+    INNER JOIN Infection_Type it ON id.inf_type = it.id
+    INNER JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    WHERE e.phase = ?
+        AND it.id = ?
+        AND id.year = ?
+    ORDER BY cases_per_100k DESC, c.name
+"""
+
+# B-Level 2: Total cases by economic phase
+# Uses GROUP BY to aggregate data; countries without an Economy row are
+# counted under 'Unassigned'
+B2_SUMMARY = """
+    SELECT
+        it.description as disease,
+        COALESCE(e.phase, 'Unassigned') as economic_phase,
+        id.year,
+        SUM(id.cases) as total_cases,
+        COUNT(DISTINCT c.CountryID) as country_count
+    FROM InfectionData id
+    INNER JOIN Country c ON id.country = c.CountryID
+    LEFT JOIN Economy e ON c.economy = e.economyID
+    INNER JOIN Infection_Type it ON id.inf_type = it.id
+    WHERE it.id = ? AND id.year = ?
+    GROUP BY COALESCE(e.phase, 'Unassigned')
+    ORDER BY total_cases DESC, economic_phase
+"""
+
+# B-Level 3: Global average infection rate per 100,000
+B3_AVERAGE = """
+    SELECT
+        AVG((id.cases * 100000.0 / cp.population)) as avg_rate
+    FROM InfectionData id
+    INNER JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    WHERE id.inf_type = ? AND id.year = ?
+"""
+
+# B-Level 3: Countries with above-average infection rates
+# Params: (inf_type, year, inf_type, year, top_n)
+B3_ABOVE_AVERAGE = """
+    SELECT
+        c.name as country,
+        it.description as infection_type,
+        ROUND((id.cases * 100000.0 / cp.population), 2) as infection_per_100k,
+        id.year,
+        id.cases as total_cases
+    FROM InfectionData id
+    INNER JOIN Country c ON id.country = c.CountryID
+    INNER JOIN Infection_Type it ON id.inf_type = it.id
+    INNER JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    WHERE id.inf_type = ?
+        AND id.year = ?
+        AND (id.cases * 100000.0 / cp.population) > (
+            SELECT AVG((cases * 100000.0 / population))
+            FROM InfectionData id2
+            INNER JOIN CountryPopulation cp2
+                ON id2.country = cp2.country AND id2.year = cp2.year
+            WHERE id2.inf_type = ? AND id2.year = ?
+        )
+    ORDER BY infection_per_100k DESC, c.name
+    LIMIT ?
+"""
+
+
+# Versions of the above that read the materialised aggregate tables
+# (see aggregates.py). Used once `flask db materialise` has been run.
+
+# The region / phase rollups are lookups in the cubes ('*' = every phase / region)
+A2_REGIONS_AGG = """
+    SELECT
+        antigen,
+        year,
+        region,
+        target_met as country_count
+    FROM agg_coverage_cube
+    WHERE year = ? AND antigen = ?
+        AND phase = '*' AND region != '*' AND target_met > 0
+    ORDER BY country_count DESC, region
+"""
+
+B2_SUMMARY_AGG = """
+    SELECT
+        it.description as disease,
+        ic.phase as economic_phase,
+        ic.year,
+        ic.total_cases,
+        ic.country_count
+    FROM agg_infection_cube ic
+    INNER JOIN Infection_Type it ON ic.inf_type = it.id
+    WHERE ic.inf_type = ? AND ic.year = ?
+        AND ic.region = '*' AND ic.phase != '*'
+    ORDER BY total_cases DESC, economic_phase
+"""
+
+B2_DETAILED_AGG = """
+    SELECT
+        it.description as disease,
+        c.name as country,
+        e.phase as economic_phase,
+        ir.year,
+        ROUND(ir.cases_per_100k, 2) as cases_per_100k,
+        ir.cases as total_cases
+    FROM agg_infection_rate ir
+    INNER JOIN Country c ON ir.country = c.CountryID
+    INNER JOIN Economy e ON c.economy = e.economyID
+    INNER JOIN Infection_Type it ON ir.inf_type = it.id
+    WHERE e.phase = ?
+        AND ir.inf_type = ?
+        AND ir.year = ?
+    ORDER BY cases_per_100k DESC, c.name
+"""
+
+# A primary-key lookup; no row when there is no data for (inf_type, year)
+B3_AVERAGE_AGG = """
+    SELECT avg_rate FROM agg_infection_avg
+    WHERE inf_type = ? AND year = ?
+"""
+
+# Params: (inf_type, year, top_n)
+B3_ABOVE_AVERAGE_AGG = """
+    SELECT
+        c.name as country,
+        it.description as infection_type,
+        ROUND(ir.cases_per_100k, 2) as infection_per_100k,
+        ir.year,
+        ir.cases as total_cases
+    FROM agg_infection_rate ir
+    INNER JOIN agg_infection_avg a
+        ON ir.inf_type = a.inf_type AND ir.year = a.year
+    INNER JOIN Country c ON ir.country = c.CountryID
+    INNER JOIN Infection_Type it ON ir.inf_type = it.id
+    WHERE ir.inf_type = ?
+        AND ir.year = ?
+        AND ir.cases_per_100k > a.avg_rate
+    ORDER BY infection_per_100k DESC, c.name
+    LIMIT ?
+"""
+
+
+# Country profiles (country_index.py): every country's rows in one ordered
+# scan per table, grouped by country in Python
+
+COUNTRY_PROFILES = """
+    SELECT
+        c.CountryID as country_code,
+        c.name,
+        COALESCE(r.region, 'Unassigned') as region,
+        COALESCE(e.phase, 'Unassigned') as economy
+    FROM Country c
+    LEFT JOIN Region r ON c.region = r.RegionID
+    LEFT JOIN Economy e ON c.economy = e.economyID
+    ORDER BY c.name
+"""
+
+COUNTRY_POPULATION_SERIES = """
+    SELECT country, year, population
+    FROM CountryPopulation
+    WHERE population IS NOT NULL
+    ORDER BY country, year
+"""
+
+COUNTRY_COVERAGE_SERIES = """
+    SELECT country, antigen, year, coverage
+    FROM Vaccination
+    WHERE typeof(coverage) IN ('integer', 'real')
+    ORDER BY country, antigen, year
+"""
+
+COUNTRY_INFECTION_SERIES = """
+    SELECT
+        id.country,
+        id.inf_type,
+        it.description,
+        id.year,
+        id.cases,
+        cp.population,
+        ROUND((id.cases * 100000.0 / cp.population), 2) as cases_per_100k
+    FROM InfectionData id
+    INNER JOIN Infection_Type it ON id.inf_type = it.id
+    LEFT JOIN CountryPopulation cp
+        ON id.country = cp.country AND id.year = cp.year
+    ORDER BY id.country, it.description, id.year
+"""
+
+
+# Every route query with representative parameters, used for EXPLAIN QUERY PLAN
+ROUTE_QUERIES = {
+    'a_level2: dropdown years': (VACCINATION_YEARS_DESC, ()),
+    'a_level2: dropdown antigens': (VACCINATION_ANTIGENS, ()),
+    'a_level2: countries >= 90%': (A2_COUNTRIES, (2020, 'MCV1')),
+    'a_level2: regions meeting target': (A2_REGIONS, (2020, 'MCV1')),
+    'a_level2: compare years/antigens': (A2_COUNTRIES_BATCH.format(years='?, ?', antigens='?, ?'),
+                                         (2019, 2020, 'MCV1', 'DTPCV3')),
+    'a_level3: improvement': (A3_IMPROVEMENT, (2000, 2020, 2000, 2020, 'MCV1', 10)),
+    'a_level3: compare antigens': (A3_COVERAGE_SERIES.format(years='?, ?', antigens='?, ?'),
+                                   (2000, 2020, 'MCV1', 'DTPCV3')),
+    'b_level2: dropdown phases': (ECONOMY_PHASES, ()),
+    'b_level2: dropdown infection types': (INFECTION_TYPES, ()),
+    'b_level2: dropdown years': (INFECTION_YEARS, ()),
+    'b_level2: cases per 100k': (B2_DETAILED, ('Low Income', 'MEA', 2020)),
+    'b_level2: summary by economy': (B2_SUMMARY, ('MEA', 2020)),
+    'b_level3: average rate': (B3_AVERAGE, ('MEA', 2020)),
+    'b_level3: above average': (B3_ABOVE_AVERAGE, ('MEA', 2020, 'MEA', 2020, 10)),
+}
+
+# Aggregate-table route queries (only explained once the tables exist)
+AGGREGATE_ROUTE_QUERIES = {
+    'a_level2: regions meeting target (materialised)': (A2_REGIONS_AGG, (2020, 'MCV1')),
+    'b_level2: cases per 100k (materialised)': (B2_DETAILED_AGG, ('Low Income', 'MEA', 2020)),
+    'b_level2: summary by economy (materialised)': (B2_SUMMARY_AGG, ('MEA', 2020)),
+    'b_level3: average rate (materialised)': (B3_AVERAGE_AGG, ('MEA', 2020)),
+    'b_level3: above average (materialised)': (B3_ABOVE_AVERAGE_AGG, ('MEA', 2020, 10)),
+}
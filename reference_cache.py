@@ -0,0 +1,107 @@
+"""
+Cache for the dropdown / reference data shared by the analysis pages.
+
+The year, antigen, economy phase and infection type lists only change when the
+database changes, but every GET and POST used to re-run a DISTINCT scan for
+each of them. They are now loaded once at startup and reloaded only when the
+DataVersion watcher reports that immunisation.db has changed.
+"""
+
+import threading
+
+import queries
+
+
+class ReferenceCache:
+    """
+    Holds the reference lists in memory.
+
+    - get() returns a dict of lists, loading it on first use
+    - the cache is dropped automatically when the data version changes
+    - hits, misses (loads) and invalidations are counted for stats()
+    """
+
+    def __init__(self, connect, data_version):
+        self._connect = connect
+        self._data_version = data_version
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        data_version.on_change(self.invalidate)
+
+    def _load(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute(queries.VACCINATION_YEARS)
+            vaccination_years = [row['year'] for row in cursor.fetchall()]
+
+            cursor.execute(queries.VACCINATION_ANTIGENS)
+            antigens = [row['antigen'] for row in cursor.fetchall()]
+
+            cursor.execute(queries.INFECTION_YEARS)
+            infection_years = [row['year'] for row in cursor.fetchall()]
+
+            cursor.execute(queries.ECONOMY_PHASES)
+            economy_phases = [row['phase'] for row in cursor.fetchall()]
+
+            cursor.execute(queries.INFECTION_TYPES)
+            infection_types = [{'id': row['id'], 'description': row['description']}
+                               for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        return {
+            'vaccination_years': vaccination_years,
+            'vaccination_years_desc': list(reversed(vaccination_years)),
+            'antigens': antigens,
+            'infection_years': infection_years,
+            'economy_phases': economy_phases,
+            'infection_types': infection_types,
+        }
+
+    def get(self):
+        """
+        Return the reference data, reloading it if the DB has changed.
+        Raises sqlite3.Error if the database can't be read.
+        """
+        version = self._data_version.current()
+        data = self._data
+        if data is not None and self._loaded_version == version:
+            self.hits += 1
+            return data
+
+        with self._lock:
+            # Another thread may have loaded it while we waited
+            if self._data is not None and self._loaded_version == version:
+                self.hits += 1
+                return self._data
+            self.misses += 1
+            self._data = self._load()
+            self._loaded_version = version
+            return self._data
+
+    def invalidate(self, version=None):
+        """Drop the cached lists; the next get() reloads them."""
+        with self._lock:
+            if self._data is not None:
+                self.invalidations += 1
+            self._data = None
+            self._loaded_version = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'loaded': self._data is not None,
+            'version': self._loaded_version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'invalidations': self.invalidations,
+        }
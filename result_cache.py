@@ -0,0 +1,145 @@
+"""
+Memoising cache for the parameterised analysis queries.
+
+The filter space of the analysis pages is small (years x antigens x
+infection types), so the same joins get recomputed over and over. Results are
+cached per (route, filters) with LRU eviction and an optional TTL, stored as
+compact named tuples rather than sqlite3.Row objects, and the whole cache is
+cleared whenever the DataVersion watcher reports a DB change. When the change
+was an ingest (see ingest.py), only results tagged with one of the partitions
+it touched are dropped.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import ingest
+
+_MISSING = object()
+
+# One namedtuple class per distinct column list
+_row_types = {}
+
+
+def row_type(columns):
+    """namedtuple class for a tuple of column names (created once and reused)."""
+    columns = tuple(columns)
+    cls = _row_types.get(columns)
+    if cls is None:
+        cls = namedtuple('ResultRow', columns, rename=True)
+        _row_types[columns] = cls
+    return cls
+
+
+def compact_rows(cursor):
+    """
+    Fetch all rows from an executed cursor as namedtuples.
+    Templates can still use row['column'] because Jinja falls back to
+    attribute access when item access fails.
+    """
+    cls = row_type(col[0] for col in cursor.description)
+    return [cls._make(row) for row in cursor.fetchall()]
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of query results keyed on (route, filters).
+
+    - maxsize: number of entries kept before the least recently used is evicted
+    - ttl: optional lifetime in seconds for each entry (None = until DB changes)
+    """
+
+    def __init__(self, data_version, maxsize=512, ttl=None):
+        self._data_version = data_version
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+
+        data_version.on_change(self._on_change)
+
+    def _on_change(self, version):
+        changes = self._data_version.changes
+        if changes is None:
+            self.clear()
+        else:
+            self.invalidate(changes)
+
+    def get(self, key, default=None):
+        """Cached value for key, or default if there is none."""
+        # Gives the watcher a chance to clear us if the DB has changed
+        self._data_version.current()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, stored_at, _partitions = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, partitions=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), partitions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def fetch(self, key, run, partitions=None):
+        """
+        Return the cached result for key, or call run() and cache what it returns.
+        partitions tags the result with the data partitions it was built from
+        (ingest.coverage_partitions() etc.); untagged results are dropped on any change.
+        A result of None is cached like any other.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = run()
+            self.set(key, value, partitions)
+        return value
+
+    def clear(self, version=None):
+        """Drop every cached result (called automatically when the DB changes)."""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def invalidate(self, partitions):
+        """Drop the results built from any of these (kind, key, year) partitions."""
+        with self._lock:
+            stale = [key for key, (_, _, tags) in self._entries.items()
+                     if ingest.affected(tags, partitions)]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.invalidations += 1
+        return len(stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'expired': self.expired,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,197 @@
+"""
+Production launcher: pre-forks worker processes that share one listening
+socket.
+
+    pip install waitress
+    python serve.py --workers 4 --port 8000
+    SECRET_KEY=... IMMUNISATION_DB=/data/immunisation.db python serve.py
+
+Each worker serves its share of connections with waitress, a production
+WSGI server, on a pool of --threads threads. `--server werkzeug` uses
+Werkzeug's development server instead (no extra dependency), which is not
+meant for production traffic.
+
+Start-up happens in two stages:
+- master: builds the app once with create_app() (reference data, compiled
+  templates, columnar arrays or their mmap'd snapshot if selected), reads
+  the DB file into the OS page cache, closes its SQLite handles and freezes
+  the GC heap. Everything
+  loaded here is shared with the workers copy-on-write, and every worker's
+  mmap'd reads hit the same cached pages.
+- worker: opens its pooled connections and reports its warm-up time and
+  RSS before accepting connections.
+
+The master restarts workers that exit unexpectedly and stops them all on
+SIGINT/SIGTERM. Unix only (needs os.fork).
+"""
+
+import gc
+import os
+import secrets
+import signal
+import socket
+import sys
+import time
+
+import click
+from werkzeug.serving import make_server
+
+from app import create_app, release_connections, warm_up
+
+try:
+    import waitress
+except ImportError:  # pragma: no cover - optional dependency
+    waitress = None
+
+SERVERS = ('waitress', 'werkzeug')
+
+
+def _memory_mb():
+    """(RSS, shared) in MB for this process, from /proc where available."""
+    try:
+        with open('/proc/self/statm') as f:
+            _, resident, shared = (int(value) for value in f.read().split()[:3])
+        page = os.sysconf('SC_PAGE_SIZE')
+        return resident * page / 2**20, shared * page / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, None
+
+
+def _prefetch(path, chunk_size=1024 * 1024):
+    """Read the DB file once so its pages are in the OS page cache."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return 0
+    total = 0
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        while True:
+            data = os.read(fd, chunk_size)
+            if not data:
+                break
+            total += len(data)
+    finally:
+        os.close(fd)
+    return total
+
+
+def _serve_forever(server, app, sock, threads):
+    """Serve app on the shared listening socket until the process is signalled."""
+    if server == 'waitress':
+        waitress.serve(app, sockets=[sock], threads=threads)
+    else:
+        host, port = sock.getsockname()[:2]
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def _run_worker(app, sock, number, boot_start, server, threads):
+    """Body of a forked worker: warm up, report, then serve until signalled."""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    warm_seconds = warm_up(app)
+    rss, shared = _memory_mb()
+    shared_text = f", {shared:.1f}MB shared" if shared is not None else ''
+    print(f"[worker {number} pid {os.getpid()}] ready: warm-up {warm_seconds * 1000:.0f}ms, "
+          f"{time.perf_counter() - boot_start:.2f}s since boot, RSS {rss:.1f}MB{shared_text}",
+          flush=True)
+
+    _serve_forever(server, app, sock, threads)
+
+
+def _spawn(app, sock, number, boot_start, server, threads):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, number, boot_start, server, threads)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--workers', default=os.cpu_count() or 2, show_default=True, help='Worker processes.')
+@click.option('--backlog', default=128, show_default=True, help='Listen queue length.')
+@click.option('--threads', default=8, show_default=True, help='Request threads per worker.')
+@click.option('--server', type=click.Choice(SERVERS), default='waitress', show_default=True,
+              help="WSGI server run by each worker; 'werkzeug' is the development server.")
+def serve(host, port, workers, backlog, threads, server):
+    """Serve the app with pre-forked, pre-warmed worker processes."""
+    boot_start = time.perf_counter()
+    if server == 'waitress' and waitress is None:
+        raise click.ClickException("waitress is not installed (pip install waitress); "
+                                   "'--server werkzeug' runs the development server instead")
+    if server == 'werkzeug':
+        print("Using Werkzeug's development server; don't use it for production traffic", flush=True)
+
+    # All workers must agree on the secret key, so pick one before forking
+    config = {}
+    if not os.environ.get('SECRET_KEY'):
+        config['SECRET_KEY'] = secrets.token_hex(32)
+        print("SECRET_KEY not set; using a random key for this run", flush=True)
+
+    app = create_app(config)
+    warm_up(app)
+    db_bytes = _prefetch(app.config['DATABASE'])
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+
+    # SQLite handles can't cross fork(); workers reopen their own
+    release_connections(app)
+    # Keep the objects loaded so far out of the GC's way, so collections in
+    # the workers don't touch (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+
+    rss, _ = _memory_mb()
+    print(f"[master pid {os.getpid()}] app loaded in {time.perf_counter() - boot_start:.2f}s, "
+          f"{db_bytes / 2**20:.1f}MB DB prefetched, RSS {rss:.1f}MB; "
+          f"listening on http://{host}:{port} with {workers} {server} worker(s)", flush=True)
+
+    children = {_spawn(app, sock, number, boot_start, server, threads): number for number in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        number = children.pop(pid, None)
+        if number is not None and not stopping:
+            print(f"[master] worker {number} (pid {pid}) exited with status {status}; restarting",
+                  file=sys.stderr, flush=True)
+            children[_spawn(app, sock, number, time.perf_counter(), server, threads)] = number
+
+    sock.close()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,251 @@
+"""
+Binary snapshot of the columnar store, for fast cold starts.
+
+Building a ColumnarStore reads every Vaccination / InfectionData /
+CountryPopulation row through sqlite3 and Python tuples, in every worker.
+`flask db snapshot` does that once and writes the finished arrays to a file:
+
+- typed column arrays (country codes, coverage, cases, per-100k rates, ...)
+- the dictionaries behind the encoded country / antigen / inf_type codes and
+  the (antigen, year) / (inf_type, year) slice bounds, as JSON
+
+load() maps the file with mmap and wraps the arrays around the mapped pages
+without copying, so every process serving from the same snapshot shares one
+copy of the data through the OS page cache.
+
+The header records the identity of the DB the snapshot was built from: the
+size and mtime of the DB and -wal files plus the file change counter and
+schema cookie from the SQLite header (see db_identity). load() compares only
+those, so a cold start reads no data pages. A snapshot of another format or
+DB identity raises SnapshotError, and ColumnarBackend loads the store from
+SQLite instead. The header also keeps the SHA-256 of the DB and the CRC of
+the payload for the full check, verify() (`flask db snapshot --verify`).
+
+File layout: MAGIC, header length (uint32 LE), header JSON, then the arrays,
+each starting on an ALIGNMENT boundary.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+import columnar
+
+MAGIC = b'IMMSNAP\x00'
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+
+# ColumnarStore attributes stored as raw arrays
+ARRAYS = ('in_country_table', 'v_country', 'v_coverage', 'population', 'has_population',
+          'i_country', 'i_cases', 'i_rate', 'i_has_population')
+
+# Per-country attributes holding Python strings (or None), stored in the header
+OBJECT_ARRAYS = ('country_name', 'country_region', 'country_economy')
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, corrupt, of another format or built from another DB."""
+
+
+def db_identity(db_path):
+    """
+    Cheap fingerprint of db_path's contents, checked on every load: [size,
+    mtime_ns] of the DB file and its -wal file (None if absent or empty) and
+    the file change counter and schema cookie from the 100-byte DB header.
+    Any write changes at least one of them; no data pages are read.
+    """
+    files = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            files.append(None)
+            continue
+        # An empty -wal (opened by a reader, or truncated after a checkpoint) adds nothing
+        files.append([stat.st_size, stat.st_mtime_ns] if stat.st_size or path == db_path else None)
+    with open(db_path, 'rb') as f:
+        header = f.read(100)
+    counter, cookie = struct.unpack('>I12xI', header[24:44]) if len(header) == 100 else (None, None)
+    return {'db': files[0], 'wal': files[1], 'change_counter': counter, 'schema_cookie': cookie}
+
+
+def db_checksum(db_path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of the DB file and its -wal file (if any), i.e. of everything a
+    reader could see. Any write changes it. Reads the whole DB, so only
+    export() and verify() use it.
+    """
+    digest = hashlib.sha256()
+    for path in (db_path, db_path + '-wal'):
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pad(offset):
+    return -offset % ALIGNMENT
+
+
+def _slices(slices):
+    """{(code, year): (start, end)} as JSON-friendly [code, year, start, end] lists."""
+    return [[code, year, start, end] for (code, year), (start, end) in slices.items()]
+
+
+def export(conn, db_path, out_path):
+    """
+    Build a ColumnarStore from conn and write it to out_path (replaced
+    atomically, so processes still mapping the old file are unaffected).
+    Returns the header written.
+    """
+    if np is None:
+        raise RuntimeError("Snapshots require NumPy (pip install numpy)")
+    identity = db_identity(db_path)
+    checksum = db_checksum(db_path)
+    store = columnar.ColumnarStore.load(conn)
+
+    arrays, offset = {}, 0
+    for name in ARRAYS:
+        array = np.ascontiguousarray(getattr(store, name))
+        arrays[name] = [array.dtype.str, list(array.shape), offset, array.nbytes]
+        offset += array.nbytes + _pad(array.nbytes)
+
+    crc = 0
+    for name in ARRAYS:
+        crc = zlib.crc32(np.ascontiguousarray(getattr(store, name)).data, crc)
+        crc = zlib.crc32(bytes(_pad(arrays[name][3])), crc)
+
+    header = {
+        'format': FORMAT_VERSION,
+        'db_identity': identity,
+        'db_checksum': checksum,
+        'created_at': time.time(),
+        'payload_bytes': offset,
+        'payload_crc32': crc,
+        'arrays': arrays,
+        'country_ids': store.country_ids,
+        'antigen_ids': store.antigen_ids,
+        'inf_type_ids': store.inf_type_ids,
+        'infection_descriptions': store.infection_descriptions,
+        'year0': store.year0,
+        'vaccination_slices': _slices(store.vaccination_slices),
+        'infection_slices': _slices(store.infection_slices),
+    }
+    for name in OBJECT_ARRAYS:
+        header[name] = getattr(store, name).tolist()
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    prefix = len(MAGIC) + 4 + len(header_bytes)
+    tmp_path = f"{out_path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            f.write(bytes(_pad(prefix)))
+            for name in ARRAYS:
+                f.write(np.ascontiguousarray(getattr(store, name)).data)
+                f.write(bytes(_pad(arrays[name][3])))
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return header
+
+
+def read_header(path):
+    """(header dict, offset of the first array) without mapping the arrays."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file")
+        (length,) = struct.unpack('<I', f.read(4))
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            raise SnapshotError(f"{path} has a corrupt header")
+    prefix = len(MAGIC) + 4 + length
+    return header, prefix + _pad(prefix)
+
+
+def check(path, db_path):
+    """
+    (header, offset of the first array) if the snapshot at path is of this
+    format and was built from db_path as it is now (by db_identity), else
+    SnapshotError.
+    """
+    header, start = read_header(path)
+    if header.get('format') != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has format {header.get('format')}, expected {FORMAT_VERSION}")
+    if header['db_identity'] != db_identity(db_path):
+        raise SnapshotError(f"{path} was built from a different version of {db_path}")
+    return header, start
+
+
+def verify(path, db_path):
+    """
+    check(), then the full comparison: the SHA-256 of the DB and the CRC of
+    every array. Reads both files end to end. Returns the header.
+    """
+    header, start = check(path, db_path)
+    if header['db_checksum'] != db_checksum(db_path):
+        raise SnapshotError(f"{path} was built from a different version of {db_path}")
+    with open(path, 'rb') as f:
+        f.seek(start)
+        payload = f.read(header['payload_bytes'])
+    if len(payload) != header['payload_bytes'] or zlib.crc32(payload) != header['payload_crc32']:
+        raise SnapshotError(f"{path} is truncated or corrupt")
+    return header
+
+
+def load(path, db_path):
+    """
+    A ColumnarStore whose arrays are read-only views of the mmap'd snapshot.
+    Raises SnapshotError if check() fails. The payload isn't read here, only
+    mapped: corruption inside it is found by verify().
+    """
+    if np is None:
+        raise RuntimeError("Snapshots require NumPy (pip install numpy)")
+    header, start = check(path, db_path)
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < start + header['payload_bytes']:
+        raise SnapshotError(f"{path} is truncated or corrupt")
+
+    store = columnar.ColumnarStore()
+    for name, (dtype, shape, offset, nbytes) in header['arrays'].items():
+        array = np.frombuffer(mapped, dtype=np.dtype(dtype), count=nbytes // np.dtype(dtype).itemsize,
+                              offset=start + offset)
+        setattr(store, name, array.reshape(shape))
+    for name in OBJECT_ARRAYS:
+        values = header[name]
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        setattr(store, name, array)
+
+    store.country_ids = header['country_ids']
+    store.country_codes = {cid: i for i, cid in enumerate(store.country_ids)}
+    store.antigen_ids = header['antigen_ids']
+    store.antigen_codes = {a: i for i, a in enumerate(store.antigen_ids)}
+    store.inf_type_ids = header['inf_type_ids']
+    store.inf_type_codes = {t: i for i, t in enumerate(store.inf_type_ids)}
+    store.infection_descriptions = header['infection_descriptions']
+    store.year0 = header['year0']
+    store.vaccination_slices = {(code, year): (s, e) for code, year, s, e in header['vaccination_slices']}
+    store.infection_slices = {(code, year): (s, e) for code, year, s, e in header['infection_slices']}
+    # Keeps the mapping open for as long as the store's arrays point into it
+    store.snapshot = mapped
+    return store
@@ -0,0 +1,53 @@
+/*
+ * Partial page updates for the analysis pages.
+ *
+ * Filter forms on a page with a #results element are submitted with fetch()
+ * and an HX-Request header instead of a full page load. The server answers
+ * with just the results section (see render_page() in app.py), which replaces
+ * #results, and the address bar is updated so the result can still be
+ * bookmarked, shared and reloaded. Without JavaScript the forms submit normally.
+ */
+(function () {
+    'use strict';
+
+    var results = document.getElementById('results');
+    if (!results || !window.fetch || !window.URLSearchParams) {
+        return;
+    }
+
+    function load(url) {
+        results.setAttribute('aria-busy', 'true');
+        return fetch(url, {headers: {'HX-Request': 'true'}})
+            .then(function (response) {
+                return response.text().then(function (html) {
+                    results.innerHTML = html;
+                    // An error from the previous full page load no longer applies
+                    document.querySelectorAll('main > .alert-error').forEach(function (alert) {
+                        alert.remove();
+                    });
+                    // Redirects (e.g. /country?country=AFG) end at the URL to keep
+                    history.pushState({partial: true}, '', response.url || url);
+                });
+            })
+            .catch(function () {
+                // Network trouble: fall back to a normal page load
+                window.location.href = url;
+            })
+            .then(function () {
+                results.removeAttribute('aria-busy');
+            });
+    }
+
+    document.querySelectorAll('form.filter-form[method="GET"], form.filter-form[method="get"]').forEach(function (form) {
+        form.addEventListener('submit', function (event) {
+            event.preventDefault();
+            var query = new URLSearchParams(new FormData(form)).toString();
+            load(form.action + (query ? '?' + query : ''));
+        });
+    });
+
+    // Back / forward: the forms' selections belong to that URL too, so load the whole page
+    window.addEventListener('popstate', function () {
+        window.location.reload();
+    });
+}());
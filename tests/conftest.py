@@ -0,0 +1,47 @@
+"""
+Shared fixtures. Every test gets its own copy of immunisation.db, so tests
+that write (ingest, direct UPDATEs) never touch the shipped database.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app, release_connections  # noqa: E402
+
+SOURCE_DB = os.path.join(ROOT, 'immunisation.db')
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    if not os.path.exists(SOURCE_DB):
+        pytest.skip("immunisation.db not found")
+    path = str(tmp_path / 'immunisation.db')
+    shutil.copy(SOURCE_DB, path)
+    return path
+
+
+@pytest.fixture
+def make_app(db_path):
+    """create_app() against the test's DB copy; config overrides as keyword arguments."""
+    apps = []
+
+    def make(**config):
+        app = create_app({'DATABASE': db_path, 'DB_VERSION_CHECK_INTERVAL': 0, **config})
+        app.testing = True
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        release_connections(app)
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app().test_client()
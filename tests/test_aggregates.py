@@ -0,0 +1,95 @@
+"""Materialised aggregates: dirty partitions must never be answered from the agg_ tables."""
+
+import sqlite3
+
+import aggregates
+import db_indexes
+import queries
+
+
+def _regions(app, year, antigen):
+    backend = app.extensions['analytics_backends']['sqlite']
+    with app.extensions['db_pool'].acquire() as conn:
+        return {row.region: row.country_count for row in backend.a2_regions(conn, year, antigen)}
+
+
+def _raw_regions(db_path, year, antigen):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {region: count for region, count in conn.execute(queries.A2_REGIONS, (year, antigen))}
+    finally:
+        conn.close()
+
+
+def test_dirty_partition_falls_back_to_raw_tables(db_path, make_app):
+    aggregates.materialise(db_path)
+    app = make_app()
+    backend = app.extensions['analytics_backends']['sqlite']
+
+    before = _regions(app, 2020, 'MCV1')
+    assert sum(before.values()) > 0
+    with app.extensions['db_pool'].acquire() as conn:
+        assert backend.aggregates_ready(conn, [('coverage', 'MCV1', '2020')])
+
+    # A direct write: the triggers mark (MCV1, 2020) dirty, the cube isn't rebuilt yet
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE Vaccination SET coverage = 0 WHERE antigen = 'MCV1' AND year = 2020")
+    conn.close()
+    app.extensions['data_version'].check(force=True)
+
+    with app.extensions['db_pool'].acquire() as conn:
+        assert not backend.aggregates_ready(conn, [('coverage', 'MCV1', '2020')])
+        # Other partitions are still read from the cube
+        assert backend.aggregates_ready(conn, [('coverage', 'MCV1', '2019')])
+    assert _regions(app, 2020, 'MCV1') == _raw_regions(db_path, 2020, 'MCV1') == {}
+
+    # After a refresh the cube is current and used again
+    aggregates.materialise(db_path)
+    app.extensions['data_version'].check(force=True)
+    with app.extensions['db_pool'].acquire() as conn:
+        assert backend.aggregates_ready(conn, [('coverage', 'MCV1', '2020')])
+    assert _regions(app, 2020, 'MCV1') == {}
+
+
+def test_dirty_partition_page_shows_current_data(db_path, make_app):
+    aggregates.materialise(db_path)
+    client = make_app(HTTP_CACHE_ENABLED=False).test_client()
+    url = '/b_level3?infection_type=MEA&year=2019&top_n=50'
+    assert b'Samoa' in client.get(url).data
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE InfectionData SET cases = 0 WHERE inf_type = 'MEA' AND year = 2019 AND country = 'WSM'")
+    conn.close()
+    client.application.extensions['data_version'].check(force=True)
+    assert b'Samoa' not in client.get(url).data
+
+
+def test_materialised_route_queries_use_indexes(db_path):
+    aggregates.materialise(db_path)
+    db_indexes.optimize(db_path, echo=lambda *args: None)
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, (sql, params) in queries.AGGREGATE_ROUTE_QUERIES.items():
+            assert db_indexes.full_scans(db_indexes.explain(conn, sql, params)) == [], name
+    finally:
+        conn.close()
+
+
+def test_materialise_rolls_back_on_failure(db_path, monkeypatch):
+    def fail(conn):
+        raise sqlite3.OperationalError("boom")
+
+    monkeypatch.setattr(aggregates, '_rebuild_dirty', fail)
+    try:
+        aggregates.materialise(db_path)
+    except sqlite3.OperationalError:
+        pass
+    conn = sqlite3.connect(db_path)
+    try:
+        assert not aggregates.is_materialised(conn)
+        assert conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'agg!_%' ESCAPE '!'").fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,51 @@
+"""/api/v1: parameter validation and the 'Unassigned' region / economy bucket."""
+
+import pytest
+
+
+@pytest.mark.parametrize('url', [
+    '/api/v1/coverage?year=abc',
+    '/api/v1/coverage?limit=-1',
+    '/api/v1/coverage?limit=999999',
+    '/api/v1/coverage?fields=antigen,nope',
+    '/api/v1/coverage?format=xml',
+    '/api/v1/improvement?start_year=2018&end_year=2020&antigen=MCV1&top_n=0',
+    '/api/v1/leaderboard/improvement?start_year=2018&antigen=MCV1',
+    '/api/v1/leaderboard/above-average?infection_type=MEA&year=next',
+])
+def test_bad_parameters_are_400(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('url', [
+    '/api/v1/country/XXX',
+    '/api/v1/leaderboard/above-average?infection_type=MEA&year=2019&country=XXX',
+])
+def test_unknown_country_is_404(client, url):
+    response = client.get(url)
+    assert response.status_code == 404
+    assert 'XXX' in response.get_json()['error']
+
+
+def test_unknown_endpoint_is_404(client):
+    assert client.get('/api/v1/nope').status_code == 404
+
+
+def test_rows_without_region_or_economy_are_unassigned(client):
+    # The shipped DB has an empty Region table
+    rows = client.get('/api/v1/coverage?year=2020&antigen=MCV1&limit=5').get_json()['data']
+    assert rows and {row['region'] for row in rows} == {'Unassigned'}
+
+    regions = client.get('/api/v1/coverage/regions?year=2020&antigen=MCV1').get_json()['data']
+    assert [row['region'] for row in regions] == ['Unassigned']
+
+    summary = client.get('/api/v1/infections/summary?year=2019&infection_type=MEA').get_json()['data']
+    phases = {row['economic_phase'] for row in summary}
+    assert phases
+    rows = client.get('/api/v1/infections?year=2019&infection_type=MEA&limit=0').get_json()['data']
+    assert {row['economic_phase'] for row in rows} == phases
+    for phase in phases:
+        filtered = client.get(f'/api/v1/infections?year=2019&infection_type=MEA&economy={phase}&limit=0')
+        assert {row['economic_phase'] for row in filtered.get_json()['data']} == {phase}
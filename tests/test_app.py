@@ -0,0 +1,19 @@
+"""Entry points: importing app.py builds nothing; the factory is found by `flask --app app`."""
+
+from flask.cli import find_best_app
+
+import app as app_module
+from app import release_connections
+
+
+def test_import_builds_no_app():
+    assert not hasattr(app_module, 'app')
+
+
+def test_flask_cli_uses_the_factory():
+    flask_app = find_best_app(app_module)
+    try:
+        assert 'db_pool' in flask_app.extensions
+        assert flask_app.cli.get_command(None, 'db') is not None
+    finally:
+        release_connections(flask_app)
@@ -0,0 +1,41 @@
+"""The optional ASGI entry point (needs asgiref)."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('asgiref')
+
+import asgi  # noqa: E402
+from app import release_connections  # noqa: E402
+
+
+def _get(application, path, query=b''):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query,
+             'root_path': '', 'headers': [], 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80)}
+    asyncio.run(application(scope, receive, send))
+    status = sent[0]['status']
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return status, body
+
+
+def test_asgi_app_serves_pages_and_api(db_path):
+    application = asgi.create_asgi_app({'DATABASE': db_path, 'DB_VERSION_CHECK_INTERVAL': 0})
+    try:
+        status, body = _get(application, '/b_level3', b'infection_type=MEA&year=2019&top_n=5')
+        assert status == 200 and b'Samoa' in body
+        status, body = _get(application, '/api/v1/coverage/regions', b'year=2020&antigen=MCV1')
+        assert status == 200 and b'Unassigned' in body
+        # b_level3's average and ranking ran on the DB executor's threads
+        assert application.wsgi_application.extensions['db_executor'].submitted >= 2
+    finally:
+        release_connections(application.wsgi_application)
@@ -0,0 +1,76 @@
+"""The numpy (columnar) backend must answer every page query exactly like the SQLite one."""
+
+import itertools
+
+import pytest
+
+import aggregates
+
+pytest.importorskip('numpy')
+
+ANTIGENS = ['MCV1', 'MCV2', 'DTPCV1', 'DTPCV3', 'RCV1']
+INF_TYPES = ['MEA', 'PER', 'RUB']
+ECONOMIES = ['High Income', 'Upper Middle Income', 'Lower Middle Income', 'Low Income']
+YEARS = [2000, 2012, 2019, 2020, 2024]
+
+QUERIES = (
+    [('a2_countries', (year, antigen)) for year, antigen in itertools.product(YEARS, ANTIGENS)]
+    + [('a2_regions', (year, antigen)) for year, antigen in itertools.product(YEARS, ANTIGENS)]
+    + [('a3_improvement', (start, end, antigen, limit))
+       for (start, end), antigen, limit in itertools.product(
+           [(2000, 2024), (2019, 2020)], ANTIGENS, [None, 1, 5, 10])]
+    + [('a2_countries_batch', ([2019, 2020], ['MCV1', 'DTPCV3']))]
+    + [('a3_coverage_series', (list(range(2015, 2021)), ['MCV1', 'RCV1']))]
+    + [('b2_detailed', (economy, inf_type, year))
+       for economy, inf_type, year in itertools.product(ECONOMIES, INF_TYPES, YEARS)]
+    + [('b2_summary', (inf_type, year)) for inf_type, year in itertools.product(INF_TYPES, YEARS)]
+    + [('b3_average', (inf_type, year)) for inf_type, year in itertools.product(INF_TYPES, YEARS)]
+    + [('b3_above_average', (inf_type, year, limit))
+       for inf_type, year, limit in itertools.product(INF_TYPES, YEARS, [None, 1, 5, 10])]
+)
+
+PAGES = [
+    '/a_level2?year=2020&antigen=MCV1',
+    '/a_level2?year=2019&year=2020&antigen=MCV1&antigen=DTPCV3',
+    '/a_level3?start_year=2000&end_year=2024&antigen=DTPCV3&top_n=50',
+    '/a_level3?start_year=2010&end_year=2020&antigen=MCV1&antigen=RCV1&every_year=1&top_n=20',
+    '/b_level2?economy=Low%20Income&infection_type=MEA&year=2019',
+    '/b_level2?economy=High%20Income&infection_type=PER&year=2024',
+    '/b_level3?infection_type=MEA&year=2019&top_n=50',
+    '/b_level3?infection_type=RUB&year=2012&top_n=7',
+]
+
+
+@pytest.fixture(params=[False, True], ids=['raw', 'materialised'])
+def backends(request, db_path, make_app):
+    if request.param:
+        aggregates.materialise(db_path)
+    app = make_app(ANALYTICS_BACKEND='numpy', ANALYTICS_BACKEND_OVERRIDE=True, HTTP_CACHE_ENABLED=False)
+    return app
+
+
+def _rows(result):
+    if isinstance(result, list):
+        return [tuple(row) for row in result]
+    return result
+
+
+def test_every_query_matches(backends):
+    app = backends
+    sqlite, numpy = (app.extensions['analytics_backends'][name] for name in ('sqlite', 'numpy'))
+    with app.extensions['db_pool'].acquire() as conn:
+        for name, args in QUERIES:
+            expected = _rows(getattr(sqlite, name)(conn, *args))
+            actual = _rows(getattr(numpy, name)(conn, *args))
+            if name == 'b3_average' and expected is not None:
+                assert actual == pytest.approx(expected), (name, args)
+            else:
+                assert actual == expected, (name, args)
+
+
+@pytest.mark.parametrize('url', PAGES)
+def test_pages_match(backends, url):
+    client = backends.test_client()
+    pages = [client.get(url, headers={'X-Analytics-Backend': name}) for name in ('sqlite', 'numpy')]
+    assert [page.status_code for page in pages] == [200, 200]
+    assert pages[0].data == pages[1].data
@@ -0,0 +1,20 @@
+"""benchmark.py's synthetic database generator."""
+
+import sqlite3
+
+import benchmark
+
+
+def test_synthetic_coverage_stays_within_0_and_100(db_path, tmp_path):
+    target = str(tmp_path / 'big.db')
+    counts = benchmark.generate_synthetic_db(db_path, target, scale=3, seed=1)
+    conn = sqlite3.connect(target)
+    try:
+        assert counts['Vaccination'] == 3 * conn.execute(
+            "SELECT COUNT(*) FROM Vaccination WHERE length(country) = 3").fetchone()[0]
+        low, high = conn.execute(
+            "SELECT MIN(coverage), MAX(coverage) FROM Vaccination "
+            "WHERE length(country) > 3 AND typeof(coverage) IN ('integer', 'real')").fetchone()
+    finally:
+        conn.close()
+    assert 0 <= low and high <= 100
@@ -0,0 +1,77 @@
+"""Comparison mode: pivoting batch rows into country x (antigen, year) matrices."""
+
+from collections import namedtuple
+
+import comparison
+
+BatchRow = namedtuple('BatchRow', ('antigen', 'year', 'country_code', 'country_name', 'region', 'coverage'))
+SeriesRow = namedtuple('SeriesRow', ('country_code', 'country_name', 'antigen', 'year', 'coverage'))
+
+
+def test_selected_and_year_range_follow_reference_data():
+    assert comparison.selected(['DTPCV3', 'MCV1', 'MCV1', 'NOPE', ''], ['MCV1', 'MCV2', 'DTPCV3']) \
+        == ['MCV1', 'DTPCV3']
+    assert comparison.year_range('2018', 2020, [2017, 2018, 2020, 2021]) == [2018, 2020]
+    assert comparison.year_range('abc', 2020, [2020]) == []
+
+
+def test_coverage_matrix_leaves_missing_cells_empty():
+    rows = [
+        BatchRow('MCV1', 2019, 'AAA', 'Aland', 'North', 95.0),
+        BatchRow('MCV1', 2020, 'AAA', 'Aland', 'North', 97.0),
+        BatchRow('DTPCV3', 2020, 'AAA', 'Aland', 'North', 91.0),
+        BatchRow('DTPCV3', 2019, 'BBB', 'Borduria', 'North', 92.0),
+        BatchRow('MCV1', 2020, 'CCC', 'Carpania', 'Unassigned', 99.0),
+        BatchRow('RCV1', 2020, 'CCC', 'Carpania', 'Unassigned', 99.0),  # not a selected column
+    ]
+    matrix = comparison.coverage_matrix(rows, [2019, 2020], ['MCV1', 'DTPCV3'])
+
+    assert matrix.columns == [('MCV1', 2019), ('MCV1', 2020), ('DTPCV3', 2019), ('DTPCV3', 2020)]
+    # Most columns meeting the target first, then by name
+    assert [(row.country_code, row.values) for row in matrix.rows] == [
+        ('AAA', [95.0, 97.0, None, 91.0]),
+        ('BBB', [None, None, 92.0, None]),
+        ('CCC', [None, 99.0, None, None]),
+    ]
+    assert [tuple(region) for region in matrix.regions] == [
+        ('North', [1, 1, 1, 1]),
+        ('Unassigned', [0, 1, 0, 0]),
+    ]
+
+
+def test_improvement_matrix_ranks_by_biggest_increase():
+    rows = [
+        SeriesRow('AAA', 'Aland', 'MCV1', 2018, 80.0),
+        SeriesRow('AAA', 'Aland', 'MCV1', 2020, 85.0),
+        SeriesRow('AAA', 'Aland', 'DTPCV3', 2018, 60.0),
+        SeriesRow('AAA', 'Aland', 'DTPCV3', 2020, 50.0),   # a fall doesn't count
+        SeriesRow('BBB', 'Borduria', 'MCV1', 2018, 40.0),
+        SeriesRow('BBB', 'Borduria', 'MCV1', 2019, 55.0),
+        SeriesRow('BBB', 'Borduria', 'MCV1', 2020, 70.0),
+        SeriesRow('CCC', 'Carpania', 'MCV1', 2020, 99.0),  # no start year: not ranked
+        SeriesRow('DDD', 'Dorado', 'DTPCV3', 2018, 10.0),
+        SeriesRow('DDD', 'Dorado', 'DTPCV3', 2020, 15.0),
+    ]
+    matrix = comparison.improvement_matrix(rows, [2018, 2019, 2020], ['MCV1', 'DTPCV3'], 10)
+
+    assert [row.country_code for row in matrix.rows] == ['BBB', 'AAA', 'DDD']
+    borduria, aland, dorado = matrix.rows
+    assert borduria.values == [[40.0, 55.0, 70.0], [None, None, None]]
+    assert borduria.increases == [30.0, None]
+    assert aland.values == [[80.0, None, 85.0], [60.0, None, 50.0]]
+    assert aland.increases == [5.0, None]
+    # Dorado and Aland both improved by 5; ties go by name
+    assert dorado.increases == [None, 5.0]
+
+    assert [row.country_code for row in
+            comparison.improvement_matrix(rows, [2018, 2019, 2020], ['MCV1', 'DTPCV3'], 1).rows] == ['BBB']
+    assert comparison.improvement_matrix(rows, [], ['MCV1'], 10).rows == []
+
+
+def test_comparison_pages_render_matrices(client):
+    page = client.get('/a_level2?year=2019&year=2020&antigen=MCV1&antigen=DTPCV3')
+    assert page.status_code == 200 and b'Unassigned' in page.data
+
+    too_many = '&'.join(f'antigen={a}' for a in ['MCV1', 'MCV2', 'DTPCV1', 'DTPCV3', 'RCV1'])
+    page = client.get(f'/a_level3?start_year=2000&end_year=2024&every_year=1&{too_many}')
+    assert b'Too many antigens x years selected' in page.data
@@ -0,0 +1,64 @@
+"""Country profiles: the per-country index, its pages and API."""
+
+import sqlite3
+
+from country_index import CoveragePoint, CoverageSeries, pivot
+
+
+def test_lookup_is_case_insensitive(make_app, db_path):
+    index = make_app().extensions['country_index']
+    profile = index.get('afg')
+    assert profile is index.get('AFG')
+    assert (profile.country_code, profile.name) == ('AFG', 'Afghanistan')
+    assert index.get('XXX') is None and index.get(None) is None
+
+    conn = sqlite3.connect(db_path)
+    try:
+        expected = conn.execute("SELECT antigen, year, coverage FROM Vaccination WHERE country = 'AFG' "
+                                "AND typeof(coverage) IN ('integer', 'real') ORDER BY antigen, year").fetchall()
+    finally:
+        conn.close()
+    assert [(series.antigen, point.year, point.coverage)
+            for series in profile.coverage for point in series.points] == expected
+
+
+def test_index_is_rebuilt_after_a_write(make_app, db_path):
+    app = make_app()
+    index = app.extensions['country_index']
+    assert index.get('AFG').name == 'Afghanistan'
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE Country SET name = 'Afghanistan (renamed)' WHERE CountryID = 'AFG'")
+    conn.close()
+    app.extensions['data_version'].check(force=True)
+    assert index.get('afg').name == 'Afghanistan (renamed)'
+    assert index.stats()['misses'] == 2
+
+
+def test_pivot_fills_missing_years():
+    keys, rows = pivot([
+        CoverageSeries('MCV1', [CoveragePoint(2019, 80.0), CoveragePoint(2020, 85.0)]),
+        CoverageSeries('RCV1', [CoveragePoint(2020, 70.0)]),
+    ])
+    assert keys == ['MCV1', 'RCV1']
+    assert [(year, [point and point.coverage for point in points]) for year, points in rows] == [
+        (2020, [85.0, 70.0]),
+        (2019, [80.0, None]),
+    ]
+
+
+def test_profile_page_and_api(client):
+    response = client.get('/country?country=afg')
+    assert response.status_code == 302 and response.location.endswith('/country/afg')
+
+    page = client.get('/country/afg')
+    assert page.status_code == 200 and b'Afghanistan' in page.data
+    missing = client.get('/country/XXX')
+    assert missing.status_code == 404 and b'No country with code &#39;XXX&#39;' in missing.data
+
+    profile = client.get('/api/v1/country/afg').get_json()
+    assert profile['country_code'] == 'AFG'
+    assert [point['year'] for point in profile['coverage']['MCV1']] == \
+        sorted(point['year'] for point in profile['coverage']['MCV1'])
+    assert client.get('/api/v1/country/XXX').status_code == 404
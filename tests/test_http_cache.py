@@ -0,0 +1,57 @@
+"""ETag / 304 handling, and that error pages are never cached or replayed compressed."""
+
+import gzip
+
+A2 = '/a_level2?year=2020&antigen=MCV1'
+
+
+def test_matching_etag_gets_304(client):
+    response = client.get(A2)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert 'max-age' in response.headers['Cache-Control']
+
+    assert client.get(A2, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(A2, headers={'If-None-Match': '"something-else"'}).status_code == 200
+
+
+def test_compressed_response_has_weak_etag_that_revalidates(client):
+    plain = client.get(A2)
+    response = client.get(A2, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+    assert response.headers['ETag'].startswith('W/')
+
+    assert client.get(A2, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    # Served again from the stored compressed body
+    again = client.get(A2, headers={'Accept-Encoding': 'gzip'})
+    assert again.data == response.data
+
+
+def test_error_page_is_not_cached_or_stored(make_app):
+    app = make_app(DB_QUERY_TIMEOUT=1e-6)
+    client = app.test_client()
+    compression = app.extensions['compression']
+
+    response = client.get(A2, headers={'Accept-Encoding': 'gzip'})
+    body = gzip.decompress(response.data) if response.headers.get('Content-Encoding') else response.data
+    assert b'timed out' in body
+    assert 'ETag' not in response.headers
+    assert 'Cache-Control' not in response.headers
+    assert compression.stats()['cached_bodies'] == 0
+
+    # Once the timeout is lifted the same URL (same DB, same ETag) gets real results
+    app.extensions['db_executor'].timeout = 10
+    response = client.get(A2, headers={'Accept-Encoding': 'gzip'})
+    body = gzip.decompress(response.data)
+    assert b'timed out' not in body
+    assert b'results-section' in body
+    assert 'ETag' in response.headers
+
+
+def test_partial_request_has_its_own_etag(client):
+    full = client.get(A2)
+    partial = client.get(A2, headers={'HX-Request': 'true'})
+    assert partial.headers['ETag'] != full.headers['ETag']
+    assert b'<html' not in partial.data
+    assert b'results-section' in partial.data
@@ -0,0 +1,75 @@
+"""flask db ingest: only the caches built from the touched partitions are dropped."""
+
+import csv
+import sqlite3
+
+import aggregates
+import ingest
+import queries
+
+KEPT = ['/a_level2?year=2019&antigen=MCV1',
+        '/a_level3?start_year=2010&end_year=2019&antigen=MCV1&top_n=5',
+        '/b_level3?infection_type=MEA&year=2020&top_n=5']
+DROPPED = ['/a_level2?year=2020&antigen=DTPCV3',
+           '/a_level3?start_year=2010&end_year=2020&antigen=DTPCV3&top_n=5']
+
+
+def _write_extract(path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['inf_type', 'antigen', 'country', 'year', 'target_num', 'doses', 'coverage'])
+        writer.writerow(['PER', 'DTPCV3', 'AFG', 2020, 1, 1, 12.5])
+        writer.writerow(['PER', 'NOPE', 'AFG', 2020, 1, 1, 12.5])
+
+
+def test_ingest_drops_only_touched_partitions(db_path, make_app, tmp_path):
+    aggregates.materialise(db_path)
+    client = make_app(HTTP_CACHE_ENABLED=False).test_client()
+    app = client.application
+    fragments, boards = app.extensions['fragment_cache'], app.extensions['leaderboards']
+    for url in KEPT + DROPPED:
+        assert client.get(url).status_code == 200
+    entries, board_count = fragments.stats()['entries'], boards.stats()['boards']
+
+    extract = str(tmp_path / 'extract.csv')
+    _write_extract(extract)
+    result = ingest.ingest(db_path, 'Vaccination', extract)
+    assert (result.rows_updated, result.rows_rejected) == (1, 1)
+    app.extensions['data_version'].check(force=True)
+    assert app.extensions['data_version'].changes == [('coverage', 'DTPCV3', 2020)]
+
+    # Two fragments and one board were built from (DTPCV3, 2020)
+    assert fragments.stats()['entries'] == entries - 2
+    assert boards.stats()['boards'] == board_count - 1
+    hits = fragments.hits
+    for url in KEPT:
+        client.get(url)
+    assert fragments.hits == hits + len(KEPT)
+    for url in DROPPED:
+        client.get(url)
+    assert fragments.hits == hits + len(KEPT)
+
+    # The ingest refreshed that partition's aggregates, which match the raw tables
+    backend = app.extensions['analytics_backends']['sqlite']
+    with app.extensions['db_pool'].acquire() as conn:
+        assert backend.aggregates_ready(conn)
+        regions = [tuple(row) for row in backend.a2_regions(conn, 2020, 'DTPCV3')]
+        assert regions == [tuple(row) for row in conn.execute(queries.A2_REGIONS, (2020, 'DTPCV3'))]
+
+
+def test_direct_write_drops_everything(db_path, make_app):
+    client = make_app(HTTP_CACHE_ENABLED=False).test_client()
+    app = client.application
+    for url in KEPT:
+        client.get(url)
+    assert app.extensions['fragment_cache'].stats()['entries']
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE Country SET name = name WHERE CountryID = 'AFG'")
+    conn.close()
+    app.extensions['data_version'].check(force=True)
+    assert app.extensions['data_version'].changes is None
+    assert app.extensions['fragment_cache'].stats()['entries'] == 0
+    assert app.extensions['leaderboards'].stats()['boards'] == 0
+    assert app.extensions['query_cache'].stats()['entries'] == 0
@@ -0,0 +1,33 @@
+"""Analysis page form handling."""
+
+import pytest
+
+
+@pytest.mark.parametrize('top_n, shown', [('abc', 10), ('', 10), ('0', 1), ('-5', 1), ('1000', 50), ('3', 3)])
+def test_top_n_is_parsed_and_clamped(client, top_n, shown):
+    response = client.get(f'/b_level3?infection_type=MEA&year=2019&top_n={top_n}')
+    assert response.status_code == 200
+    assert f'max="50" value="{shown}"'.encode() in response.data
+
+    response = client.get(f'/a_level3?start_year=2018&end_year=2020&antigen=MCV1&top_n={top_n}')
+    assert response.status_code == 200
+    assert f'max="50" value="{shown}"'.encode() in response.data
+
+
+def test_page_and_api_share_leaderboards(client):
+    boards = client.application.extensions['leaderboards']
+    page = client.get('/a_level3?start_year=2018&end_year=2020&antigen=MCV1&top_n=5')
+    assert b'<option value="2018" selected>' in page.data
+    client.get('/b_level3?infection_type=MEA&year=2019&top_n=5')
+    assert boards.stats()['boards'] == 2
+
+    client.get('/api/v1/leaderboard/improvement?start_year=2018&end_year=2020&antigen=MCV1')
+    client.get('/api/v1/leaderboard/above-average?infection_type=MEA&year=2019')
+    assert boards.stats()['boards'] == 2
+    assert boards.hits == 2
+
+
+def test_invalid_year_shows_the_form(client):
+    response = client.get('/b_level3?infection_type=MEA&year=abc')
+    assert response.status_code == 200
+    assert b'Samoa' not in response.data
@@ -0,0 +1,29 @@
+"""QueryCache: memoised query results."""
+
+from data_version import DataVersion
+from result_cache import QueryCache
+
+
+def test_none_results_are_cached(db_path):
+    version = DataVersion(db_path, check_interval=60)
+    cache = QueryCache(version)
+    calls = []
+
+    def run():
+        calls.append(1)
+        return None
+
+    try:
+        assert cache.fetch(('b_level3', 'average', 'MEA', 1900), run) is None
+        assert cache.fetch(('b_level3', 'average', 'MEA', 1900), run) is None
+        assert len(calls) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.get(('nope',)) is None
+    finally:
+        version.close()
+
+
+def test_page_without_an_average_renders(client):
+    response = client.get('/b_level3?infection_type=MEA&year=1900')
+    assert response.status_code == 200
+    assert client.application.extensions['query_cache'].stats()['entries'] == 1
@@ -0,0 +1,75 @@
+"""Columnar snapshots: cheap identity check on load, full check on verify, same answers as SQLite."""
+
+import sqlite3
+
+import pytest
+
+import snapshot
+
+np = pytest.importorskip('numpy')
+
+QUERIES = [
+    ('a2_countries', (2020, 'MCV1')),
+    ('a2_regions', (2020, 'MCV1')),
+    ('a3_improvement', (2010, 2020, 'MCV1', None)),
+    ('a2_countries_batch', ([2019, 2020], ['MCV1', 'DTPCV3'])),
+    ('a3_coverage_series', ([2018, 2019, 2020], ['MCV1'])),
+    ('b2_detailed', ('Low Income', 'MEA', 2019)),
+    ('b2_summary', ('MEA', 2019)),
+    ('b3_average', ('MEA', 2019)),
+    ('b3_above_average', ('MEA', 2019, None)),
+]
+
+
+@pytest.fixture
+def snapshot_path(db_path, tmp_path):
+    path = str(tmp_path / 'immunisation.snapshot')
+    conn = sqlite3.connect(db_path)
+    try:
+        snapshot.export(conn, db_path, path)
+    finally:
+        conn.close()
+    return path
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, (list, tuple)):
+        return [_rounded(item) for item in value]
+    return value
+
+
+def test_snapshot_backend_matches_sqlite(make_app, snapshot_path):
+    app = make_app(ANALYTICS_BACKEND='numpy', COLUMNAR_SNAPSHOT=snapshot_path)
+    backends = app.extensions['analytics_backends']
+    with app.extensions['db_pool'].acquire() as conn:
+        for name, args in QUERIES:
+            expected = getattr(backends['sqlite'], name)(conn, *args)
+            actual = getattr(backends['numpy'], name)(conn, *args)
+            assert expected, name
+            assert _rounded(actual) == _rounded(expected), name
+    assert backends['numpy'].snapshot_loads == 1
+
+
+def test_write_makes_snapshot_stale(db_path, snapshot_path):
+    snapshot.check(snapshot_path, db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE Vaccination SET coverage = 0 WHERE antigen = 'MCV1' AND year = 2020")
+    conn.close()
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.load(snapshot_path, db_path)
+
+
+def test_verify_finds_corrupt_payload(db_path, snapshot_path):
+    header, start = snapshot.check(snapshot_path, db_path)
+    with open(snapshot_path, 'r+b') as f:
+        f.seek(start + header['payload_bytes'] // 2)
+        byte = f.read(1)
+        f.seek(-1, 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    # The cheap check on load only looks at the header
+    snapshot.load(snapshot_path, db_path)
+    with pytest.raises(snapshot.SnapshotError, match='corrupt'):
+        snapshot.verify(snapshot_path, db_path)
@@ -0,0 +1,76 @@
+"""Trend endpoints: window-function deltas over a known series with a missing year."""
+
+import sqlite3
+
+import pytest
+
+# AFG's MCV1 coverage is replaced by this series; 2012 isn't reported
+SERIES = {2010: 50.0, 2011: 60.0, 2013: 55.0, 2014: 80.0}
+
+
+@pytest.fixture
+def trend_client(db_path, make_app):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        cursor = conn.execute("SELECT * FROM Vaccination WHERE country = 'AFG' AND antigen = 'MCV1' LIMIT 1")
+        columns = [col[0] for col in cursor.description]
+        template = dict(zip(columns, cursor.fetchone()))
+        conn.execute("DELETE FROM Vaccination WHERE country = 'AFG' AND antigen = 'MCV1'")
+        insert = f"INSERT INTO Vaccination ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for year, coverage in SERIES.items():
+            values = dict(template, year=year, coverage=coverage)
+            conn.execute(insert, [values[column] for column in columns])
+    conn.close()
+    return make_app().test_client()
+
+
+def _data(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def test_coverage_trend_deltas(trend_client):
+    rows = _data(trend_client, '/api/v1/coverage/trend?antigen=MCV1&country=AFG&window=3')
+    assert [(r['year'], r['coverage'], r['yoy_change'], r['rolling_avg'], r['window_gain']) for r in rows] == [
+        (2010, 50.0, None, 50.0, None),   # first year: nothing to compare with
+        (2011, 60.0, 10.0, 55.0, 10.0),
+        (2013, 55.0, None, 57.5, 5.0),    # 2012 missing: no year-over-year change
+        (2014, 80.0, 25.0, 67.5, 25.0),   # window 2011-2013
+    ]
+
+
+def test_year_filters_apply_after_the_windows(trend_client):
+    rows = _data(trend_client, '/api/v1/coverage/trend?antigen=MCV1&country=AFG&start_year=2011')
+    assert rows[0]['year'] == 2011
+    assert rows[0]['yoy_change'] == 10.0
+
+
+def test_coverage_trend_summary(trend_client):
+    summary, = _data(trend_client, '/api/v1/coverage/trend/summary?antigen=MCV1&country=AFG&window=3')
+    assert summary['first_year'] == 2010 and summary['last_year'] == 2014
+    assert summary['years_reported'] == 4
+    assert (summary['first_coverage'], summary['last_coverage'], summary['total_change']) == (50.0, 80.0, 30.0)
+    assert summary['annual_change_pct'] == pytest.approx(12.47)
+    assert (summary['largest_rise'], summary['largest_rise_year']) == (25.0, 2014)
+    assert (summary['largest_fall'], summary['largest_fall_year']) == (10.0, 2011)
+    assert (summary['best_window_gain'], summary['best_window_end_year']) == (25.0, 2014)
+
+
+def test_infection_trend_starts_with_null_change(client):
+    rows = _data(client, '/api/v1/infections/trend?infection_type=MEA&country=AFG')
+    assert rows[0]['yoy_change'] is None
+    years = [row['year'] for row in rows]
+    for previous, row in zip(rows, rows[1:]):
+        if row['year'] - previous['year'] == 1:
+            assert row['yoy_change'] == pytest.approx(row['cases_per_100k'] - previous['cases_per_100k'], abs=0.02)
+    assert years == sorted(years)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/v1/coverage/trend?country=AFG',
+    '/api/v1/coverage/trend?antigen=MCV1&window=0',
+    '/api/v1/coverage/trend?antigen=MCV1&window=26',
+])
+def test_trend_parameters_are_validated(client, url):
+    assert client.get(url).status_code == 400
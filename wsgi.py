@@ -0,0 +1,12 @@
+"""
+WSGI entry point: the app with the default settings (see DEFAULT_CONFIG
+in app.py), for servers that import an application object:
+
+    gunicorn wsgi:app
+
+Importing app.py itself builds nothing; use create_app() for other settings.
+"""
+
+from app import create_app
+
+app = create_app()